@@ -0,0 +1,108 @@
+"""File-list versions, and the last known file list of every peer.
+
+A node's file list has a manifest version, "<epoch>.<n>": the epoch is
+random per run and n counts the changes since. It is advertised in HELLO
+and sent along with every list and FILE_DELTA. The Manifest keeps a log of
+recent changes, so a peer that has version v gets just what changed
+since v instead of the whole list.
+
+The CatalogCache remembers each peer's list under its hostname (IPs change
+when a laptop roams) with the version it is at. When a peer that dropped
+off comes back, its cached list is shown right away, and if the version
+in its HELLO differs only a delta is fetched.
+"""
+from __future__ import annotations
+
+import os
+import threading
+from collections import OrderedDict
+
+from app.core.models import SharedFile
+
+LOG_SIZE = 1024  # changes a Manifest remembers; older versions get the full list
+CACHE_PEERS = 64  # peers a CatalogCache remembers
+
+
+def _order(version) -> tuple[str, int] | None:
+    epoch, dot, n = str(version).partition(".")
+    if not dot:
+        epoch, n = "", epoch  # a plain counter, from peers that predate manifests
+    return (epoch, int(n)) if n.isdigit() else None
+
+
+def is_older(version, than) -> bool:
+    """Whether file-list `version` is known to come before `than`: the same
+    run of the same peer, and an earlier change. Versions from different
+    runs are not ordered, so a restarted peer's list is never held back."""
+    a, b = _order(version), _order(than)
+    return a is not None and b is not None and a[0] == b[0] and a[1] < b[1]
+
+
+class Manifest:
+    """The version of our own file list and the changes that led to it. Thread-safe."""
+
+    def __init__(self):
+        self.epoch = os.urandom(4).hex()
+        self._n = 0
+        self._log: list[tuple[int, frozenset[str], frozenset[str]]] = []  # (n after, changed ids, removed ids)
+        self._lock = threading.Lock()
+
+    @property
+    def version(self) -> str:
+        return f"{self.epoch}.{self._n}"
+
+    def record(self, changed: list[str], removed: list[str]) -> tuple[str, str]:
+        """Log a change (ids of new or updated files, ids of removed ones);
+        returns the (old, new) versions."""
+        with self._lock:
+            base = self.version
+            self._n += 1
+            self._log.append((self._n, frozenset(changed), frozenset(removed)))
+            del self._log[:-LOG_SIZE]
+            return base, self.version
+
+    def since(self, version: str) -> tuple[set[str], set[str]] | None:
+        """(changed ids, removed ids) that bring a list at `version` up to date,
+        or None if that version is from another run or older than the log."""
+        epoch, _, n = version.partition(".")
+        with self._lock:
+            if epoch != self.epoch or not n.isdigit() or int(n) > self._n:
+                return None
+            n = int(n)
+            if n < self._n - len(self._log):
+                return None
+            changed: set[str] = set()
+            removed: set[str] = set()
+            for after, ids, gone in self._log:
+                if after <= n:
+                    continue
+                changed |= ids
+                removed -= ids
+                removed |= gone
+                changed -= gone
+            return changed, removed
+
+
+class CatalogCache:
+    """Last known file list and manifest version per peer hostname; the peer
+    stored least recently is dropped first when full."""
+
+    def __init__(self, size: int = CACHE_PEERS):
+        self._size = size
+        self._entries: OrderedDict[str, tuple[str, list[SharedFile]]] = OrderedDict()
+
+    def put(self, hostname: str, version: str, files: list[SharedFile]):
+        self._entries[hostname] = (version, files)
+        self._entries.move_to_end(hostname)
+        while len(self._entries) > self._size:
+            self._entries.popitem(last=False)
+
+    def get(self, hostname: str, ip: str) -> tuple[str, list[SharedFile]] | None:
+        """The cached (version, files) of `hostname`, its files pointed at `ip`."""
+        entry = self._entries.get(hostname)
+        if entry is None:
+            return None
+        version, files = entry
+        for f in files:
+            f.owner_ip = ip  # the peer may be back with a new address
+        return version, files
@@ -0,0 +1,138 @@
+"""Append-only chat log in SQLite, so history survives restarts.
+
+Rows are only ever inserted; their integer ids increase with arrival
+order, which is what the chat view pages by. Timestamps and sender
+hostnames are indexed for time- and peer-based lookups.
+
+Messages carry a sender id, random for every run of the app, and a
+sequence number counted from 1 within that run; (sender, seq) is unique,
+so a message that arrives twice (live and again in a catch-up sync) is
+stored once. Hostnames and the local database are not part of the key:
+a reinstall, a lost chat database or two machines with the same name
+would otherwise number from 1 again and have every message dropped as a
+duplicate. Peers from before sender ids number per hostname, which
+stands in as their sender; the oldest send no seq and are stored as NULL,
+never deduplicated.
+"""
+from __future__ import annotations
+
+import logging
+import os
+import itertools
+import sqlite3
+import threading
+
+from app.core.models import ChatMessage
+from app.core.paths import data_dir
+
+log = logging.getLogger(__name__)
+
+DB_NAME = "chat.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    timestamp REAL NOT NULL,
+    hostname TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    text TEXT NOT NULL,
+    system INTEGER NOT NULL DEFAULT 0,
+    seq INTEGER,
+    sender TEXT
+);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS messages_timestamp ON messages (timestamp);
+CREATE INDEX IF NOT EXISTS messages_hostname ON messages (hostname, timestamp);
+DROP INDEX IF EXISTS messages_seq;
+CREATE UNIQUE INDEX IF NOT EXISTS messages_sender_seq ON messages (sender, seq) WHERE seq IS NOT NULL;
+"""
+
+_COLUMNS = "id, timestamp, hostname, ip, text, system, seq, sender"
+
+
+class ChatStore:
+    """Chat history on disk. Safe to use from any thread."""
+
+    def __init__(self, path: str = ""):
+        self.path = path or os.path.join(data_dir(), DB_NAME)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        # WAL + NORMAL: an append is one small write, no fsync per message
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(messages)")}
+        if "seq" not in columns:  # a log written before sequence numbers
+            self._db.execute("ALTER TABLE messages ADD COLUMN seq INTEGER")
+        if "sender" not in columns:  # before sender ids: messages were numbered per hostname
+            self._db.execute("ALTER TABLE messages ADD COLUMN sender TEXT")
+            with self._db:
+                self._db.execute("UPDATE messages SET sender = hostname WHERE seq IS NOT NULL")
+        self._db.executescript(_INDEXES)
+        self.sender = os.urandom(8).hex()  # this run's sender id
+        self._seq = itertools.count(1)
+        log.debug("Chat history at %s", self.path)
+
+    def append(self, msg: ChatMessage) -> int | None:
+        """Store a message; returns its row id, or None if it was already stored."""
+        with self._lock, self._db:
+            cur = self._db.execute(
+                "INSERT OR IGNORE INTO messages (timestamp, hostname, ip, text, system, seq, sender)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (msg.timestamp, msg.sender_hostname, msg.sender_ip, msg.text, int(msg.system), msg.seq or None,
+                 msg.sender or None),
+            )
+        return cur.lastrowid if cur.rowcount else None
+
+    def next_seq(self) -> int:
+        """The sequence number of the next message sent in this run (as `sender`)."""
+        with self._lock:
+            return next(self._seq)
+
+    def latest_timestamp(self) -> float:
+        """Send time of the newest chat message (not system notice), 0 if none."""
+        with self._lock:
+            (last,) = self._db.execute("SELECT MAX(timestamp) FROM messages WHERE system = 0").fetchone()
+        return last or 0.0
+
+    def recent(self, since: float, limit: int) -> list[ChatMessage]:
+        """Up to `limit` of the newest chat messages sent after `since`, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_COLUMNS} FROM messages WHERE timestamp > ? AND system = 0 ORDER BY timestamp DESC LIMIT ?",
+                (since, limit),
+            ).fetchall()
+        return [_record(row)[1] for row in reversed(rows)]
+
+    def before(self, row_id: int | None, limit: int) -> list[tuple[int, ChatMessage]]:
+        """Up to `limit` messages older than `row_id` (the newest if None), oldest first."""
+        with self._lock:
+            if row_id is None:
+                rows = self._db.execute(
+                    f"SELECT {_COLUMNS} FROM messages ORDER BY id DESC LIMIT ?", (limit,),
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    f"SELECT {_COLUMNS} FROM messages WHERE id < ? ORDER BY id DESC LIMIT ?", (row_id, limit),
+                ).fetchall()
+        return [_record(row) for row in reversed(rows)]
+
+    def after(self, row_id: int, limit: int) -> list[tuple[int, ChatMessage]]:
+        """Up to `limit` messages newer than `row_id`, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_COLUMNS} FROM messages WHERE id > ? ORDER BY id LIMIT ?", (row_id, limit),
+            ).fetchall()
+        return [_record(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def _record(row: tuple) -> tuple[int, ChatMessage]:
+    row_id, timestamp, hostname, ip, text, system, seq, sender = row
+    return row_id, ChatMessage(sender_hostname=hostname, sender_ip=ip, text=text, timestamp=timestamp,
+                               system=bool(system), seq=seq or 0, sender=sender or "")
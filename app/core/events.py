@@ -0,0 +1,30 @@
+"""Minimal callback events used by the Qt-free networking core."""
+from __future__ import annotations
+
+import threading
+from typing import Callable
+
+
+class Event:
+    """A list of callbacks, modelled on Qt's Signal connect/emit API.
+
+    Callbacks run synchronously on the emitting thread, so GUI code should
+    go through the Qt adapters in app.ui.qt_bridge instead of connecting
+    widgets directly.
+    """
+
+    def __init__(self):
+        self._callbacks: list[Callable] = []
+        self._lock = threading.Lock()
+
+    def connect(self, callback: Callable):
+        with self._lock:
+            self._callbacks = self._callbacks + [callback]
+
+    def disconnect(self, callback: Callable):
+        with self._lock:
+            self._callbacks = [cb for cb in self._callbacks if cb != callback]
+
+    def emit(self, *args):
+        for callback in self._callbacks:
+            callback(*args)
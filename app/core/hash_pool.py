@@ -0,0 +1,264 @@
+"""Background hashing of shared files.
+
+Newly shared files are queued here instead of being hashed on the GUI
+thread or on the first request for them. Workers run in parallel (hashlib
+releases the GIL on large buffers), but at most PER_DEVICE of them read
+from one disk at a time, so a folder on a spinning disk is not read with
+seeks between many files. Files a peer is waiting for jump the queue.
+
+Files are pre-hashed with the first of preferred_algorithms(); a peer
+that negotiates a different one (or an old peer that needs SHA-256) gets
+that digest computed on demand and cached alongside.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import logging
+import os
+import threading
+import time
+
+from app.core.events import Event
+from app.core.hashing import HashCancelled, hash_file, preferred_algorithms
+from app.core.models import SharedFile
+
+log = logging.getLogger(__name__)
+
+URGENT = 0  # a peer is waiting for the digest
+NORMAL = 1
+
+PER_DEVICE = 2  # concurrent readers per filesystem device
+MAX_WORKERS = 8
+PROGRESS_INTERVAL = 0.1  # seconds between progress events
+
+
+class _Job:
+    def __init__(self, sf: SharedFile, algorithm: str, priority: int, device: int, size: int):
+        self.sf = sf
+        self.algorithm = algorithm
+        self.key = (sf.file_id, algorithm)
+        self.priority = priority
+        self.device = device
+        self.size = size
+        self.hashed = 0  # bytes hashed so far
+        self.running = False
+        self.cancel = threading.Event()
+        self.done = threading.Event()
+        self.digest = b""
+
+
+class HashPool:
+    """Hashes SharedFiles on worker threads and caches the result on them."""
+
+    def __init__(self, workers: int = 0):
+        self.progress = Event()  # files_done, files_total, bytes_done, bytes_total
+        self.finished = Event()  # file_id, algorithm, digest
+        self.failed = Event()  # file_id, error_message
+        self._max_workers = workers or min(MAX_WORKERS, os.cpu_count() or 2)
+        self._threads: list[threading.Thread] = []
+        self._cond = threading.Condition()
+        self._queue: list[tuple[int, int, tuple[str, str]]] = []  # heap of (priority, seq, key); stale entries are skipped
+        self._jobs: dict[tuple[str, str], _Job] = {}  # (file_id, algorithm) -> queued or running job
+        self._busy: dict[int, int] = {}  # device -> running jobs
+        self._seq = itertools.count()
+        self._running = True
+        # totals for the current batch; reset once the pool drains
+        self._files_done = self._files_total = 0
+        self._bytes_done = self._bytes_total = 0
+        self._last_progress = 0.0
+
+    # ── Submitting ────────────────────────────────────────────
+
+    def submit(self, files: list[SharedFile], priority: int = NORMAL, algorithm: str = ""):
+        """Queue files whose cached digest is missing or stale; `algorithm`
+        defaults to the one offered first to peers."""
+        algorithm = algorithm or preferred_algorithms()[0]
+        added = 0
+        with self._cond:
+            for sf in files:
+                if sf.cached_digest(algorithm) is not None:
+                    continue
+                job = self._jobs.get((sf.file_id, algorithm))
+                if job is not None:
+                    self._bump(job, priority)
+                    continue
+                try:
+                    st = os.stat(sf.file_path)
+                except OSError as e:
+                    log.warning("Cannot hash %s: %s", sf.file_path, e)
+                    continue
+                job = _Job(sf, algorithm, priority, st.st_dev, st.st_size)
+                self._jobs[job.key] = job
+                heapq.heappush(self._queue, (priority, next(self._seq), job.key))
+                self._files_total += 1
+                self._bytes_total += job.size
+                added += 1
+            if added:
+                self._spawn_workers()
+                self._cond.notify_all()
+        if added:
+            self._emit_progress(force=True)
+
+    def cancel(self, file_id: str):
+        """Drop a queued file or abort it mid-hash, e.g. when it is unshared."""
+        with self._cond:
+            jobs = [job for key, job in self._jobs.items() if key[0] == file_id]
+            queued = [job for job in jobs if not job.running]
+            for job in jobs:
+                job.cancel.set()
+            for job in queued:
+                self._retire(job)
+        # running jobs retire themselves once hash_file notices
+        for job in queued:
+            job.done.set()
+        if queued:
+            self._emit_progress(force=True)
+
+    def digest(self, sf: SharedFile, algorithm: str) -> bytes:
+        """The file's digest, hashing it ahead of everything else if needed.
+
+        Blocks the calling (transfer) thread. Falls back to hashing inline if
+        the pool job is cancelled or fails, so a requester always gets an answer.
+        """
+        cached = sf.cached_digest(algorithm)
+        if cached is not None:
+            return cached
+        self.submit([sf], URGENT, algorithm)
+        with self._cond:
+            job = self._jobs.get((sf.file_id, algorithm))
+        if job is not None:
+            job.done.wait()
+            if job.digest:
+                return job.digest
+        cached = sf.cached_digest(algorithm)
+        return cached if cached is not None else hash_file(sf.file_path, algorithm)
+
+    def _bump(self, job: _Job, priority: int):
+        if priority < job.priority and not job.running:
+            job.priority = priority
+            heapq.heappush(self._queue, (priority, next(self._seq), job.key))
+
+    # ── Workers ───────────────────────────────────────────────
+
+    def _spawn_workers(self):
+        # called with the lock held; threads are only started once there is work
+        while len(self._threads) < self._max_workers:
+            t = threading.Thread(target=self._worker, name=f"HashPool-{len(self._threads)}", daemon=True)
+            self._threads.append(t)
+            t.start()
+
+    def _next_job(self) -> _Job | None:
+        """Pop the most urgent runnable job whose disk has a free reader slot."""
+        deferred = []
+        found = None
+        while self._queue:
+            entry = heapq.heappop(self._queue)
+            priority, _, key = entry
+            job = self._jobs.get(key)
+            if job is None or job.running or priority != job.priority:
+                continue  # finished, cancelled, or superseded by a bump
+            if self._busy.get(job.device, 0) >= PER_DEVICE:
+                deferred.append(entry)
+                continue
+            found = job
+            break
+        for entry in deferred:
+            heapq.heappush(self._queue, entry)
+        return found
+
+    def _worker(self):
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    if not self._running:
+                        return
+                    self._cond.wait()
+                    job = self._next_job()
+                job.running = True
+                self._busy[job.device] = self._busy.get(job.device, 0) + 1
+            self._run(job)
+
+    def _run(self, job: _Job):
+        sf = job.sf
+        error = ""
+        try:
+            st = os.stat(sf.file_path)
+            # only the bytes present at the stat, so a file that grows meanwhile
+            # still gets a digest that matches digest_stat
+            digest = hash_file(
+                sf.file_path, job.algorithm, progress=lambda n: self._advance(job, n), cancel=job.cancel,
+                length=st.st_size,
+            )
+        except HashCancelled:
+            digest = b""
+        except OSError as e:
+            digest = b""
+            error = str(e)
+        else:
+            # stat from before hashing, so a write during hashing leaves the digest stale
+            sf.store_digest(job.algorithm, digest, (st.st_size, st.st_mtime_ns))
+            job.digest = digest
+
+        with self._cond:
+            self._busy[job.device] -= 1
+            if job.cancel.is_set():
+                self._retire(job)
+            else:
+                self._jobs.pop(job.key, None)
+                self._files_done += 1
+                self._bytes_done += job.size - job.hashed  # count skipped or unhashed tail bytes too
+                self._reset_if_idle()
+            idle = not self._jobs
+            self._cond.notify_all()
+        job.done.set()
+
+        if job.digest:
+            self.finished.emit(sf.file_id, job.algorithm, job.digest)
+        elif error:
+            log.warning("Hashing %s failed: %s", sf.file_path, error)
+            self.failed.emit(sf.file_id, error)
+        # rate-limited like byte progress: thousands of small files would otherwise
+        # queue one GUI update each; the final (idle) state always goes out
+        self._emit_progress(force=idle)
+
+    def _advance(self, job: _Job, n: int):
+        job.hashed += n
+        with self._cond:
+            self._bytes_done += n
+        self._emit_progress()
+
+    def _retire(self, job: _Job):
+        # called with the lock held: forget a cancelled job and its share of the totals
+        self._jobs.pop(job.key, None)
+        self._files_total -= 1
+        self._bytes_total -= job.size
+        self._bytes_done -= job.hashed
+        self._reset_if_idle()
+
+    def _reset_if_idle(self):
+        if not self._jobs:
+            self._files_done = self._files_total = 0
+            self._bytes_done = self._bytes_total = 0
+
+    def _emit_progress(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_progress < PROGRESS_INTERVAL:
+            return
+        self._last_progress = now
+        with self._cond:
+            args = (self._files_done, self._files_total, self._bytes_done, self._bytes_total)
+        self.progress.emit(*args)
+
+    # ── Lifecycle ─────────────────────────────────────────────
+
+    def stop(self):
+        """Cancel everything and let the workers exit (they are daemons, so no join)."""
+        with self._cond:
+            self._running = False
+            for job in self._jobs.values():
+                job.cancel.set()
+                if not job.running:
+                    job.done.set()  # release digest() callers waiting on queued jobs
+            self._cond.notify_all()
@@ -0,0 +1,154 @@
+"""File hashing and zero-copy file views for transfers.
+
+The app's own part files and snapshot clones, when large, are memory-mapped
+with MADV_SEQUENTIAL, so the kernel reads ahead aggressively and drops
+pages behind us, and hashlib (which releases the GIL) consumes memoryview
+slices of the mapping without a copy into Python bytes. Small ones go
+through a readinto() loop, where a mapping's setup cost would dominate.
+
+Nothing else is mapped: a mapped file that is truncated while in use
+raises SIGBUS on access, which kills the process. Shared files belong to
+the user, who may rewrite them at any time; they are always read with
+readinto() and sent with sendfile().
+
+Integrity hashes are looked up by name in ALGORITHMS, which peers negotiate
+per transfer. SHA-256 is always available since older peers only speak it;
+which of the others is fastest depends on the CPU (SHA-NI makes SHA-256
+beat BLAKE2b, older CPUs are the other way round), so preferred_algorithms()
+measures once and orders them for this machine. Each has a Merkle tree
+variant (see app.core.merkle), offered first because it lets a download
+verify and repair single blocks.
+"""
+from __future__ import annotations
+
+import contextlib
+import functools
+import hashlib
+import mmap
+import os
+import threading
+import time
+from typing import BinaryIO, Callable, Iterator
+
+from app.core.merkle import TREE_SUFFIX, TreeHash, is_tree
+
+HASH_CHUNK_SIZE = 1024 * 1024  # slice size fed to the hash; independent of the link
+MMAP_THRESHOLD = 16 * 1024 * 1024  # smaller files are read, not mapped
+CALIBRATION_BYTES = 8 * 1024 * 1024  # hashed per algorithm by preferred_algorithms()
+
+LEGACY_ALGORITHM = "sha256"  # implied by the original transfer header
+SAMPLE_BYTES = 64 * 1024  # read from the start, middle and end of a file by sample_id()
+
+# name -> factory returning a fresh hashlib-style object (update()/digest())
+ALGORITHMS: dict[str, Callable] = {
+    "sha256": hashlib.sha256,
+    "blake2b-256": lambda: hashlib.blake2b(digest_size=32),
+}
+ALGORITHMS.update({name + TREE_SUFFIX: functools.partial(TreeHash, base) for name, base in list(ALGORITHMS.items())})
+
+_preferred: list[str] | None = None
+_preferred_lock = threading.Lock()
+
+
+class HashCancelled(Exception):
+    """Raised by hash_file when its `cancel` event is set."""
+
+
+def register_algorithm(name: str, factory: Callable):
+    """Make another hash (e.g. a tree-hash wrapper) available for negotiation."""
+    global _preferred
+    ALGORITHMS[name] = factory
+    _preferred = None
+
+
+def preferred_algorithms() -> list[str]:
+    """Supported algorithms in the order to offer them: tree hashes first,
+    then fastest on this machine first (measured once)."""
+    global _preferred
+    with _preferred_lock:
+        if _preferred is None:
+            sample = os.urandom(CALIBRATION_BYTES)
+            speed = {}
+            for name, factory in ALGORITHMS.items():
+                h = factory()
+                start = time.perf_counter()
+                h.update(sample)
+                speed[name] = time.perf_counter() - start
+            _preferred = sorted(ALGORITHMS, key=lambda name: (not is_tree(name), speed[name]))
+        return list(_preferred)
+
+
+@contextlib.contextmanager
+def mapped_view(f: BinaryIO, length: int) -> Iterator[memoryview | None]:
+    """A read-only memoryview over the first `length` bytes of `f`, or None
+    when the file is too small to be worth mapping or cannot be mapped."""
+    if length < MMAP_THRESHOLD:
+        yield None
+        return
+    try:
+        mm = mmap.mmap(f.fileno(), length, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        yield None
+        return
+    if hasattr(mm, "madvise"):  # not on Windows
+        mm.madvise(mmap.MADV_SEQUENTIAL)
+    view = memoryview(mm)
+    try:
+        yield view
+    finally:
+        view.release()
+        try:
+            mm.close()
+        except BufferError:
+            pass  # a caller still holds a slice; the mapping is freed with it
+
+
+def hash_file(path: str, algorithm: str = LEGACY_ALGORITHM, progress: Callable[[int], None] | None = None,
+              cancel: threading.Event | None = None, length: int | None = None, mapped: bool = False) -> bytes:
+    """Digest of the file at `path`, or of its first `length` bytes.
+
+    `progress` is called with the byte count of each hashed slice; setting
+    `cancel` aborts with HashCancelled at the next slice boundary. Pass
+    `mapped=True` only for a file nobody else can truncate meanwhile (see above).
+    """
+    h = ALGORITHMS[algorithm]()
+    with open(path, "rb", buffering=0) as f:
+        size = os.fstat(f.fileno()).st_size
+        if length is not None:
+            size = min(size, length)
+        with mapped_view(f, size if mapped else 0) as view:
+            if view is not None:
+                for pos in range(0, size, HASH_CHUNK_SIZE):
+                    h.update(view[pos:pos + HASH_CHUNK_SIZE])
+                    _step(min(HASH_CHUNK_SIZE, size - pos), progress, cancel)
+                return h.digest()
+        buf = bytearray(HASH_CHUNK_SIZE)
+        chunk = memoryview(buf)
+        remaining = size
+        while remaining and (n := f.readinto(chunk[:min(remaining, HASH_CHUNK_SIZE)])):
+            h.update(chunk[:n])
+            remaining -= n
+            _step(n, progress, cancel)
+    return h.digest()
+
+
+def sample_id(path: str, size: int, salt: bytes = b"") -> str:
+    """A 12-hex file id from the name, size and three SAMPLE_BYTES samples of
+    the file: the same file shared again (or after a restart) gets the same
+    id, without reading all of it. `salt` tells apart identical copies."""
+    h = hashlib.blake2b(digest_size=6, person=b"subparty-id")
+    h.update(size.to_bytes(8, "little"))
+    h.update(os.path.basename(path).encode("utf-8", "surrogateescape"))
+    h.update(salt)
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(0, size // 2 - SAMPLE_BYTES // 2), max(0, size - SAMPLE_BYTES)}):
+            f.seek(offset)
+            h.update(f.read(SAMPLE_BYTES))
+    return h.hexdigest()
+
+
+def _step(n: int, progress: Callable[[int], None] | None, cancel: threading.Event | None):
+    if progress is not None:
+        progress(n)
+    if cancel is not None and cancel.is_set():
+        raise HashCancelled()
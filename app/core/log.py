@@ -0,0 +1,80 @@
+"""Logging setup shared by the GUI and the headless node.
+
+Modules log through `logging.getLogger(__name__)`. setup() routes every
+record through a QueueHandler, so the thread that logs only formats the
+message and enqueues it; a QueueListener thread does the console and
+rotating-file I/O. Messages pass their arguments lazily (`log.debug("x %s",
+y)`), so a disabled level costs one level check on the hot paths.
+
+The level comes from the `level` argument, else SUBPARTY_LOG_LEVEL, else INFO.
+"""
+from __future__ import annotations
+
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+from app.core import metrics
+from app.core.paths import log_dir
+
+ENV_VAR = "SUBPARTY_LOG_LEVEL"
+LOG_FILE = "subparty.log"
+MAX_BYTES = 5 * 1024 * 1024
+BACKUP_COUNT = 3
+FORMAT = "%(asctime)s %(levelname)-7s [%(threadName)s] %(name)s: %(message)s"
+
+_listener: logging.handlers.QueueListener | None = None
+
+
+def setup(level: str | int | None = None, log_file: bool = True) -> logging.handlers.QueueListener:
+    """Configure the root logger and start the listener thread; safe to call twice."""
+    global _listener
+    if _listener is not None:
+        return _listener
+
+    level = level or os.environ.get(ENV_VAR) or logging.INFO
+    if isinstance(level, str):
+        level = logging.getLevelName(level.upper())
+        if not isinstance(level, int):
+            level = logging.INFO
+    formatter = logging.Formatter(FORMAT)
+
+    handlers: list[logging.Handler] = []
+    # frozen Windows GUI builds have no console, so sys.stderr is None there
+    if sys.stderr is not None:
+        console = logging.StreamHandler(sys.stderr)
+        console.setFormatter(formatter)
+        handlers.append(console)
+    if log_file:
+        try:
+            rotating = logging.handlers.RotatingFileHandler(
+                os.path.join(log_dir(), LOG_FILE),
+                maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT, encoding="utf-8",
+            )
+        except OSError as e:
+            logging.getLogger(__name__).warning("File logging disabled: %s", e)
+        else:
+            rotating.setFormatter(formatter)
+            handlers.append(rotating)
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    metrics.gauge("subparty_log_queue_depth", "Log records waiting for the writer thread", log_queue.qsize)
+    root = logging.getLogger()
+    root.setLevel(level)
+    for handler in root.handlers[:]:
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    return _listener
+
+
+def shutdown():
+    """Flush queued records and stop the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,210 @@
+"""Merkle tree hashes for block-level verification of transfers.
+
+A file is split into LEAF_SIZE leaves, hashed as H(0x00 || data), and
+pairs of nodes are combined as H(0x01 || left || right). A node without a
+partner at the end of a level is promoted unchanged, so the tree over any
+run of leaves equals the right fold of its power-of-two subtrees.
+
+The "digest" of a tree algorithm is not the root but one layer of the
+tree: the level whose nodes each cover block_size(size) bytes, chosen so
+a file has at most MAX_BLOCKS of them. A downloader checks each block
+against its node independently (in parallel, in any order, while the
+rest is still arriving) and only fetches bad blocks again; the layer
+itself is as good as the root for comparing whole files.
+"""
+from __future__ import annotations
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+LEAF_SIZE = 1024 * 1024
+MAX_BLOCKS = 4096  # nodes in the digest layer; 16 MiB blocks for a 50 GB file
+TREE_SUFFIX = "-tree"
+
+_LEAF = b"\x00"
+_NODE = b"\x01"
+
+
+def is_tree(algorithm: str) -> bool:
+    return algorithm.endswith(TREE_SUFFIX)
+
+
+def _level(leaves: int) -> int:
+    """Tree level of the digest layer for a file of `leaves` leaves."""
+    level = 0
+    while (leaves + (1 << level) - 1) >> level > MAX_BLOCKS:
+        level += 1
+    return level
+
+
+def block_size(size: int) -> int:
+    """Bytes covered by each node of the digest layer of a `size`-byte file."""
+    return LEAF_SIZE << _level(max(1, -(-size // LEAF_SIZE)))
+
+
+def block_count(size: int) -> int:
+    return max(1, -(-size // block_size(size)))
+
+
+class TreeHash:
+    """hashlib-style object (update/digest/copy) building a Merkle tree over
+    `base`, a factory such as hashlib.sha256.
+
+    Only complete subtrees are kept, so memory stays bounded by MAX_BLOCKS
+    nodes however large the input.
+    """
+
+    def __init__(self, base: Callable):
+        self._base = base
+        self._leaf = self._new_leaf()
+        self._fill = 0  # bytes in the current leaf
+        self._leaves = 0  # completed leaves
+        self._level = 0  # level of the nodes in self._nodes
+        self._nodes: list[bytes] = []  # complete nodes at self._level, in order
+        self._stack: list[tuple[int, bytes]] = []  # complete subtrees below self._level, largest first
+
+    def _new_leaf(self):
+        h = self._base()
+        h.update(_LEAF)
+        return h
+
+    def _node(self, left: bytes, right: bytes) -> bytes:
+        h = self._base()
+        h.update(_NODE)
+        h.update(left)
+        h.update(right)
+        return h.digest()
+
+    def update(self, data):
+        view = memoryview(data).cast("B")
+        pos = 0
+        while pos < len(view):
+            n = min(LEAF_SIZE - self._fill, len(view) - pos)
+            self._leaf.update(view[pos:pos + n])
+            self._fill += n
+            pos += n
+            if self._fill == LEAF_SIZE:
+                self._push(self._leaf.digest())
+                self._leaf = self._new_leaf()
+                self._fill = 0
+
+    def _push(self, digest: bytes):
+        self._leaves += 1
+        level = 0
+        while self._stack and self._stack[-1][0] == level:
+            digest = self._node(self._stack.pop()[1], digest)
+            level += 1
+        if level < self._level:
+            self._stack.append((level, digest))
+            return
+        self._nodes.append(digest)
+        if len(self._nodes) == 2 * MAX_BLOCKS:
+            # too many nodes for the layer we will end up sending: go up a level
+            self._nodes = [self._node(a, b) for a, b in zip(self._nodes[::2], self._nodes[1::2])]
+            self._level += 1
+
+    def _finish(self) -> tuple[list[bytes], bytes | None, int]:
+        """(complete nodes, root of the trailing partial subtree, total leaves)
+        without disturbing the running state."""
+        stack = list(self._stack)
+        leaves = self._leaves
+        if self._fill or not leaves:  # an empty input is one empty leaf
+            stack.append((0, self._leaf.digest()))
+            leaves += 1
+        partial = None
+        for _, digest in reversed(stack):
+            partial = digest if partial is None else self._node(digest, partial)
+        return list(self._nodes), partial, leaves
+
+    def layer(self) -> list[bytes]:
+        nodes, partial, leaves = self._finish()
+        if partial is not None:
+            nodes.append(partial)
+        for _ in range(self._level, _level(leaves)):
+            nodes = self._pair_up(nodes)
+        return nodes
+
+    def root(self) -> bytes:
+        nodes = self.layer()
+        while len(nodes) > 1:
+            nodes = self._pair_up(nodes)
+        return nodes[0]
+
+    def _pair_up(self, nodes: list[bytes]) -> list[bytes]:
+        """The next level up; an odd last node is promoted as is."""
+        return [self._node(*nodes[i:i + 2]) if i + 1 < len(nodes) else nodes[i] for i in range(0, len(nodes), 2)]
+
+    def digest(self) -> bytes:
+        return b"".join(self.layer())
+
+    def hexdigest(self) -> str:
+        return self.digest().hex()
+
+    def copy(self) -> TreeHash:
+        other = TreeHash.__new__(TreeHash)
+        other.__dict__.update(self.__dict__)
+        other._leaf = self._leaf.copy()
+        other._nodes = list(self._nodes)
+        other._stack = list(self._stack)
+        return other
+
+
+def split_layer(digest: bytes, size: int) -> list[bytes]:
+    """The per-block node hashes in a tree digest of a `size`-byte file."""
+    count = block_count(size)
+    width = len(digest) // count if count else 0
+    if not width or width * count != len(digest):
+        raise ValueError(f"tree digest of {len(digest)} bytes does not fit {count} blocks")
+    return [digest[i:i + width] for i in range(0, len(digest), width)]
+
+
+def block_digest(path: str, index: int, size: int, factory: Callable[[], TreeHash]) -> bytes:
+    """Node hash of block `index` of the file at `path` (`size` bytes in all)."""
+    bsize = block_size(size)
+    h = factory()
+    buf = bytearray(LEAF_SIZE)
+    chunk = memoryview(buf)
+    with open(path, "rb", buffering=0) as f:
+        f.seek(index * bsize)
+        remaining = min(bsize, size - index * bsize)
+        while remaining > 0:
+            n = f.readinto(chunk[:min(LEAF_SIZE, remaining)])
+            if not n:
+                break
+            h.update(chunk[:n])
+            remaining -= n
+    return h.root()
+
+
+class BlockVerifier:
+    """Checks blocks of a file against a tree digest on worker threads.
+
+    Blocks can be submitted in any order as soon as they are on disk;
+    hashlib releases the GIL, so they are verified in parallel.
+    """
+
+    def __init__(self, path: str, size: int, digest: bytes, factory: Callable[[], TreeHash], workers: int = 0):
+        self.path = path
+        self.size = size
+        self.block_size = block_size(size)
+        self.expected = split_layer(digest, size)
+        self._factory = factory
+        self._pool = ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 2),
+                                        thread_name_prefix="BlockVerifier")
+        self._pending = {}  # block index -> Future
+
+    def __len__(self) -> int:
+        return len(self.expected)
+
+    def submit(self, index: int):
+        self._pending[index] = self._pool.submit(block_digest, self.path, index, self.size, self._factory)
+
+    def bad_blocks(self) -> list[int]:
+        """Wait for the submitted blocks and return the indices that did not match."""
+        bad = [i for i, future in sorted(self._pending.items()) if future.result() != self.expected[i]]
+        self._pending.clear()
+        return bad
+
+    def close(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,171 @@
+"""Opt-in counters, gauges and histograms, rendered as Prometheus text.
+
+Modules declare their metrics at import time and update them unconditionally:
+
+    BYTES_SENT = metrics.counter("subparty_bytes_sent_total", "File bytes sent to peers")
+    BYTES_SENT.inc(len(chunk))
+
+Until enable() is called, Counter.inc and Histogram.observe return after
+one flag check. Callers that would need extra work to produce a value (e.g.
+perf_counter() around every disk read) should check enabled() once per
+transfer instead. Gauges of active connections are always tracked, since
+they change once per connection and must stay balanced across enable().
+"""
+from __future__ import annotations
+
+import threading
+from typing import Callable
+
+# seconds, suited to disk I/O and hashing latencies
+DEFAULT_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+
+_enabled = False
+_registry: dict[str, _Metric] = {}
+_registry_lock = threading.Lock()
+
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = on
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self._lock = threading.Lock()
+
+    def samples(self) -> list[tuple[str, str, float]]:
+        """(name, labels, value) triples for render()."""
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str):
+        super().__init__(name, help_text)
+        self.value = 0
+
+    def inc(self, n: int | float = 1):
+        if not _enabled:
+            return
+        with self._lock:
+            self.value += n
+
+    def samples(self):
+        return [(self.name, "", self.value)]
+
+
+class Gauge(_Metric):
+    """A value that goes up and down, or is read from `fn` at render time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], float] | None = None):
+        super().__init__(name, help_text)
+        self.value = 0
+        self._fn = fn
+
+    def inc(self, n: int | float = 1):
+        with self._lock:
+            self.value += n
+
+    def dec(self, n: int | float = 1):
+        with self._lock:
+            self.value -= n
+
+    def set_function(self, fn: Callable[[], float] | None):
+        self._fn = fn
+
+    def samples(self):
+        value = self.value
+        if self._fn is not None:
+            try:
+                value = self._fn()
+            except Exception:
+                value = float("nan")
+        return [(self.name, "", value)]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text)
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        if not _enabled:
+            return
+        with self._lock:
+            self.count += 1
+            self.sum += value
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    self._counts[i] += 1
+                    break
+
+    def samples(self):
+        with self._lock:
+            counts, count, total = list(self._counts), self.count, self.sum
+        out = []
+        cumulative = 0
+        for bound, n in zip(self.buckets, counts):
+            cumulative += n
+            out.append((f"{self.name}_bucket", f'le="{bound:g}"', cumulative))
+        out.append((f"{self.name}_bucket", 'le="+Inf"', count))
+        out.append((f"{self.name}_sum", "", total))
+        out.append((f"{self.name}_count", "", count))
+        return out
+
+
+def _register(metric: _Metric) -> _Metric:
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name: str, help_text: str) -> Counter:
+    return _register(Counter(name, help_text))
+
+
+def gauge(name: str, help_text: str, fn: Callable[[], float] | None = None) -> Gauge:
+    return _register(Gauge(name, help_text, fn))
+
+
+def histogram(name: str, help_text: str, buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help_text, buckets))
+
+
+def _format(value: float) -> str:
+    if isinstance(value, int):
+        return str(value)
+    if value != value:
+        return "NaN"
+    return repr(float(value))
+
+
+def render() -> str:
+    """All registered metrics in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda m: m.name)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, labels, value in metric.samples():
+            lines.append(f"{name}{{{labels}}} {_format(value)}" if labels else f"{name} {_format(value)}")
+    return "\n".join(lines) + "\n"
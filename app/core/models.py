@@ -1,7 +1,7 @@
 from __future__ import annotations
 
+import os
 import time
-import uuid
 from dataclasses import dataclass, field
 
 
@@ -13,16 +13,42 @@ class SharedFile:
     owner_ip: str
     owner_hostname: str
     file_path: str = ""  # local path, not shared over network
+    mtime_ns: int = field(default=0, repr=False, compare=False)  # local file's mtime when `size` was taken
+    # digests of the local file by algorithm, cached by HashPool for the (size, mtime_ns) in digest_stat
+    digests: dict[str, bytes] = field(default_factory=dict, repr=False, compare=False)
+    digest_stat: tuple[int, int] = field(default=(0, 0), repr=False, compare=False)
 
     @staticmethod
-    def create(filename: str, size: int, owner_ip: str, owner_hostname: str, file_path: str = "") -> SharedFile:
+    def create(filename: str, size: int, owner_ip: str, owner_hostname: str, file_path: str = "",
+               mtime_ns: int = 0) -> SharedFile:
         return SharedFile(
-            file_id=uuid.uuid4().hex[:12],
+            file_id=os.urandom(6).hex(),
             filename=filename,
             size=size,
             owner_ip=owner_ip,
             owner_hostname=owner_hostname,
             file_path=file_path,
+            mtime_ns=mtime_ns,
+        )
+
+    @staticmethod
+    def from_path(path: str, owner_ip: str, owner_hostname: str, taken=frozenset()) -> SharedFile:
+        """Share the local file at `path` under a content-derived id not in `taken`;
+        raises OSError if it cannot be read."""
+        from app.core.hashing import sample_id
+
+        st = os.stat(path)
+        file_id = sample_id(path, st.st_size)
+        if file_id in taken:  # an identical copy is already shared
+            file_id = sample_id(path, st.st_size, salt=os.path.abspath(path).encode("utf-8", "surrogateescape"))
+        return SharedFile(
+            file_id=file_id,
+            filename=os.path.basename(path),
+            size=st.st_size,
+            owner_ip=owner_ip,
+            owner_hostname=owner_hostname,
+            file_path=path,
+            mtime_ns=st.st_mtime_ns,
         )
 
     def to_dict(self) -> dict:
@@ -44,6 +70,24 @@ class SharedFile:
             owner_hostname=d["owner_hostname"],
         )
 
+    def cached_digest(self, algorithm: str) -> bytes | None:
+        """The cached digest if the local file has not changed since it was hashed."""
+        digest = self.digests.get(algorithm)
+        if not digest or not self.file_path:
+            return None
+        try:
+            st = os.stat(self.file_path)
+        except OSError:
+            return None
+        return digest if (st.st_size, st.st_mtime_ns) == self.digest_stat else None
+
+    def store_digest(self, algorithm: str, digest: bytes, stat: tuple[int, int]):
+        """Cache a digest computed for the file as it was at `stat` (size, mtime_ns)."""
+        if stat != self.digest_stat:
+            self.digests = {}
+            self.digest_stat = stat
+        self.digests[algorithm] = digest
+
     @property
     def size_display(self) -> str:
         if self.size < 1024:
@@ -56,6 +100,15 @@ class SharedFile:
             return f"{self.size / 1024 ** 3:.2f} GB"
 
 
+def apply_file_delta(files: list[SharedFile], changed: list[SharedFile], removed: list[str]) -> list[SharedFile]:
+    """A peer's file list after a FILE_DELTA: changed entries replaced in place,
+    new ones appended, removed ids dropped."""
+    gone = set(removed)
+    updates = {f.file_id: f for f in changed}
+    result = [updates.pop(f.file_id, f) for f in files if f.file_id not in gone]
+    return result + list(updates.values())
+
+
 @dataclass
 class Peer:
     hostname: str
@@ -63,6 +116,12 @@ class Peer:
     control_port: int
     last_seen: float = field(default_factory=time.time)
     shared_files: list[SharedFile] = field(default_factory=list)
+    features: list[str] = field(default_factory=list)  # protocol capabilities from HELLO
+    manifest: str = ""  # version of its file list that shared_files is at (app.core.catalog)
+    # TCP link quality from app.network.prober; reachable is None until the first probe
+    reachable: bool | None = None
+    rtt_ms: float = 0.0
+    throughput: float = 0.0  # bytes/s of the last probe sample, 0 if not sampled
 
     @property
     def is_alive(self) -> bool:
@@ -75,6 +134,21 @@ class Peer:
     def update_seen(self):
         self.last_seen = time.time()
 
+    def supports(self, feature: str) -> bool:
+        return feature in self.features
+
+    def update_link(self, reachable: bool, rtt_ms: float, throughput: float):
+        self.reachable = reachable
+        self.rtt_ms = rtt_ms
+        if throughput or not reachable:
+            self.throughput = throughput
+
+    @property
+    def link_rank(self) -> tuple:
+        """Sort key ordering download sources best first: reachable (or not yet
+        probed) before unreachable, then higher throughput, then lower latency."""
+        return self.reachable is False, -self.throughput, self.rtt_ms
+
 
 @dataclass
 class ChatMessage:
@@ -82,3 +156,6 @@ class ChatMessage:
     sender_ip: str
     text: str
     timestamp: float = field(default_factory=time.time)
+    system: bool = False  # a local notice such as "X joined", not sent by anyone
+    seq: int = 0  # sender's message counter, for deduplication; 0 from peers that predate it
+    sender: str = ""  # random id of the run that sent it; (sender, seq) identifies a message
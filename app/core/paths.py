@@ -0,0 +1,33 @@
+"""Per-user locations for files the app writes (logs, caches, stores)."""
+from __future__ import annotations
+
+import os
+import sys
+
+APP_DIR_NAME = "SubParty"
+ENV_VAR = "SUBPARTY_DATA_DIR"  # overrides the platform default, e.g. for a second instance
+
+
+def data_dir() -> str:
+    """The app's data directory, created if missing.
+
+    %LOCALAPPDATA%/SubParty on Windows, ~/Library/Application Support/SubParty
+    on macOS and $XDG_DATA_HOME/SubParty (~/.local/share) elsewhere.
+    """
+    path = os.environ.get(ENV_VAR)
+    if not path:
+        if sys.platform == "win32":
+            base = os.environ.get("LOCALAPPDATA") or os.path.expanduser("~")
+        elif sys.platform == "darwin":
+            base = os.path.expanduser("~/Library/Application Support")
+        else:
+            base = os.environ.get("XDG_DATA_HOME") or os.path.expanduser("~/.local/share")
+        path = os.path.join(base, APP_DIR_NAME)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def log_dir() -> str:
+    path = os.path.join(data_dir(), "logs")
+    os.makedirs(path, exist_ok=True)
+    return path
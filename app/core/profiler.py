@@ -0,0 +1,59 @@
+"""On-demand cProfile capture for diagnosing slow transfers.
+
+On Python 3.12+ a single cProfile.Profile records every thread, so one
+capture covers the GUI thread and all network workers. stop() writes the
+raw stats to the data directory (open them with `python -m pstats` or
+snakeviz) and returns a cumulative-time summary.
+"""
+from __future__ import annotations
+
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+
+from app.core.paths import data_dir
+
+SUMMARY_LINES = 40
+
+_profile: cProfile.Profile | None = None
+_lock = threading.Lock()
+
+
+def running() -> bool:
+    return _profile is not None
+
+
+def start():
+    """Begin a capture. Raises RuntimeError if one is running or another profiler is active."""
+    global _profile
+    with _lock:
+        if _profile is not None:
+            raise RuntimeError("A profile capture is already running")
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError as e:  # e.g. a debugger or coverage tool holds the profiling hook
+            raise RuntimeError(str(e)) from e
+        _profile = profile
+
+
+def stop() -> tuple[str, str]:
+    """End the capture; returns (path of the .prof file, text summary)."""
+    global _profile
+    with _lock:
+        profile, _profile = _profile, None
+    if profile is None:
+        raise RuntimeError("No profile capture is running")
+    profile.disable()
+
+    directory = os.path.join(data_dir(), "profiles")
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime("profile-%Y%m%d-%H%M%S.prof"))
+    profile.dump_stats(path)
+
+    out = io.StringIO()
+    pstats.Stats(profile, stream=out).sort_stats("cumulative").print_stats(SUMMARY_LINES)
+    return path, out.getvalue()
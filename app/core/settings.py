@@ -25,3 +25,75 @@ class AppSettings:
     @theme.setter
     def theme(self, value: str):
         self._settings.setValue("theme", value)
+
+    # bandwidth limits in KB/s, 0 = unlimited
+
+    @property
+    def upload_limit_kbps(self) -> int:
+        return int(self._settings.value("upload_limit_kbps", 0))
+
+    @upload_limit_kbps.setter
+    def upload_limit_kbps(self, value: int):
+        self._settings.setValue("upload_limit_kbps", int(value))
+
+    @property
+    def download_limit_kbps(self) -> int:
+        return int(self._settings.value("download_limit_kbps", 0))
+
+    @download_limit_kbps.setter
+    def download_limit_kbps(self, value: int):
+        self._settings.setValue("download_limit_kbps", int(value))
+
+    @property
+    def per_peer_limit_kbps(self) -> int:
+        return int(self._settings.value("per_peer_limit_kbps", 0))
+
+    @per_peer_limit_kbps.setter
+    def per_peer_limit_kbps(self, value: int):
+        self._settings.setValue("per_peer_limit_kbps", int(value))
+
+    # transfer tuning overrides in KB, 0 = adaptive
+
+    @property
+    def chunk_size_kb(self) -> int:
+        return int(self._settings.value("chunk_size_kb", 0))
+
+    @chunk_size_kb.setter
+    def chunk_size_kb(self, value: int):
+        self._settings.setValue("chunk_size_kb", int(value))
+
+    @property
+    def socket_buffer_kb(self) -> int:
+        return int(self._settings.value("socket_buffer_kb", 0))
+
+    @socket_buffer_kb.setter
+    def socket_buffer_kb(self, value: int):
+        self._settings.setValue("socket_buffer_kb", int(value))
+
+    @property
+    def fsync_policy(self) -> str:
+        """When downloads are fsynced; one of app.core.staging.FSYNC_POLICIES."""
+        return self._settings.value("fsync_policy", "final")
+
+    @fsync_policy.setter
+    def fsync_policy(self, value: str):
+        self._settings.setValue("fsync_policy", value)
+
+    @property
+    def snapshot_mode(self) -> str:
+        """How files being written are served; one of app.core.snapshot.SNAPSHOT_MODES."""
+        return self._settings.value("snapshot_mode", "frozen")
+
+    @snapshot_mode.setter
+    def snapshot_mode(self, value: str):
+        self._settings.setValue("snapshot_mode", value)
+
+    # loopback diagnostics endpoint, 0 = off
+
+    @property
+    def metrics_port(self) -> int:
+        return int(self._settings.value("metrics_port", 0))
+
+    @metrics_port.setter
+    def metrics_port(self, value: int):
+        self._settings.setValue("metrics_port", int(value))
@@ -0,0 +1,158 @@
+"""The share list on disk, so shares survive restarts.
+
+Every shared file is saved with its id and the digests HashPool computed
+for it (with the (size, mtime_ns) they are for), together with the shared
+directories and the files the user removed from them. Ids are
+content-derived (app.core.hashing.sample_id) and kept across restarts,
+so a peer resuming a download still finds the file under the id it has.
+
+Restoring does not re-hash anything: the saved paths are stat()ed in
+parallel (a stat is a metadata round trip, slow on network shares and
+cold disks), files that are gone are dropped, and files whose stat still
+matches keep their digests. Changed files keep their id and are re-hashed
+by the HashPool as usual, since their digest_stat no longer matches.
+
+The file is JSON, rewritten atomically (temp file + rename) at most every
+SAVE_DELAY seconds while the list changes. The GUI and the headless
+client each have their own file, since each saves only what it shares.
+"""
+from __future__ import annotations
+
+import contextlib
+import json
+import logging
+import os
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core.models import SharedFile
+from app.core.paths import data_dir
+from app.core.watcher import is_under
+
+log = logging.getLogger(__name__)
+
+FILE_NAME = "shares.json"
+HEADLESS_FILE_NAME = "shares-headless.json"
+FORMAT_VERSION = 1
+SAVE_DELAY = 2.0  # seconds between a change and the write that saves it
+STAT_WORKERS = 32  # parallel stat() calls when restoring
+
+
+def _stat(path: str) -> os.stat_result | None:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st if stat.S_ISREG(st.st_mode) else None
+
+
+class ShareStore:
+    """Loads and saves the share list. save_later() is safe to call from any thread."""
+
+    def __init__(self, path: str = ""):
+        self.path = path or os.path.join(data_dir(), FILE_NAME)
+        self._lock = threading.Lock()
+        self._timer: threading.Timer | None = None
+        self._getter = None
+
+    # ── Loading ───────────────────────────────────────────────
+
+    def restore(self, owner_ip: str, owner_hostname: str,
+                within=None) -> tuple[list[SharedFile], set[str], set[str]]:
+        """The saved (files, shared dirs, excluded files), dropping files that
+        no longer exist. `within` limits the result to those paths and what is
+        under them. Never raises; a missing or unreadable store is empty."""
+        start = time.perf_counter()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") != FORMAT_VERSION:
+                raise ValueError(f"unknown format version {data.get('version')}")
+            entries = data["files"]
+            dirs, excluded = set(data.get("dirs", [])), set(data.get("excluded", []))
+        except FileNotFoundError:
+            return [], set(), set()
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            log.warning("Ignoring unreadable share list %s: %s", self.path, e)
+            return [], set(), set()
+        if within is not None:
+            roots = [os.path.abspath(p) for p in within]
+            entries = [e for e in entries if is_under(e["path"], roots)]
+            dirs = {d for d in dirs if is_under(d, roots)}
+            excluded = {p for p in excluded if is_under(p, roots)}
+
+        with ThreadPoolExecutor(max_workers=STAT_WORKERS, thread_name_prefix="ShareStat") as pool:
+            stats = list(pool.map(_stat, [e["path"] for e in entries]))
+
+        files = []
+        for entry, st in zip(entries, stats):
+            if st is None:
+                continue
+            sf = SharedFile(
+                file_id=entry["id"],
+                filename=os.path.basename(entry["path"]),
+                size=st.st_size,
+                owner_ip=owner_ip,
+                owner_hostname=owner_hostname,
+                file_path=entry["path"],
+                mtime_ns=st.st_mtime_ns,
+            )
+            digests = entry.get("digests", {})
+            if digests:
+                sf.digests = {alg: bytes.fromhex(d) for alg, d in digests.items()}
+                sf.digest_stat = tuple(entry["digest_stat"])
+            files.append(sf)
+        dirs = {d for d in dirs if os.path.isdir(d)}
+        excluded = {p for p in excluded if is_under(p, dirs)}
+        log.info("Restored %d of %d shared files in %.0f ms",
+                 len(files), len(entries), (time.perf_counter() - start) * 1000)
+        return files, dirs, excluded
+
+    # ── Saving ────────────────────────────────────────────────
+
+    def save(self, files: list[SharedFile], dirs: set[str], excluded: set[str]):
+        data = {
+            "version": FORMAT_VERSION,
+            "dirs": sorted(dirs),
+            "excluded": sorted(excluded),
+            "files": [
+                {
+                    "id": sf.file_id,
+                    "path": sf.file_path,
+                    # a copy: HashPool workers may be adding a digest right now
+                    "digests": {alg: d.hex() for alg, d in list(sf.digests.items())},
+                    "digest_stat": list(sf.digest_stat),
+                }
+                for sf in files
+            ],
+        }
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning("Cannot save the share list: %s", e)
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+
+    def save_later(self, getter):
+        """Save `getter()` -> (files, dirs, excluded) in SAVE_DELAY seconds,
+        once for any number of calls in between."""
+        with self._lock:
+            self._getter = getter
+            if self._timer is None:
+                self._timer = threading.Timer(SAVE_DELAY, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """Save now if a save_later() is pending."""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            getter, self._getter, self._timer = self._getter, None, None
+        if getter is not None:
+            self.save(*getter())
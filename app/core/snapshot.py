@@ -0,0 +1,272 @@
+"""Stable views of shared files for serving.
+
+The transfer server sends a digest first and the data after it, and a
+download that repairs blocks reads parts of the file again minutes later.
+A file that is still being written (a growing log, a build output) would
+have changed in between, and the requester would throw the whole download
+away with a checksum mismatch.
+
+So every request is served from a Snapshot: the file's stat fingerprint
+(size, mtime_ns) when the request came in, the frozen length to serve,
+and the path to read. The digest sent is for exactly those bytes, and a
+request that names a digest (a block re-fetch) is served from the
+snapshot that digest was computed for while it is kept.
+
+Two modes:
+    frozen  read the shared file in place, but never past the frozen
+            length. Consistent for files that only grow; a file rewritten
+            in place can still fail verification.
+    clone   files modified in the last RECENT_SECONDS are first copied into
+            the data dir: a reflink (copy-on-write, so instant and free on
+            btrfs, XFS and APFS) where the filesystem has one, else a plain
+            copy up to COPY_LIMIT bytes, else frozen as above.
+
+Clones live in a directory per SnapshotManager under <data dir>/snapshots,
+next to a lock file held for as long as the manager is open, so a CLI run
+never deletes the clones a running GUI is serving. Directories whose lock
+is free were left by a process that has exited and are deleted.
+
+A fingerprint that differs from what the file list advertised is reported
+through `changed`, so the owner can tell peers about the new version.
+"""
+from __future__ import annotations
+
+import contextlib
+import itertools
+import logging
+import os
+import shutil
+import sys
+import threading
+import time
+from dataclasses import dataclass, field
+
+from app.core.events import Event
+from app.core.hashing import hash_file
+from app.core.models import SharedFile
+from app.core.paths import data_dir
+
+log = logging.getLogger(__name__)
+
+SNAPSHOT_FROZEN = "frozen"
+SNAPSHOT_CLONE = "clone"
+SNAPSHOT_MODES = (SNAPSHOT_FROZEN, SNAPSHOT_CLONE)
+
+RECENT_SECONDS = 60.0  # a file modified this recently is treated as still being written
+COPY_LIMIT = 64 * 1024 * 1024  # largest file copied when there is no reflink
+KEEP_SECONDS = 600.0  # an unused snapshot is kept this long for block re-fetches
+
+_FICLONE = 0x40049409  # linux/fs.h
+
+
+def snapshot_dir() -> str:
+    path = os.path.join(data_dir(), "snapshots")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _try_lock(f) -> bool:
+    """Lock open file `f` without blocking; False if another process holds it."""
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        return True
+    except OSError:
+        return False
+
+
+def reflink(src: str, dst: str) -> bool:
+    """Clone `src` to `dst` sharing its data blocks; False if the filesystem can't."""
+    if sys.platform == "darwin":
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.clonefile(src.encode(), dst.encode(), 0) == 0
+    if not sys.platform.startswith("linux"):
+        return False
+    import fcntl
+
+    with open(src, "rb") as s, open(dst, "wb") as d:
+        try:
+            fcntl.ioctl(d.fileno(), _FICLONE, s.fileno())
+            return True
+        except OSError:
+            pass
+    os.remove(dst)
+    return False
+
+
+@dataclass
+class Snapshot:
+    file_id: str
+    path: str  # what to read: the shared file itself, or a private clone
+    size: int  # frozen length; nothing past it is hashed or sent
+    fingerprint: tuple[int, int]  # (size, mtime_ns) of the shared file when taken
+    owned: bool = False  # path is a clone to delete with the snapshot, and the only kind safe to memory-map
+    digests: dict[str, bytes] = field(default_factory=dict)
+    users: int = 0
+    last_used: float = field(default_factory=time.monotonic)
+
+
+class SnapshotManager:
+    """Hands out snapshots of shared files and keeps them for re-fetches."""
+
+    def __init__(self, mode: str = SNAPSHOT_FROZEN):
+        self.changed = Event()  # file_id, size, mtime_ns
+        self.mode = mode
+        self._snapshots: dict[str, list[Snapshot]] = {}  # file_id -> snapshots, oldest first
+        self._lock = threading.Lock()
+        self._clone_ids = itertools.count()
+        self._clear_stale()
+        self._dir, self._dir_lock = self._claim_dir()
+
+    def acquire(self, sf: SharedFile, digest: bytes = b"") -> Snapshot:
+        """A snapshot of `sf`: the one `digest` was computed for if still kept,
+        else the newest one if the file is unchanged, else a new one.
+        Raises OSError if the file is gone. Pair with release()."""
+        with self._lock:
+            self._expire()
+            snapshots = self._snapshots.get(sf.file_id, [])
+            if digest:
+                for snap in snapshots:
+                    if digest in snap.digests.values():
+                        snap.users += 1
+                        return snap
+            st = os.stat(sf.file_path)
+            fingerprint = (st.st_size, st.st_mtime_ns)
+            if snapshots and snapshots[-1].fingerprint == fingerprint:
+                snap = snapshots[-1]
+                snap.users += 1
+                return snap
+
+        snap = self._take(sf, st)
+        snap.users = 1
+        with self._lock:
+            self._snapshots.setdefault(sf.file_id, []).append(snap)
+        if sf.mtime_ns and fingerprint != (sf.size, sf.mtime_ns):
+            log.info("%s changed on disk (%d -> %d bytes)", sf.filename, sf.size, st.st_size)
+            self.changed.emit(sf.file_id, st.st_size, st.st_mtime_ns)
+        return snap
+
+    def _take(self, sf: SharedFile, st: os.stat_result) -> Snapshot:
+        fingerprint = (st.st_size, st.st_mtime_ns)
+        recent = time.time() - st.st_mtime < RECENT_SECONDS
+        if self.mode == SNAPSHOT_CLONE and recent:
+            clone = os.path.join(self._dir, f"{sf.file_id}-{next(self._clone_ids)}")
+            try:
+                if reflink(sf.file_path, clone):
+                    how = "reflink"
+                elif st.st_size <= COPY_LIMIT:
+                    shutil.copyfile(sf.file_path, clone)
+                    how = "copy"
+                else:
+                    how = ""
+                if how:
+                    log.debug("Snapshot of %s by %s", sf.filename, how)
+                    # the clone is what is served, however much was written while copying
+                    return Snapshot(sf.file_id, clone, os.path.getsize(clone), fingerprint, owned=True)
+            except OSError as e:
+                log.warning("Cannot snapshot %s, serving it frozen: %s", sf.filename, e)
+                with contextlib.suppress(OSError):
+                    os.remove(clone)
+        return Snapshot(sf.file_id, sf.file_path, st.st_size, fingerprint)
+
+    def digest(self, snap: Snapshot, sf: SharedFile, algorithm: str, digest_getter=None) -> bytes:
+        """The snapshot's digest in `algorithm`; `digest_getter(sf, algorithm)`
+        (e.g. HashPool.digest) is used when its cached result is for this snapshot."""
+        cached = snap.digests.get(algorithm)
+        if cached is not None:
+            return cached
+        result = None
+        if digest_getter is not None and not snap.owned:
+            shared = digest_getter(sf, algorithm)
+            if sf.digest_stat == snap.fingerprint and sf.digests.get(algorithm) == shared:
+                result = shared
+        if result is None:
+            # the file moved on since it was hashed; hash just the frozen bytes
+            result = hash_file(snap.path, algorithm, length=snap.size, mapped=snap.owned)
+        with self._lock:
+            snap.digests[algorithm] = result
+        return result
+
+    def release(self, snap: Snapshot):
+        with self._lock:
+            snap.users -= 1
+            snap.last_used = time.monotonic()
+
+    def forget(self, file_id: str):
+        """Drop the snapshots of a file that is no longer shared (once unused)."""
+        with self._lock:
+            for snap in self._snapshots.get(file_id, []):
+                snap.last_used = 0.0
+            self._expire()
+
+    def _expire(self):
+        # called with the lock held
+        now = time.monotonic()
+        for file_id in list(self._snapshots):
+            kept = []
+            for snap in self._snapshots[file_id]:
+                if snap.users or now - snap.last_used < KEEP_SECONDS:
+                    kept.append(snap)
+                elif snap.owned:
+                    with contextlib.suppress(OSError):
+                        os.remove(snap.path)
+            if kept:
+                self._snapshots[file_id] = kept
+            else:
+                del self._snapshots[file_id]
+
+    @staticmethod
+    def _claim_dir():
+        # the lock is taken before the directory exists, so _clear_stale never sees it unlocked
+        root = snapshot_dir()
+        while True:
+            path = os.path.join(root, f"{os.getpid()}-{os.urandom(4).hex()}")
+            try:
+                lock = open(f"{path}.lock", "xb")
+            except FileExistsError:
+                continue
+            if not _try_lock(lock):
+                raise OSError(f"cannot lock {path}.lock")
+            os.mkdir(path)
+            return path, lock
+
+    @staticmethod
+    def _clear_stale():
+        # clone directories of processes that have exited, and loose clones from older versions
+        root = snapshot_dir()
+        for name in os.listdir(root):
+            path = os.path.join(root, name)
+            if name.endswith(".lock"):
+                continue
+            if not os.path.isdir(path):
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+                continue
+            try:
+                lock = open(f"{path}.lock", "ab")
+            except OSError:
+                continue
+            with lock:
+                if not _try_lock(lock):
+                    continue  # owner still running
+                log.debug("Removing stale snapshot directory %s", path)
+                shutil.rmtree(path, ignore_errors=True)
+            with contextlib.suppress(OSError):
+                os.remove(f"{path}.lock")
+
+    def close(self):
+        """Delete every clone and this manager's directory; call once nothing is being served."""
+        with self._lock:
+            self._snapshots.clear()
+            shutil.rmtree(self._dir, ignore_errors=True)
+            self._dir_lock.close()
+            with contextlib.suppress(OSError):
+                os.remove(f"{self._dir}.lock")
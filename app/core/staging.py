@@ -0,0 +1,175 @@
+"""Where downloads are written while in progress, and how they are finalized.
+
+A download is written to a `.part` file and moved to its final name once
+verified. The final name is reserved with O_CREAT | O_EXCL, so two
+downloads of the same filename into one folder cannot both pick it, and
+the verified file is moved over the reservation in one step.
+
+When the download folder is on a network filesystem (NFS, SMB, sshfs...),
+the many small writes of a transfer go to a local staging directory in
+the data dir instead, and finalizing is one bulk copy to the folder
+(next to the target, then renamed, so the final name never shows a
+partial file). On a local folder the part file sits next to the target
+and finalizing is a rename.
+
+The fsync policy trades durability for throughput:
+    off       leave flushing to the OS; fastest, a crash can lose a "completed" file
+    final     fsync the file and its directory before reporting completion (default)
+    periodic  also fsync every FSYNC_INTERVAL bytes, which keeps dirty pages
+              from piling up on slow disks
+"""
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import shutil
+import sys
+
+from app.core.paths import data_dir
+
+log = logging.getLogger(__name__)
+
+FSYNC_OFF = "off"
+FSYNC_FINAL = "final"
+FSYNC_PERIODIC = "periodic"
+FSYNC_POLICIES = (FSYNC_OFF, FSYNC_FINAL, FSYNC_PERIODIC)
+
+FSYNC_INTERVAL = 64 * 1024 * 1024
+MAX_RESERVE_ATTEMPTS = 10000
+
+# filesystem types (Linux /proc/self/mountinfo) where small writes are round trips
+_REMOTE_FS = {
+    "nfs", "nfs4", "cifs", "smb3", "smbfs", "ncpfs", "afs", "9p", "ceph", "glusterfs", "lustre",
+    "fuse.sshfs", "fuse.rclone", "fuse.s3fs", "fuse.gcsfuse", "davfs", "fuse.davfs2",
+}
+
+
+def staging_dir() -> str:
+    path = os.path.join(data_dir(), "staging")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def is_remote(path: str) -> bool:
+    """Best-effort check whether `path` is on a network filesystem.
+
+    Uses /proc/self/mountinfo on Linux and GetDriveTypeW (or a UNC path)
+    on Windows; elsewhere every path counts as local.
+    """
+    path = os.path.abspath(path)
+    if sys.platform == "win32":
+        if path.startswith("\\\\"):
+            return True
+        import ctypes
+
+        drive_remote = 4
+        root = os.path.splitdrive(path)[0] + "\\"
+        return ctypes.windll.kernel32.GetDriveTypeW(root) == drive_remote
+    try:
+        with open("/proc/self/mountinfo", encoding="utf-8", errors="replace") as f:
+            mounts = f.readlines()
+    except OSError:
+        return False
+    best, fstype = "", ""
+    for line in mounts:
+        # id parent major:minor root mount-point options ... - fstype source super-options
+        fields, _, tail = line.partition(" - ")
+        parts = fields.split()
+        if len(parts) < 5 or not tail:
+            continue
+        mount_point = parts[4].replace("\\040", " ")
+        if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) >= len(best):
+            best, fstype = mount_point, tail.split()[0]
+    return fstype in _REMOTE_FS
+
+
+def reserve(path: str) -> str:
+    """Atomically create an empty file at `path`, or at `name_1.ext`, `name_2.ext`...
+    if taken; returns the path that was created."""
+    base, ext = os.path.splitext(path)
+    for i in range(MAX_RESERVE_ATTEMPTS):
+        candidate = f"{base}_{i}{ext}" if i else path
+        try:
+            os.close(os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+            return candidate
+        except FileExistsError:
+            continue
+    raise FileExistsError(f"No free name for {path}")
+
+
+def _fsync_dir(path: str):
+    if sys.platform == "win32":
+        return  # directories can't be opened for fsync there; NTFS journals the rename
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class StagedDownload:
+    """The part file of one download and how it becomes the final file."""
+
+    def __init__(self, save_dir: str, filename: str, file_id: str, size: int = 0, fsync: str = FSYNC_FINAL):
+        self.save_dir = save_dir
+        self.filename = filename
+        self.fsync = fsync if fsync in FSYNC_POLICIES else FSYNC_FINAL
+        part_name = f"{filename}.{file_id}.part"  # file_id keeps same-named downloads apart
+        self.remote = is_remote(save_dir)
+        local_dir = staging_dir() if self.remote else save_dir
+        if self.remote and shutil.disk_usage(local_dir).free < size:
+            log.info("Not enough local space to stage %s, writing to %s directly", filename, save_dir)
+            local_dir = save_dir
+            self.remote = False
+        self.part_path = os.path.join(local_dir, part_name)
+        self._unsynced = 0
+
+    def wrote(self, f, nbytes: int):
+        """Call after writing `nbytes` to the part file `f`."""
+        if self.fsync != FSYNC_PERIODIC:
+            return
+        self._unsynced += nbytes
+        if self._unsynced >= FSYNC_INTERVAL:
+            f.flush()
+            os.fsync(f.fileno())
+            self._unsynced = 0
+
+    def finalize(self) -> str:
+        """Move the verified part file to a free name in save_dir; returns that path."""
+        durable = self.fsync != FSYNC_OFF
+        if durable:
+            with open(self.part_path, "rb+") as f:
+                os.fsync(f.fileno())
+        final_path = reserve(os.path.join(self.save_dir, self.filename))
+        try:
+            if self.remote:
+                # one streaming copy (sendfile where available) next to the target,
+                # then a rename on the remote side
+                copy_path = final_path + ".copy"
+                try:
+                    shutil.copyfile(self.part_path, copy_path)
+                    if durable:
+                        with open(copy_path, "rb+") as f:
+                            os.fsync(f.fileno())
+                    os.replace(copy_path, final_path)
+                except BaseException:
+                    with contextlib.suppress(OSError):
+                        os.remove(copy_path)
+                    raise
+            else:
+                os.replace(self.part_path, final_path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(final_path)
+            raise
+        if self.remote:
+            self.discard()
+        if durable:
+            _fsync_dir(self.save_dir)
+        log.debug("Finalized %s as %s", self.part_path, final_path)
+        return final_path
+
+    def discard(self):
+        with contextlib.suppress(OSError):
+            os.remove(self.part_path)
@@ -0,0 +1,106 @@
+"""Startup timing trace: milestones plus an `-X importtime`-style breakdown.
+
+Works in frozen builds (Nuitka) where `-X importtime` is not available.
+Enable it with the `--trace-startup` flag or the SUBPARTY_STARTUP_TRACE
+environment variable; set the variable to a file path to write the report
+there instead of stderr. When disabled, mark() is a no-op.
+
+    SUBPARTY_STARTUP_TRACE=1 python main.py
+"""
+from __future__ import annotations
+
+import builtins
+import os
+import sys
+import time
+
+ENV_VAR = "SUBPARTY_STARTUP_TRACE"
+FLAG = "--trace-startup"
+
+_t0 = time.perf_counter()
+_enabled = False
+_output = ""  # file path, or "" for stderr
+_milestones: list[tuple[str, float]] = []
+_imports: list[tuple[int, int, int, str]] = []  # (depth, self us, cumulative us, name) in completion order
+_stack: list[int] = []  # accumulated child time (us) of each import in progress
+_original_import = builtins.__import__
+
+
+def _timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level:
+        package = (globals or {}).get("__package__") or ""
+        try:
+            resolved = _resolve(name, package, level)
+        except ValueError:
+            resolved = name
+    else:
+        resolved = name
+    if resolved in sys.modules:
+        return _original_import(name, globals, locals, fromlist, level)
+
+    depth = len(_stack)
+    _stack.append(0)
+    start = time.perf_counter()
+    try:
+        return _original_import(name, globals, locals, fromlist, level)
+    finally:
+        cumulative = int((time.perf_counter() - start) * 1_000_000)
+        children = _stack.pop()
+        if _stack:
+            _stack[-1] += cumulative
+        if resolved in sys.modules:
+            _imports.append((depth, cumulative - children, cumulative, resolved))
+
+
+def _resolve(name: str, package: str, level: int) -> str:
+    parts = package.rsplit(".", level - 1)
+    if len(parts) < level:
+        raise ValueError("relative import beyond top-level package")
+    base = parts[0]
+    return f"{base}.{name}" if name else base
+
+
+def init(argv: list[str]):
+    """Enable tracing if requested by flag or environment; strips the flag from argv."""
+    global _enabled, _output
+    env = os.environ.get(ENV_VAR, "")
+    if FLAG in argv:
+        argv.remove(FLAG)
+    elif not env or env == "0":
+        return
+    _enabled = True
+    _output = env if env not in ("", "1") else ""
+    builtins.__import__ = _timed_import
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def mark(name: str):
+    """Record a milestone, timed from when this module was first imported."""
+    if _enabled:
+        _milestones.append((name, time.perf_counter() - _t0))
+
+
+def report():
+    """Print milestones and the import breakdown, then stop timing imports."""
+    if not _enabled:
+        return
+    builtins.__import__ = _original_import
+    lines = ["Startup milestones (ms since launch):"]
+    lines += [f"  {elapsed * 1000:9.1f}  {name}" for name, elapsed in _milestones]
+    slowest = sorted(_imports, key=lambda entry: entry[1], reverse=True)[:15]
+    lines.append("Slowest imports by self time (us):")
+    lines += [f"  {self_us:9d}  {name}" for _, self_us, _, name in slowest]
+    lines.append("import time: self [us] | cumulative | imported package")
+    lines += [
+        f"import time: {self_us:>9} | {cumulative:>10} | {'  ' * depth}{name}"
+        for depth, self_us, cumulative, name in _imports
+    ]
+    text = "\n".join(lines) + "\n"
+    if _output:
+        with open(_output, "w") as f:
+            f.write(text)
+    else:
+        sys.stderr.write(text)
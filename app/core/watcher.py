@@ -0,0 +1,370 @@
+"""Watches shared files and directories for changes.
+
+A SharedFile keeps the size it had when it was shared, so without this a
+file that is rewritten or deleted stays listed with stale metadata until
+someone's download fails. The watcher reports which paths changed; the
+owner (MainWindow, HeadlessNode) sorts them with resolve_changes(),
+updates its list, re-hashes changed files in the background and sends
+peers a FILE_DELTA.
+
+On Linux, inotify (through ctypes, no extra dependency) reports changes
+as they happen. It keeps a watch on every directory of a shared tree and
+on the parent directory of each shared file, because editors often
+replace a file by renaming a new one over it. Elsewhere, or when inotify
+is unavailable or out of watches, the watched paths are stat()ed every
+POLL_INTERVAL seconds.
+
+Changes are debounced: a path is reported once it has been quiet for
+DEBOUNCE seconds, or MAX_DELAY seconds after its first change at the
+latest, so a file that is written continuously is still re-announced now
+and then.
+"""
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import logging
+import os
+import select
+import socket
+import stat
+import struct
+import sys
+import threading
+import time
+
+from app.core.events import Event
+from app.core.models import SharedFile
+
+log = logging.getLogger(__name__)
+
+DEBOUNCE = 0.5  # seconds a path must be quiet before it is reported
+MAX_DELAY = 5.0  # report a path that keeps changing at least this often
+POLL_INTERVAL = 2.0  # seconds between scans without inotify
+
+# linux/inotify.h
+_IN_MODIFY = 0x2
+_IN_ATTRIB = 0x4
+_IN_CLOSE_WRITE = 0x8
+_IN_MOVED_FROM = 0x40
+_IN_MOVED_TO = 0x80
+_IN_CREATE = 0x100
+_IN_DELETE = 0x200
+_IN_DELETE_SELF = 0x400
+_IN_MOVE_SELF = 0x800
+_IN_Q_OVERFLOW = 0x4000
+_IN_IGNORED = 0x8000
+_IN_ONLYDIR = 0x01000000
+_IN_ISDIR = 0x40000000
+_MASK = (
+    _IN_MODIFY | _IN_ATTRIB | _IN_CLOSE_WRITE | _IN_MOVED_FROM | _IN_MOVED_TO | _IN_CREATE | _IN_DELETE
+    | _IN_DELETE_SELF | _IN_MOVE_SELF | _IN_ONLYDIR
+)
+_EVENT = struct.Struct("iIII")  # wd, mask, cookie, len; followed by the name
+
+
+def list_files(root: str) -> list[str]:
+    """Every regular file under `root`, in a stable order."""
+    files = []
+    for dirpath, dirnames, names in os.walk(root):
+        dirnames.sort()
+        files.extend(os.path.join(dirpath, n) for n in sorted(names))
+    return [f for f in files if os.path.isfile(f)]
+
+
+def resolve_changes(
+    paths: list[str], shared: list[SharedFile], dirs: set[str], excluded: set[str] = frozenset(),
+) -> tuple[list[tuple[SharedFile, os.stat_result]], list[SharedFile], list[str]]:
+    """Sort reported paths into (changed files with their new stat, files that
+    are gone, new files in shared directories not in `excluded`)."""
+    by_path = {f.file_path: f for f in shared}
+    changed: list[tuple[SharedFile, os.stat_result]] = []
+    removed: dict[str, SharedFile] = {}
+    new: list[str] = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            st = None
+        is_file = st is not None and stat.S_ISREG(st.st_mode)
+        sf = by_path.get(path)
+        if sf is not None:
+            if not is_file:
+                removed[sf.file_id] = sf
+            elif (st.st_size, st.st_mtime_ns) != (sf.size, sf.mtime_ns):
+                changed.append((sf, st))
+        elif is_file:
+            if path not in excluded and is_under(path, dirs):
+                new.append(path)
+        else:
+            # a directory that was deleted or moved away reports only itself
+            prefix = path.rstrip(os.sep) + os.sep
+            for f in shared:
+                if f.file_path.startswith(prefix) and not os.path.isfile(f.file_path):
+                    removed[f.file_id] = f
+    return changed, list(removed.values()), new
+
+
+def is_under(path: str, dirs) -> bool:
+    """Whether `path` is one of `dirs` or inside one of them."""
+    return any(path == d or path.startswith(d.rstrip(os.sep) + os.sep) for d in dirs)
+
+
+class _Inotify:
+    """Directory watches on one inotify instance."""
+
+    def __init__(self):
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            _raise_errno("inotify_init1")
+        self._paths: dict[int, str] = {}  # wd -> directory
+        self._wds: dict[str, int] = {}  # directory -> wd
+
+    @property
+    def directories(self) -> list[str]:
+        return list(self._wds)
+
+    def add(self, directory: str):
+        if directory in self._wds:
+            return
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _MASK)
+        if wd < 0:
+            _raise_errno(directory)  # ENOSPC: out of watches (fs.inotify.max_user_watches)
+        self._paths[wd] = directory
+        self._wds[directory] = wd
+
+    def add_tree(self, root: str) -> list[str]:
+        """Watch `root` and every directory below it; returns the files found,
+        which may have been written before their directory was watched."""
+        files = []
+        for dirpath, _, names in os.walk(root):
+            self.add(dirpath)
+            files.extend(os.path.join(dirpath, n) for n in names)
+        return files
+
+    def remove(self, directory: str):
+        wd = self._wds.pop(directory, None)
+        if wd is not None:
+            self._paths.pop(wd, None)
+            self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self) -> tuple[list[str], list[str], bool]:
+        """Drain pending events: (changed paths, new directories, queue overflowed)."""
+        changed, new_dirs, overflow = [], [], False
+        while True:
+            try:
+                data = os.read(self.fd, 65536)
+            except BlockingIOError:
+                break
+            pos = 0
+            while pos < len(data):
+                wd, mask, _, length = _EVENT.unpack_from(data, pos)
+                name = data[pos + _EVENT.size:pos + _EVENT.size + length].rstrip(b"\0")
+                pos += _EVENT.size + length
+                if mask & _IN_Q_OVERFLOW:
+                    overflow = True
+                    continue
+                directory = self._paths.get(wd)
+                if directory is None:
+                    continue
+                if mask & _IN_IGNORED:  # the directory is gone; the kernel dropped its watch
+                    del self._paths[wd]
+                    self._wds.pop(directory, None)
+                    continue
+                path = os.path.join(directory, os.fsdecode(name)) if name else directory
+                if mask & _IN_ISDIR and mask & (_IN_CREATE | _IN_MOVED_TO):
+                    new_dirs.append(path)
+                changed.append(path)
+        return changed, new_dirs, overflow
+
+    def close(self):
+        os.close(self.fd)
+
+
+def _raise_errno(what: str):
+    err = ctypes.get_errno()
+    raise OSError(err, os.strerror(err), what)
+
+
+class FileWatcher:
+    """Reports debounced changes under watched files and directory trees."""
+
+    def __init__(self, use_inotify: bool = True, poll_interval: float = POLL_INTERVAL):
+        self.changed = Event()  # list of paths created, modified or deleted (a moved directory is one path)
+        self._poll_interval = poll_interval
+        self._files: set[str] = set()
+        self._dirs: set[str] = set()
+        self._added: list[str] = []  # roots to set up on the watcher thread
+        self._removed = False  # roots were unwatched; prune on the watcher thread
+        self._lock = threading.Lock()
+        self._wake_r, self._wake_w = socket.socketpair()  # select() on Windows only takes sockets
+        self._inotify: _Inotify | None = None
+        if use_inotify and sys.platform.startswith("linux"):
+            try:
+                self._inotify = _Inotify()
+            except (OSError, AttributeError) as e:
+                log.info("inotify unavailable, polling for changes: %s", e)
+        self._stats: dict[str, tuple[int, int]] = {}  # path -> (size, mtime_ns), when polling
+        self._pending: dict[str, tuple[float, float]] = {}  # path -> (first, last) change time
+        self._running = False
+        self._thread = threading.Thread(target=self._run, name="FileWatcher", daemon=True)
+
+    @property
+    def polling(self) -> bool:
+        return self._inotify is None
+
+    def watch(self, path: str):
+        """Watch a file, or a directory and everything below it."""
+        path = os.path.abspath(path)
+        with self._lock:
+            (self._dirs if os.path.isdir(path) else self._files).add(path)
+            self._added.append(path)
+        self._wake()
+
+    def unwatch(self, path: str):
+        path = os.path.abspath(path)
+        with self._lock:
+            self._files.discard(path)
+            self._dirs.discard(path)
+            self._removed = True
+        self._wake()
+
+    def start(self):
+        self._running = True
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake()
+        if self._thread.ident is not None:
+            self._thread.join(2.0)
+        if self._inotify is not None:
+            self._inotify.close()
+        self._wake_r.close()
+        self._wake_w.close()
+
+    def _wake(self):
+        try:
+            self._wake_w.send(b"\0")
+        except OSError:
+            pass  # stopped
+
+    # ── Watcher thread ────────────────────────────────────────
+
+    def _run(self):
+        log.debug("Thread started (%s)", "polling" if self.polling else "inotify")
+        next_poll = time.monotonic() + self._poll_interval
+        while self._running:
+            self._setup_roots()
+            now = time.monotonic()
+            deadlines = [min(first + MAX_DELAY, last + DEBOUNCE) for first, last in self._pending.values()]
+            if self.polling:
+                deadlines.append(next_poll)
+            timeout = max(0.0, min(deadlines) - now) if deadlines else None
+            readable = [self._wake_r] + ([self._inotify.fd] if self._inotify else [])
+            ready, _, _ = select.select(readable, [], [], timeout)
+            if self._wake_r in ready:
+                self._wake_r.recv(4096)
+            if self._inotify is not None and self._inotify.fd in ready:
+                self._record(self._read_inotify())
+            elif self.polling and time.monotonic() >= next_poll:
+                self._record(self._poll())
+                next_poll = time.monotonic() + self._poll_interval
+            self._flush()
+        log.debug("Thread exiting")
+
+    def _setup_roots(self):
+        with self._lock:
+            added, self._added = self._added, []
+            removed, self._removed = self._removed, False
+        if removed:
+            self._prune()
+        for root in added:
+            if self._inotify is not None:
+                try:
+                    if os.path.isdir(root):
+                        self._inotify.add_tree(root)
+                    else:
+                        self._inotify.add(os.path.dirname(root))
+                    continue
+                except OSError as e:
+                    log.warning("inotify watch failed, falling back to polling: %s", e)
+                    self._start_polling()
+            self._stats.update(self._scan([root]))
+
+    def _start_polling(self):
+        self._inotify.close()
+        self._inotify = None
+        with self._lock:
+            roots = list(self._files | self._dirs)
+        self._stats = self._scan(roots)
+
+    def _prune(self):
+        with self._lock:
+            files, dirs = set(self._files), set(self._dirs)
+        if self._inotify is not None:
+            parents = {os.path.dirname(f) for f in files}
+            for directory in self._inotify.directories:
+                if directory not in parents and not is_under(directory, dirs):
+                    self._inotify.remove(directory)
+        else:
+            self._stats = {p: s for p, s in self._stats.items() if p in files or is_under(p, dirs)}
+
+    def _read_inotify(self) -> list[str]:
+        changed, new_dirs, overflow = self._inotify.read()
+        with self._lock:
+            files, dirs = set(self._files), set(self._dirs)
+        try:
+            for directory in new_dirs:
+                if is_under(directory, dirs):
+                    changed.extend(self._inotify.add_tree(directory))
+        except OSError as e:
+            log.warning("inotify watch failed, falling back to polling: %s", e)
+            self._start_polling()
+            overflow = True
+        if overflow:
+            # events were lost; let the owner re-check everything
+            log.info("Change queue overflowed, rescanning shared paths")
+            changed.extend(files)
+            changed.extend(p for d in dirs for p in list_files(d))
+        return [p for p in changed if p in files or is_under(p, dirs)]
+
+    def _poll(self) -> list[str]:
+        with self._lock:
+            roots = list(self._files | self._dirs)
+        current = self._scan(roots)
+        changed = [p for p in current.keys() | self._stats.keys() if current.get(p) != self._stats.get(p)]
+        self._stats = current
+        return changed
+
+    @staticmethod
+    def _scan(roots: list[str]) -> dict[str, tuple[int, int]]:
+        result = {}
+        for root in roots:
+            for path in (list_files(root) if os.path.isdir(root) else [root]):
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                result[path] = (st.st_size, st.st_mtime_ns)
+        return result
+
+    def _record(self, paths: list[str]):
+        now = time.monotonic()
+        for path in paths:
+            first, _ = self._pending.get(path, (now, now))
+            self._pending[path] = (first, now)
+
+    def _flush(self):
+        now = time.monotonic()
+        due = [
+            path for path, (first, last) in self._pending.items()
+            if now - last >= DEBOUNCE or now - first >= MAX_DELAY
+        ]
+        if not due:
+            return
+        for path in due:
+            del self._pending[path]
+        log.debug("%d paths changed", len(due))
+        self.changed.emit(sorted(due))
@@ -0,0 +1,627 @@
+"""
+Headless Sub Party node for always-on file servers and scripting.
+
+Runs discovery, the control server and the transfer server without Qt, so
+it starts quickly and works on machines with no display.
+
+Usage:
+    python main.py serve ~/artifacts/*.zip /srv/builds       # share and run until killed
+    python main.py serve --config subparty.toml
+    python main.py list                                      # print peers' files
+    python main.py get "*.iso" "build-1234*" --dest ~/Downloads
+    python main.py cat "talk.mkv" | mpv -                    # stream a file without saving it
+    python main.py cat "server.log" --offset -65536          # its last 64 KiB
+
+Config file (TOML), every key optional; command-line values win:
+    share = ["/srv/builds", "/data/image.iso"]
+    download_dir = "/srv/incoming"
+    hostname = "build-box"
+    upload_limit_kbps = 0
+    download_limit_kbps = 0
+    per_peer_limit_kbps = 0
+    chunk_size_kb = 0
+    socket_buffer_kb = 0
+    fsync = "final"           # off | final | periodic, see app.core.staging
+    snapshot = "frozen"       # frozen | clone: serving files still being written, see app.core.snapshot
+    log_level = "INFO"
+    metrics_port = 0          # serve /metrics and /profile/* on 127.0.0.1 (37719 is the usual port)
+"""
+from __future__ import annotations
+
+import argparse
+import fnmatch
+import logging
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+import tomllib
+
+from app.core import log as app_log
+from app.core.catalog import CatalogCache, Manifest, is_older
+from app.core.hash_pool import HashPool
+from app.core.hashing import preferred_algorithms
+from app.core.models import Peer, SharedFile, apply_file_delta
+from app.core.paths import data_dir
+from app.core.share_store import HEADLESS_FILE_NAME, ShareStore
+from app.core.snapshot import SNAPSHOT_FROZEN
+from app.core.staging import FSYNC_FINAL
+from app.core.watcher import FileWatcher, is_under, list_files, resolve_changes
+from app.network.codec import FEATURE as BINARY_CODEC
+from app.network.diagnostics import MetricsServer
+from app.network.discovery import DiscoveryService, get_local_ip
+from app.network.file_transfer import (
+    BatchDownloadTask, ControlServer, FileDownloadTask, FileTransferServer, iter_range, open_range,
+    send_messages_to_peer, send_to_peer,
+)
+from app.network.prober import CONNECT_TIMEOUT, PeerProber, probe
+from app.network.protocol import (
+    CONTROL_PORT, FEATURE_BATCH, FEATURE_CATALOG, FEATURE_DELTA, FEATURE_PAGES, FEATURE_PROBE, FEATURE_XFER,
+    MAX_BATCH_FILES, iter_file_list_pages, make_file_delta, make_file_list, make_file_list_sync,
+)
+from app.network.ratelimit import BandwidthManager
+
+log = logging.getLogger(__name__)
+
+
+def _default_download_dir() -> str:
+    return os.path.join(os.path.expanduser("~"), "Downloads", "SubParty")
+
+
+class HeadlessNode:
+    """Discovery, control and transfer services plus the share/peer bookkeeping
+    that MainWindow does for the GUI. Event callbacks arrive on worker threads,
+    so shared state is guarded by a lock."""
+
+    def __init__(self, hostname: str, bandwidth: BandwidthManager | None = None,
+                 chunk_size: int = 0, buffer_size: int = 0, metrics_port: int = 0, fsync: str = FSYNC_FINAL,
+                 snapshot_mode: str = SNAPSHOT_FROZEN):
+        self.hostname = hostname
+        self.ip = get_local_ip()
+        self.bandwidth = bandwidth or BandwidthManager()
+        self.chunk_size = chunk_size
+        self.buffer_size = buffer_size
+        self.fsync = fsync
+        self.peers: dict[str, Peer] = {}  # ip -> Peer
+        self.shared_files: list[SharedFile] = []
+        self._shared_dirs: set[str] = set()  # shared directories; new files in them are shared too
+        self.catalog_changed = threading.Condition()
+        self._lock = threading.Lock()
+        self._manifest = Manifest()  # version of shared_files, bumped on every change
+        self._catalog = CatalogCache()  # file lists of peers that left, for when they come back
+        self._incoming_lists: dict[str, str] = {}  # ip -> version of the paged list being received
+
+        self._hash_pool = HashPool()
+        self._hash_pool.finished.connect(lambda *_: self._store.save_later(self._share_state))
+        self._store = ShareStore(os.path.join(data_dir(), HEADLESS_FILE_NAME))  # not the GUI's
+        self._control = ControlServer(CONTROL_PORT)
+        self._control.file_list_received.connect(self._on_file_list_received)
+        self._control.file_list_page_received.connect(self._on_file_list_page_received)
+        self._control.file_delta_received.connect(self._on_file_delta_received)
+        self._control.file_list_sync_requested.connect(self._on_file_list_sync_requested)
+        self._transfer = FileTransferServer(
+            shared_files_getter=lambda: self.shared_files,
+            digest_getter=self._hash_pool.digest,
+            bandwidth=self.bandwidth, chunk_size=chunk_size, buffer_size=buffer_size,
+            snapshot_mode=snapshot_mode,
+        )
+        self._transfer.file_changed.connect(self._on_shared_file_changed)
+        self._watcher = FileWatcher()
+        self._watcher.changed.connect(self._on_paths_changed)
+        self._prober = PeerProber()
+        self._prober.probed.connect(self._on_peer_probed)
+        self._discovery = DiscoveryService(hostname, CONTROL_PORT, manifest_getter=lambda: self._manifest.version)
+        self._discovery.peer_discovered.connect(self._on_peer_discovered)
+        self._discovery.peer_lost.connect(self._on_peer_lost)
+        self._metrics = MetricsServer(metrics_port) if metrics_port else None
+
+    # ── Lifecycle ─────────────────────────────────────────────
+
+    def start(self, serve: bool = True):
+        if self._metrics:
+            self._metrics.start()
+        self._control.start()
+        if serve:
+            self._transfer.start()
+            self._watcher.start()
+        self._prober.start()
+        self._discovery.start()
+        log.info("Started as %s (%s)", self.hostname, self.ip)
+
+    def stop(self):
+        self._discovery.stop()
+        self._prober.stop()
+        self._control.stop()
+        self._transfer.stop()
+        self._watcher.stop()
+        self._hash_pool.stop()
+        self._store.flush()
+        if self._metrics:
+            self._metrics.stop()
+
+    # ── Sharing ───────────────────────────────────────────────
+
+    def share(self, paths: list[str]):
+        """Share files, and directories with everything inside them; both are
+        watched, so changes, deletions and new files reach peers.
+
+        Files shared before keep their id and cached digests from the share
+        store; only new or changed files are hashed."""
+        roots = [os.path.abspath(os.path.expanduser(p)) for p in paths]
+        restored, _, _ = self._store.restore(self.ip, self.hostname, within=roots)
+        with self._lock:
+            known = {f.file_path for f in self.shared_files}
+            restored = [f for f in restored if f.file_path not in known]
+            self.shared_files.extend(restored)
+            known.update(f.file_path for f in restored)
+        files = []
+        for path in roots:
+            if os.path.isdir(path):
+                with self._lock:
+                    self._shared_dirs.add(path)
+                files.extend(list_files(path))
+            elif os.path.isfile(path):
+                files.append(path)
+            else:
+                log.warning("Skipping missing path: %s", path)
+                continue
+            self._watcher.watch(path)
+        self._hash_pool.submit(restored)
+        added = self._update_shares([], [], [p for p in files if p not in known])
+        log.info("Sharing %d files (%d from the share store)", len(restored) + len(added), len(restored))
+
+    def _on_paths_changed(self, paths: list[str]):
+        with self._lock:
+            shared, dirs = list(self.shared_files), set(self._shared_dirs)
+        changed, removed, new = resolve_changes(paths, shared, dirs)
+        for sf in removed:
+            if not is_under(sf.file_path, dirs):
+                self._watcher.unwatch(sf.file_path)
+        self._update_shares([(sf, st.st_size, st.st_mtime_ns) for sf, st in changed], removed, new)
+
+    def _on_shared_file_changed(self, file_id: str, size: int, mtime_ns: int):
+        with self._lock:
+            sf = next((f for f in self.shared_files if f.file_id == file_id), None)
+        if sf is not None and (sf.size, sf.mtime_ns) != (size, mtime_ns):
+            self._update_shares([(sf, size, mtime_ns)], [], [])
+
+    def _update_shares(self, changed: list[tuple[SharedFile, int, int]], removed: list[SharedFile],
+                       new_paths: list[str]) -> list[SharedFile]:
+        """Apply (file, size, mtime_ns) updates, removals and new files to the
+        share list, re-hash in the background and send peers a FILE_DELTA.
+        Returns the files added."""
+        with self._lock:
+            taken = {f.file_id for f in self.shared_files}
+        added = []
+        for path in new_paths:
+            try:
+                sf = SharedFile.from_path(path, self.ip, self.hostname, taken)
+            except OSError as e:
+                log.warning("Cannot share %s: %s", path, e)
+                continue
+            taken.add(sf.file_id)
+            added.append(sf)
+        gone = {sf.file_id for sf in removed}
+        updated = [sf for sf, _, _ in changed]
+        with self._lock:
+            for sf, size, mtime_ns in changed:
+                sf.size, sf.mtime_ns = size, mtime_ns
+            self.shared_files = [f for f in self.shared_files if f.file_id not in gone] + added
+            if updated or gone or added:
+                base, version = self._manifest.record([f.file_id for f in updated + added], sorted(gone))
+            peers = list(self.peers.values())
+        for file_id in gone:
+            self._hash_pool.cancel(file_id)
+            self._transfer.snapshots.forget(file_id)
+        self._hash_pool.submit(updated + added)
+        self._store.save_later(self._share_state)
+        if peers and (updated or gone or added):
+            delta = make_file_delta(self.hostname, [f.to_dict() for f in updated + added], sorted(gone), base, version)
+            # called on serving and watcher threads too, so the sends go elsewhere
+            threading.Thread(target=self._send_file_delta, args=(peers, delta), daemon=True).start()
+        return added
+
+    def _share_state(self) -> tuple[list[SharedFile], set[str], set[str]]:
+        with self._lock:
+            return list(self.shared_files), set(self._shared_dirs), set()
+
+    def _send_file_delta(self, peers: list[Peer], delta: dict):
+        for peer in peers:
+            if peer.supports(FEATURE_DELTA):
+                send_to_peer(peer.ip, peer.control_port, delta, peer.supports(BINARY_CODEC))
+            else:
+                self._send_file_list(peer)
+
+    def _send_file_list(self, peer: Peer):
+        with self._lock:
+            files_data = [f.to_dict() for f in self.shared_files]
+            version = self._manifest.version
+        binary = peer.supports(BINARY_CODEC)
+        if not peer.supports(FEATURE_PAGES):
+            send_to_peer(peer.ip, peer.control_port, make_file_list(self.hostname, files_data), binary)
+            return
+        pages = iter_file_list_pages(self.hostname, version, files_data)
+        threading.Thread(
+            target=send_messages_to_peer,
+            args=(peer.ip, peer.control_port, pages, binary),
+            daemon=True,
+        ).start()
+
+    # ── Peers and catalogues ──────────────────────────────────
+
+    def _on_peer_discovered(self, hostname: str, ip: str, control_port: int, features: list, manifest: str):
+        with self._lock:
+            peer = self.peers.get(ip)
+            is_new = peer is None
+            if is_new:
+                peer = Peer(hostname=hostname, ip=ip, control_port=control_port, features=features)
+                self.peers[ip] = peer
+                cached = self._catalog.get(hostname, ip) if peer.supports(FEATURE_CATALOG) else None
+                if cached:
+                    peer.manifest, peer.shared_files = cached
+            else:
+                peer.hostname, peer.control_port, peer.features = hostname, control_port, features
+            stale = peer.supports(FEATURE_CATALOG) and manifest != peer.manifest
+        self._prober.watch(ip, peer.supports(FEATURE_PROBE))
+        if stale:
+            self._request_file_list(peer)
+        if is_new:
+            log.info("%s (%s) joined", hostname, ip)
+            # peers with FEATURE_CATALOG ask for our list; push it to older ones
+            if self.shared_files and not peer.supports(FEATURE_CATALOG):
+                self._send_file_list(peer)
+            if cached:
+                self._notify()
+
+    def _request_file_list(self, peer: Peer):
+        """Ask a peer for what changed in its list since the version we have (all of it if none)."""
+        msg = make_file_list_sync(self.hostname, CONTROL_PORT, peer.manifest)
+        threading.Thread(
+            target=send_to_peer, args=(peer.ip, peer.control_port, msg, peer.supports(BINARY_CODEC)), daemon=True,
+        ).start()
+
+    def _on_file_list_sync_requested(self, ip: str, data: dict):
+        peer = Peer(
+            hostname=data.get("hostname", ""), ip=ip, control_port=int(data["control_port"]),
+            features=list(data.get("features", [])),
+        )
+        base = str(data.get("version", ""))
+        delta = self._manifest.since(base) if base else None
+        if delta is None:
+            self._send_file_list(peer)
+            return
+        changed_ids, removed = delta
+        if not changed_ids and not removed:
+            return  # already up to date
+        with self._lock:
+            changed = [f.to_dict() for f in self.shared_files if f.file_id in changed_ids]
+            version = self._manifest.version
+        msg = make_file_delta(self.hostname, changed, sorted(removed), base, version)
+        send_to_peer(ip, peer.control_port, msg, peer.supports(BINARY_CODEC))
+
+    def _on_peer_lost(self, ip: str):
+        with self._lock:
+            peer = self.peers.pop(ip, None)
+            if peer and peer.manifest:
+                self._catalog.put(peer.hostname, peer.manifest, peer.shared_files)
+        self._prober.forget(ip)
+        self.bandwidth.forget(ip)
+        if peer:
+            log.info("%s (%s) left", peer.hostname, ip)
+            self._notify()
+
+    def _on_peer_probed(self, ip: str, reachable: bool, rtt_ms: float, throughput: float):
+        with self._lock:
+            peer = self.peers.get(ip)
+            if peer:
+                peer.update_link(reachable, rtt_ms, throughput)
+        if peer and not reachable:
+            log.warning("%s (%s) is not reachable on its transfer port", peer.hostname, ip)
+
+    def _on_file_list_received(self, hostname: str, ip: str, files: list):
+        with self._lock:
+            if ip in self.peers:
+                self.peers[ip].shared_files = [SharedFile.from_dict(f) for f in files]
+                self.peers[ip].manifest = ""
+        self._notify()
+
+    def _on_file_list_page_received(self, ip: str, page: dict):
+        shared = [SharedFile.from_dict(f) for f in page["files"]]
+        with self._lock:
+            peer = self.peers.get(ip)
+            newest = (self._incoming_lists.get(ip), peer and peer.manifest)
+            if page["cursor"] == 0 and any(is_older(page["version"], v) for v in newest if v):
+                return  # pages of each list are sent on their own thread; an older one can arrive last
+            if page["cursor"] == 0:
+                self._incoming_lists[ip] = page["version"]
+                if peer:
+                    peer.shared_files = shared
+                    peer.manifest = str(page["version"])
+            elif self._incoming_lists.get(ip) == page["version"]:
+                if peer:
+                    peer.shared_files.extend(shared)
+            else:
+                return
+            if page["next_cursor"] is None:
+                self._incoming_lists.pop(ip, None)
+        self._notify()
+
+    def _on_file_delta_received(self, ip: str, delta: dict):
+        changed = [SharedFile.from_dict(f) for f in delta.get("changed", [])]
+        with self._lock:
+            peer = self.peers.get(ip)
+            if not peer:
+                return
+            base = delta.get("base", "")
+            stale = base and base != peer.manifest
+            if not stale:
+                peer.shared_files = apply_file_delta(peer.shared_files, changed, delta.get("removed", []))
+                peer.manifest = delta.get("version", "")
+        if stale:
+            # it doesn't apply to the list we have (a delta got lost): get what we missed
+            self._request_file_list(peer)
+            return
+        self._notify()
+
+    def _notify(self):
+        with self.catalog_changed:
+            self.catalog_changed.notify_all()
+
+    def catalog(self) -> list[SharedFile]:
+        with self._lock:
+            return [f for peer in self.peers.values() for f in peer.shared_files]
+
+    def rank_sources(self, copies: list[SharedFile]) -> list[SharedFile]:
+        """Copies of one file on different peers, best link first (see Peer.link_rank)."""
+        with self._lock:
+            ranks = {ip: peer.link_rank for ip, peer in self.peers.items()}
+        return sorted(copies, key=lambda sf: ranks.get(sf.owner_ip, (True,)))
+
+    def wait_for_catalog(self, seconds: float):
+        """Collect peers' file lists for up to `seconds`, returning early once
+        every known peer has sent a complete list and nothing changed for a second."""
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            with self.catalog_changed:
+                changed = self.catalog_changed.wait(min(remaining, 1.0))
+            with self._lock:
+                settled = self.peers and not self._incoming_lists and all(p.shared_files for p in self.peers.values())
+            if settled and not changed:
+                return
+
+    # ── Downloading ───────────────────────────────────────────
+
+    def download(self, sf: SharedFile, dest: str) -> tuple[bool, str]:
+        """Download one file synchronously; returns (ok, saved path or error)."""
+        os.makedirs(dest, exist_ok=True)
+        result: list[tuple[bool, str]] = []
+        with self._lock:
+            peer = self.peers.get(sf.owner_ip)
+        if peer and peer.reachable is False:
+            # the last probes could not connect; one more try before giving up
+            try:
+                probe(sf.owner_ip)
+            except OSError:
+                return False, "Peer's transfer port is not reachable"
+            self._prober.recheck(sf.owner_ip)
+        task = FileDownloadTask(
+            sf.file_id, sf.filename, sf.owner_ip, dest,
+            bandwidth=self.bandwidth, chunk_size=self.chunk_size, buffer_size=self.buffer_size,
+            hashes=preferred_algorithms() if peer and peer.supports(FEATURE_XFER) else None,
+            connect_timeout=CONNECT_TIMEOUT if peer and peer.reachable else 30.0,
+            fsync=self.fsync,
+        )
+        task.completed.connect(lambda fid, path: result.append((True, path)))
+        task.failed.connect(lambda fid, err: result.append((False, err)))
+        task.start()
+        task.wait()
+        return result[0] if result else (False, "Download thread exited without a result")
+
+    def download_many(self, files: list[SharedFile], dest: str) -> dict[tuple[str, str], tuple[bool, str]]:
+        """Download files synchronously, each peer's files over one connection
+        where the peer supports FILE_BATCH_REQ; returns (ok, saved path or
+        error) per (owner_ip, file_id)."""
+        os.makedirs(dest, exist_ok=True)
+        results: dict[tuple[str, str], tuple[bool, str]] = {}
+        by_peer: dict[str, list[SharedFile]] = {}
+        for sf in files:
+            by_peer.setdefault(sf.owner_ip, []).append(sf)
+        for ip, peer_files in by_peer.items():
+            with self._lock:
+                peer = self.peers.get(ip)
+            if len(peer_files) == 1 or not peer or not peer.supports(FEATURE_BATCH) or peer.reachable is False:
+                for sf in peer_files:
+                    results[ip, sf.file_id] = self.download(sf, dest)
+                continue
+            for start in range(0, len(peer_files), MAX_BATCH_FILES):
+                task = BatchDownloadTask(
+                    [(sf.file_id, sf.filename) for sf in peer_files[start:start + MAX_BATCH_FILES]], ip, dest,
+                    preferred_algorithms(),
+                    bandwidth=self.bandwidth, chunk_size=self.chunk_size, buffer_size=self.buffer_size,
+                    connect_timeout=CONNECT_TIMEOUT if peer.reachable else 30.0,
+                    fsync=self.fsync,
+                )
+                task.completed.connect(lambda fid, path: results.__setitem__((ip, fid), (True, path)))
+                task.failed.connect(lambda fid, err: results.__setitem__((ip, fid), (False, err)))
+                task.start()
+                task.wait()
+            for sf in peer_files:
+                results.setdefault((ip, sf.file_id), (False, "Download thread exited without a result"))
+        return results
+
+    def read(self, sf: SharedFile, out, offset: int = 0, length: int = 0) -> int:
+        """Copy bytes [offset, offset + length) of a peer's file (to its end if
+        `length` is 0, the last -offset bytes if `offset` is negative) to the
+        binary file `out` as they arrive, unverified; returns the byte count.
+        Raises OSError."""
+        if offset < 0:
+            offset = max(0, sf.size + offset)
+        sock, _, nbytes = open_range(sf.owner_ip, sf.file_id, offset, length)
+        with sock:
+            for chunk in iter_range(sock, nbytes, sf.owner_ip, self.bandwidth):
+                out.write(chunk)
+        return nbytes
+
+
+# ── Command line ──────────────────────────────────────────────
+
+def _load_config(path: str | None) -> dict:
+    if not path:
+        return {}
+    with open(os.path.expanduser(path), "rb") as f:
+        return tomllib.load(f)
+
+
+def _make_node(args, config: dict) -> HeadlessNode:
+    kb = 1024
+    bandwidth = BandwidthManager(
+        upload=config.get("upload_limit_kbps", 0) * kb,
+        download=config.get("download_limit_kbps", 0) * kb,
+        per_peer=config.get("per_peer_limit_kbps", 0) * kb,
+    )
+    return HeadlessNode(
+        hostname=args.hostname or config.get("hostname") or socket.gethostname(),
+        bandwidth=bandwidth,
+        chunk_size=config.get("chunk_size_kb", 0) * kb,
+        buffer_size=config.get("socket_buffer_kb", 0) * kb,
+        metrics_port=args.metrics_port if args.metrics_port is not None else config.get("metrics_port", 0),
+        fsync=config.get("fsync", FSYNC_FINAL),
+        snapshot_mode=config.get("snapshot", SNAPSHOT_FROZEN),
+    )
+
+
+def _cmd_serve(args, config: dict) -> int:
+    node = _make_node(args, config)
+    stop = threading.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        signal.signal(sig, lambda *_: stop.set())
+    node.start(serve=True)
+    node.share(list(config.get("share", [])) + args.paths)
+    while not stop.wait(1.0):
+        pass
+    log.info("Shutting down")
+    node.stop()
+    return 0
+
+
+def _cmd_list(args, config: dict) -> int:
+    node = _make_node(args, config)
+    node.start(serve=False)
+    node.wait_for_catalog(args.wait)
+    node.stop()
+    files = node.catalog()
+    for sf in sorted(files, key=lambda f: (f.owner_hostname, f.filename)):
+        print(f"{sf.owner_hostname}\t{sf.size_display}\t{sf.filename}")
+    return 0
+
+
+def _cmd_get(args, config: dict) -> int:
+    node = _make_node(args, config)
+    node.start(serve=False)
+    node.wait_for_catalog(args.wait)
+    matches = [
+        sf for sf in node.catalog()
+        if any(fnmatch.fnmatch(sf.filename, pattern) for pattern in args.patterns)
+    ]
+    if not matches:
+        print("No matching files found", file=sys.stderr)
+        node.stop()
+        return 1
+    dest = args.dest or config.get("download_dir") or _default_download_dir()
+    # the same name and size on several peers is taken as one file with several sources
+    copies: dict[tuple[str, int], list[SharedFile]] = {}
+    for sf in matches:
+        copies.setdefault((sf.filename, sf.size), []).append(sf)
+    dest = os.path.expanduser(dest)
+    ranked = {key: node.rank_sources(sources) for key, sources in copies.items()}
+    # everything from its best source first, batched per peer; other sources only for what failed
+    first = node.download_many([sources[0] for sources in ranked.values()], dest)
+    failures = 0
+    for (filename, _), sources in ranked.items():
+        tried = sources[0]
+        ok, info = first[tried.owner_ip, tried.file_id]
+        for sf in sources[1:]:
+            if ok:
+                break
+            log.warning("%s from %s failed: %s", filename, tried.owner_hostname, info)
+            tried = sf
+            ok, info = node.download(sf, dest)
+        if ok:
+            print(info)
+        else:
+            failures += 1
+            print(f"{filename}: {info}", file=sys.stderr)
+    node.stop()
+    return 1 if failures else 0
+
+
+def _cmd_cat(args, config: dict) -> int:
+    node = _make_node(args, config)
+    node.start(serve=False)
+    node.wait_for_catalog(args.wait)
+    matches = [sf for sf in node.catalog() if fnmatch.fnmatch(sf.filename, args.pattern)]
+    if not matches:
+        print("No matching files found", file=sys.stderr)
+        node.stop()
+        return 1
+    # no falling back to another source: part of the file may already be on stdout
+    sf = node.rank_sources(matches)[0]
+    status = 0
+    try:
+        node.read(sf, sys.stdout.buffer, args.offset, args.length)
+    except BrokenPipeError:
+        pass  # the reader has all it wants (`| head`, a player that quit)
+    except OSError as e:
+        print(f"{sf.filename}: {e}", file=sys.stderr)
+        status = 1
+    node.stop()
+    return status
+
+
+def main(argv: list[str] | None = None) -> int:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--config", help="TOML config file")
+    common.add_argument("--hostname", help="name announced to peers")
+    common.add_argument("--log-level", help="DEBUG, INFO, WARNING or ERROR (default INFO)")
+    common.add_argument("--metrics-port", type=int, help="serve metrics and profiling on 127.0.0.1:PORT")
+
+    parser = argparse.ArgumentParser(
+        prog="subparty", description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = sub.add_parser("serve", parents=[common], help="share files and run until interrupted")
+    serve_parser.add_argument("paths", nargs="*", help="files or directories to share")
+
+    list_parser = sub.add_parser("list", parents=[common], help="print files shared by peers")
+    list_parser.add_argument("--wait", type=float, default=5.0, help="seconds to collect file lists")
+
+    get_parser = sub.add_parser("get", parents=[common], help="download peers' files by name or glob")
+    get_parser.add_argument("patterns", nargs="+")
+    get_parser.add_argument("--dest", help="download directory")
+    get_parser.add_argument("--wait", type=float, default=5.0, help="seconds to collect file lists")
+
+    cat_parser = sub.add_parser("cat", parents=[common], help="write (part of) a peer's file to stdout")
+    cat_parser.add_argument("pattern", help="file name or glob; the first match is read")
+    cat_parser.add_argument("--offset", type=int, default=0, help="first byte; negative counts from the end")
+    cat_parser.add_argument("--length", type=int, default=0, help="bytes to read (default: to the end)")
+    cat_parser.add_argument("--wait", type=float, default=5.0, help="seconds to collect file lists")
+
+    args = parser.parse_args(argv)
+    config = _load_config(args.config)
+    commands = {"serve": _cmd_serve, "list": _cmd_list, "get": _cmd_get, "cat": _cmd_cat}
+    # logs go to stderr so `list`/`get`/`cat` output on stdout stays pipeable
+    app_log.setup(args.log_level or config.get("log_level"))
+    try:
+        return commands[args.command](args, config)
+    finally:
+        app_log.shutdown()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
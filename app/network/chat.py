@@ -4,20 +4,49 @@ from __future__ import annotations
 import time
 
 from app.core.models import ChatMessage
-from app.network.protocol import make_chat
+from app.network.protocol import make_chat, make_chat_history
 
+SYNC_LIMIT = 200  # messages sent to a peer that asks to catch up
+SYNC_SLACK = 300.0  # seconds re-requested before our newest message, for clock skew
 
-def create_chat_message(hostname: str, ip: str, text: str) -> tuple[dict, ChatMessage]:
+
+def create_chat_message(hostname: str, ip: str, text: str, seq: int = 0,
+                        sender: str = "") -> tuple[dict, ChatMessage]:
     ts = time.time()
-    msg = make_chat(hostname, ip, text, ts)
-    chat = ChatMessage(sender_hostname=hostname, sender_ip=ip, text=text, timestamp=ts)
+    msg = make_chat(hostname, ip, text, ts, seq, sender)
+    chat = ChatMessage(sender_hostname=hostname, sender_ip=ip, text=text, timestamp=ts, seq=seq, sender=sender)
     return msg, chat
 
 
+def _sender(sender: str, hostname: str, seq: int) -> str:
+    # peers from before sender ids number their messages per hostname
+    return sender or (hostname if seq else "")
+
+
 def parse_chat_message(data: dict) -> ChatMessage:
+    seq = data.get("seq", 0)
     return ChatMessage(
         sender_hostname=data["hostname"],
         sender_ip=data["ip"],
         text=data["text"],
         timestamp=data["timestamp"],
+        seq=seq,
+        sender=_sender(data.get("sender", ""), data["hostname"], seq),
     )
+
+
+def create_chat_history(hostname: str, messages: list[ChatMessage]) -> dict:
+    rows = [[m.sender_hostname, m.sender_ip, m.text, m.timestamp, m.seq] for m in messages]
+    return make_chat_history(hostname, rows, [m.sender for m in messages])
+
+
+def parse_chat_history(data: dict) -> list[ChatMessage]:
+    rows = data["rows"]
+    senders = data.get("senders")
+    if not isinstance(senders, list) or len(senders) != len(rows):
+        senders = [""] * len(rows)
+    return [
+        ChatMessage(sender_hostname=hostname, sender_ip=ip, text=text, timestamp=timestamp, seq=seq,
+                    sender=_sender(sender, hostname, seq))
+        for (hostname, ip, text, timestamp, seq), sender in zip(rows, senders)
+    ]
@@ -0,0 +1,369 @@
+"""
+Compact binary encoding for control messages (stdlib only).
+
+Payload layout: MAGIC (3 bytes) + version (1 byte) + one encoded value.
+JSON payloads always start with "{", so a receiver can tell the two apart
+from the first byte and old peers keep working with plain JSON.
+
+Values are tagged, msgpack-style:
+  NONE / FALSE / TRUE
+  INT    zigzag varint
+  FLOAT  8-byte IEEE 754 double
+  STR    varint length + UTF-8, appended to the string table
+  REF    varint index into the string table (repeated strings)
+  BYTES  varint length + raw bytes
+  LIST   varint count + values
+  DICT   varint count + (key, value) pairs, keys are STR/REF
+  TABLE  list of dicts sharing the same keys, stored column by column.
+         Keys are written once and every column picks the cheapest layout:
+           SHARED  one scalar value common to every row (e.g. owner_ip)
+           STRS    packed character lengths + one UTF-8 blob
+           ENUM    distinct strings as STRS + packed indexes (interning)
+           INTS    packed fixed-width little-endian integers
+           VALUES  one tagged value per row (anything else)
+
+The string table is per message: the encoder emits the first occurrence of a
+string as STR and every later occurrence as REF. Packed columns are decoded
+with a single struct call, so big file lists decode at C speed.
+"""
+from __future__ import annotations
+
+import struct
+from itertools import repeat
+from typing import Any
+
+MAGIC = b"\x00SP"
+VERSION = 1
+FEATURE = "bin1"  # advertised in HELLO by peers that can decode this format
+
+_NONE = 0x00
+_FALSE = 0x01
+_TRUE = 0x02
+_INT = 0x03
+_FLOAT = 0x04
+_STR = 0x05
+_REF = 0x06
+_BYTES = 0x07
+_LIST = 0x08
+_DICT = 0x09
+_TABLE = 0x0A
+
+# TABLE column layouts
+_COL_VALUES = 0
+_COL_SHARED = 1
+_COL_STRS = 2
+_COL_ENUM = 3
+_COL_INTS = 4
+
+_MIN_TABLE_ROWS = 2
+_MAX_TABLE_ROWS = 1 << 20  # a shared-only table costs no bytes per row, so its length needs its own cap
+_SCALARS = (str, int, float, bool, type(None))
+_INT_WIDTHS = ((1, "b"), (2, "h"), (4, "i"), (8, "q"))
+_WIDTH_FORMATS = dict(_INT_WIDTHS)
+
+_double = struct.Struct("!d")
+
+
+class CodecError(ValueError):
+    pass
+
+
+def is_binary(data: bytes) -> bool:
+    return data[:len(MAGIC)] == MAGIC
+
+
+def encode(value: Any) -> bytes:
+    out = bytearray(MAGIC)
+    out.append(VERSION)
+    _Encoder(out).write(value)
+    return bytes(out)
+
+
+def decode(data: bytes) -> Any:
+    if not is_binary(data) or len(data) <= len(MAGIC):
+        raise CodecError("not a binary payload")
+    version = data[len(MAGIC)]
+    if version != VERSION:
+        raise CodecError(f"unsupported binary version {version}")
+    decoder = _Decoder(data, len(MAGIC) + 1)
+    value = decoder.read()
+    if decoder.pos != len(data):
+        raise CodecError("trailing bytes after value")
+    return value
+
+
+class _Encoder:
+    def __init__(self, out: bytearray):
+        self._out = out
+        self._strings: dict[str, int] = {}
+
+    def _varint(self, n: int):
+        out = self._out
+        while n >= 0x80:
+            out.append((n & 0x7F) | 0x80)
+            n >>= 7
+        out.append(n)
+
+    def _str(self, s: str):
+        index = self._strings.get(s)
+        if index is not None:
+            self._out.append(_REF)
+            self._varint(index)
+            return
+        self._strings[s] = len(self._strings)
+        raw = s.encode("utf-8")
+        self._out.append(_STR)
+        self._varint(len(raw))
+        self._out += raw
+
+    def write(self, v: Any):
+        out = self._out
+        if isinstance(v, str):
+            self._str(v)
+        elif v is None:
+            out.append(_NONE)
+        elif v is True:
+            out.append(_TRUE)
+        elif v is False:
+            out.append(_FALSE)
+        elif isinstance(v, int):
+            out.append(_INT)
+            self._varint((v << 1) if v >= 0 else ((-v << 1) - 1))
+        elif isinstance(v, float):
+            out.append(_FLOAT)
+            out += _double.pack(v)
+        elif isinstance(v, (bytes, bytearray, memoryview)):
+            out.append(_BYTES)
+            self._varint(len(v))
+            out += v
+        elif isinstance(v, dict):
+            out.append(_DICT)
+            self._varint(len(v))
+            for key, item in v.items():
+                if not isinstance(key, str):
+                    raise CodecError(f"dict keys must be str, got {type(key).__name__}")
+                self._str(key)
+                self.write(item)
+        elif isinstance(v, (list, tuple)):
+            keys = _table_keys(v)
+            if keys is None:
+                out.append(_LIST)
+                self._varint(len(v))
+                for item in v:
+                    self.write(item)
+            else:
+                self._table(v, keys)
+        else:
+            raise CodecError(f"cannot encode {type(v).__name__}")
+
+    def _table(self, rows: list[dict], keys: list[str]):
+        self._out.append(_TABLE)
+        self._varint(len(rows))
+        self._varint(len(keys))
+        for key in keys:
+            self._str(key)
+            self._column([row[key] for row in rows])
+
+    def _column(self, values: list):
+        out = self._out
+        first = values[0]
+        kind = type(first)
+        same_type = all(type(v) is kind for v in values)
+        if same_type and isinstance(first, _SCALARS) and all(v == first for v in values):
+            out.append(_COL_SHARED)
+            self.write(first)
+        elif same_type and kind is str:
+            distinct = list(dict.fromkeys(values))
+            if len(distinct) * 2 <= len(values):
+                index = {s: i for i, s in enumerate(distinct)}
+                out.append(_COL_ENUM)
+                self._varint(len(distinct))
+                self._packed_strs(distinct)
+                self._packed_ints([index[v] for v in values])
+            else:
+                out.append(_COL_STRS)
+                self._packed_strs(values)
+        elif same_type and kind is int:
+            out.append(_COL_INTS)
+            self._packed_ints(values)
+        else:
+            out.append(_COL_VALUES)
+            for v in values:
+                self.write(v)
+
+    def _packed_ints(self, values: list[int]):
+        lo, hi = min(values), max(values)
+        for width, fmt in _INT_WIDTHS:
+            bound = 1 << (width * 8 - 1)
+            if -bound <= lo and hi < bound:
+                break
+        else:
+            raise CodecError("integer column out of 64-bit range")
+        self._out.append(width)
+        self._out += struct.pack(f"<{len(values)}{fmt}", *values)
+
+    def _packed_strs(self, values: list[str]):
+        self._packed_ints([len(v) for v in values])
+        raw = "".join(values).encode("utf-8")
+        self._varint(len(raw))
+        self._out += raw
+
+
+def _table_keys(items) -> list[str] | None:
+    """Return the common key order if `items` can be written as a TABLE."""
+    if len(items) < _MIN_TABLE_ROWS or not isinstance(items[0], dict):
+        return None
+    keys = list(items[0])
+    if not all(isinstance(k, str) for k in keys):
+        return None
+    n = len(keys)
+    for row in items:
+        if not isinstance(row, dict) or len(row) != n or list(row) != keys:
+            return None
+    return keys
+
+
+class _Decoder:
+    def __init__(self, data: bytes, pos: int):
+        self._data = data
+        self.pos = pos
+        self._strings: list[str] = []
+
+    def _varint(self) -> int:
+        data = self._data
+        pos = self.pos
+        b = data[pos]
+        pos += 1
+        if b < 0x80:
+            self.pos = pos
+            return b
+        result = b & 0x7F
+        shift = 7
+        while True:
+            b = data[pos]
+            pos += 1
+            result |= (b & 0x7F) << shift
+            if b < 0x80:
+                self.pos = pos
+                return result
+            shift += 7
+
+    def _count(self, item_size: int = 1) -> int:
+        """A length prefix, checked against what is left of the payload for
+        items of at least `item_size` bytes each."""
+        n = self._varint()
+        if n * item_size > len(self._data) - self.pos:
+            raise CodecError(f"length {n} runs past end of payload")
+        return n
+
+    def read(self) -> Any:
+        try:
+            return self._read()
+        except CodecError:
+            raise
+        except (IndexError, UnicodeDecodeError, struct.error, TypeError, ValueError, MemoryError) as e:
+            # TypeError: a container decoded as a dict key
+            raise CodecError(f"malformed payload: {e}") from e
+
+    def _read(self) -> Any:
+        tag = self._data[self.pos]
+        self.pos += 1
+        if tag == _REF:
+            return self._strings[self._varint()]
+        if tag == _STR:
+            n = self._count()
+            start = self.pos
+            self.pos = start + n
+            if self.pos > len(self._data):
+                raise IndexError("string runs past end of payload")
+            s = self._data[start:self.pos].decode("utf-8")
+            self._strings.append(s)
+            return s
+        if tag == _INT:
+            z = self._varint()
+            return (z >> 1) if not z & 1 else -((z + 1) >> 1)
+        if tag == _TABLE:
+            return self._table()
+        if tag == _DICT:
+            read = self._read
+            return {read(): read() for _ in range(self._count(2))}
+        if tag == _LIST:
+            read = self._read
+            return [read() for _ in range(self._count())]
+        if tag == _NONE:
+            return None
+        if tag == _TRUE:
+            return True
+        if tag == _FALSE:
+            return False
+        if tag == _FLOAT:
+            start = self.pos
+            self.pos += 8
+            return _double.unpack_from(self._data, start)[0]
+        if tag == _BYTES:
+            n = self._count()
+            start = self.pos
+            self.pos = start + n
+            if self.pos > len(self._data):
+                raise IndexError("bytes run past end of payload")
+            return self._data[start:self.pos]
+        raise CodecError(f"unknown tag 0x{tag:02x}")
+
+    def _table(self) -> list[dict]:
+        n_rows = self._varint()
+        if n_rows > _MAX_TABLE_ROWS:
+            raise CodecError(f"table of {n_rows} rows")
+        n_cols = self._count(2)
+        keys: list[str] = []
+        columns: list = []
+        for _ in range(n_cols):
+            key = self._read()
+            layout = self._data[self.pos]
+            self.pos += 1
+            if layout == _COL_SHARED:
+                column = repeat(self._read(), n_rows)
+            elif layout == _COL_STRS:
+                column = self._packed_strs(n_rows)
+            elif layout == _COL_ENUM:
+                distinct = self._packed_strs(self._count())
+                column = [distinct[i] for i in self._packed_ints(n_rows)]
+            elif layout == _COL_INTS:
+                column = self._packed_ints(n_rows)
+            elif layout == _COL_VALUES:
+                column = [self._read() for _ in range(n_rows)]
+            else:
+                raise CodecError(f"unknown column layout {layout}")
+            keys.append(key)
+            columns.append(column)
+        if not columns:
+            return [{} for _ in range(n_rows)]
+        return [dict(zip(keys, values)) for values in zip(*columns)]
+
+    def _packed_ints(self, n: int) -> tuple[int, ...]:
+        width = self._data[self.pos]
+        fmt = _WIDTH_FORMATS.get(width)
+        if fmt is None:
+            raise CodecError(f"bad integer width {width}")
+        if width * n > len(self._data) - self.pos - 1:
+            raise CodecError(f"integer column of {n} runs past end of payload")
+        start = self.pos + 1
+        self.pos = start + width * n
+        return struct.unpack_from(f"<{n}{fmt}", self._data, start)
+
+    def _packed_strs(self, n: int) -> list[str]:
+        lengths = self._packed_ints(n)
+        size = self._varint()
+        start = self.pos
+        self.pos = start + size
+        if self.pos > len(self._data):
+            raise IndexError("string column runs past end of payload")
+        text = self._data[start:self.pos].decode("utf-8")
+        out = []
+        pos = 0
+        for length in lengths:
+            end = pos + length
+            out.append(text[pos:end])
+            pos = end
+        if pos != len(text):
+            raise CodecError("string column lengths do not match data")
+        return out
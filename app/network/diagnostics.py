@@ -0,0 +1,86 @@
+"""Loopback HTTP endpoint for metrics and CPU profile captures.
+
+    GET /metrics         Prometheus text format (see app.core.metrics)
+    GET /profile/start   begin a cProfile capture
+    GET /profile/stop    end it; responds with the .prof path and a summary
+
+Binds to 127.0.0.1 only, so nothing is exposed to the LAN. Starting the
+server enables metrics collection; stopping it disables it again.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from app.core import metrics, profiler
+from app.network.service import ServiceThread
+
+log = logging.getLogger(__name__)
+
+METRICS_PORT = 37719
+
+metrics.gauge("subparty_threads", "Live Python threads", threading.active_count)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._reply(200, metrics.render(), "text/plain; version=0.0.4")
+        elif self.path == "/profile/start":
+            try:
+                profiler.start()
+            except RuntimeError as e:
+                self._reply(409, f"{e}\n")
+                return
+            log.info("CPU profile capture started")
+            self._reply(200, "Profiling started\n")
+        elif self.path == "/profile/stop":
+            try:
+                path, summary = profiler.stop()
+            except RuntimeError as e:
+                self._reply(409, f"{e}\n")
+                return
+            log.info("CPU profile written to %s", path)
+            self._reply(200, f"{path}\n\n{summary}")
+        else:
+            self._reply(404, "Not found\n")
+
+    def _reply(self, status: int, body: str, content_type: str = "text/plain; charset=utf-8"):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        log.debug("%s %s", self.address_string(), format % args)
+
+
+class MetricsServer(ServiceThread):
+    """Serves the diagnostics endpoint on 127.0.0.1:`port`."""
+
+    def __init__(self, port: int = METRICS_PORT):
+        super().__init__()
+        self.port = port
+        self._httpd: ThreadingHTTPServer | None = None
+
+    def run(self):
+        try:
+            self._httpd = ThreadingHTTPServer(("127.0.0.1", self.port), _Handler)
+        except OSError as e:
+            log.warning("Metrics endpoint unavailable on port %d: %s", self.port, e)
+            return
+        self._httpd.daemon_threads = True
+        metrics.enable()
+        log.info("Metrics at http://127.0.0.1:%d/metrics", self.port)
+        self._httpd.serve_forever(poll_interval=0.5)
+        self._httpd.server_close()
+
+    def stop(self):
+        metrics.enable(False)
+        if self._httpd:
+            self._httpd.shutdown()
+        if not self.wait(3.0):
+            log.warning("Thread did not stop in 3s, abandoning daemon thread")
@@ -1,92 +1,112 @@
 """UDP broadcast-based peer discovery for LAN."""
 from __future__ import annotations
 
+import heapq
 import json
+import logging
+import selectors
 import socket
 import time
 
-from PySide6.QtCore import QThread, Signal
-
+from app.core import metrics
+from app.core.events import Event
 from app.network.protocol import DISCOVERY_PORT, make_hello, make_bye
+from app.network.service import ServiceThread
+
+log = logging.getLogger(__name__)
 
-LOG_PREFIX = "[Discovery]"
+PACKETS_RECEIVED = metrics.counter("subparty_discovery_packets_total", "Discovery datagrams received")
+PEERS = metrics.gauge("subparty_discovery_peers", "Peers currently known to discovery")
+EXPIRY_QUEUE = metrics.gauge("subparty_discovery_expiry_queue_depth", "Entries in the peer expiry heap")
 
+HELLO_INTERVAL = 3.0  # seconds between HELLO broadcasts
+PEER_TIMEOUT = 10.0  # seconds without HELLO before a peer is considered lost
 
-def _log(msg: str):
-    print(f"{LOG_PREFIX} {msg}", flush=True)
 
+def get_local_ip() -> str:
+    """Best guess at this machine's LAN address (no packets are sent)."""
+    try:
+        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        s.connect(("8.8.8.8", 80))
+        ip = s.getsockname()[0]
+        s.close()
+        return ip
+    except OSError:
+        return "127.0.0.1"
 
-class DiscoveryService(QThread):
-    """Broadcasts HELLO messages and listens for peers on UDP."""
 
-    peer_discovered = Signal(str, str, int)  # hostname, ip, control_port
-    peer_lost = Signal(str)  # ip
+class DiscoveryService(ServiceThread):
+    """Broadcasts HELLO messages and listens for peers on UDP.
 
-    def __init__(self, hostname: str, control_port: int, parent=None):
-        super().__init__(parent)
+    The loop blocks in a selector until either a datagram arrives, the next
+    HELLO is due, or the earliest peer deadline passes. Events are emitted
+    only when the peer set actually changes: a new peer, a peer whose
+    hostname, port, features or file-list version (manifest) changed, or a
+    peer that left or timed out.
+    """
+
+    def __init__(self, hostname: str, control_port: int, manifest_getter=None):
+        super().__init__()
+        self.peer_discovered = Event()  # hostname, ip, control_port, features, manifest
+        self.peer_lost = Event()  # ip
         self._hostname = hostname
         self._control_port = control_port
+        self._manifest_getter = manifest_getter or str  # -> our manifest version for HELLO
         self._running = False
-        self._peers: dict[str, float] = {}  # ip -> last_seen
+        self._peers: dict[str, tuple] = {}  # ip -> (hostname, control_port, features, manifest)
+        self._last_seen: dict[str, float] = {}  # ip -> monotonic timestamp
+        self._expiry: list[tuple[float, str]] = []  # heap of (deadline, ip)
+        self._scheduled: set[str] = set()  # ips with an entry in _expiry, at most one each
         self._sock: socket.socket | None = None
+        self._wake_r, self._wake_w = socket.socketpair()
+        PEERS.set_function(lambda: len(self._peers))
+        EXPIRY_QUEUE.set_function(lambda: len(self._expiry))
 
     def run(self):
-        _log("Thread started")
+        log.debug("Thread started")
         self._running = True
         self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
         self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
         self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self._sock.bind(("", DISCOVERY_PORT))
-        self._sock.settimeout(1.0)
-        _log(f"Bound to UDP port {DISCOVERY_PORT}")
+        self._sock.setblocking(False)
+        log.info("Bound to UDP port %d", DISCOVERY_PORT)
 
-        last_broadcast = 0.0
         my_ips = self._get_local_ips()
-        _log(f"Local IPs: {my_ips}")
-
-        while self._running:
-            now = time.time()
+        log.debug("Local IPs: %s", my_ips)
 
-            # broadcast HELLO every 3 seconds
-            if now - last_broadcast >= 3.0:
-                hello = json.dumps(make_hello(self._hostname, self._control_port)).encode("utf-8")
-                try:
-                    self._sock.sendto(hello, ("<broadcast>", DISCOVERY_PORT))
-                except OSError as e:
-                    _log(f"Broadcast send error: {e}")
-                last_broadcast = now
+        selector = selectors.DefaultSelector()
+        selector.register(self._sock, selectors.EVENT_READ)
+        selector.register(self._wake_r, selectors.EVENT_READ)
 
-            # receive
+        next_broadcast = time.monotonic()
+        try:
+            while self._running:
+                now = time.monotonic()
+                if now >= next_broadcast:
+                    self._broadcast_hello()
+                    next_broadcast = now + HELLO_INTERVAL
+                self._expire_peers(now)
+
+                deadline = next_broadcast
+                if self._expiry:
+                    deadline = min(deadline, self._expiry[0][0])
+                events = selector.select(max(0.0, deadline - time.monotonic()))
+                for key, _ in events:
+                    if key.fileobj is self._wake_r:
+                        self._running = False
+                    else:
+                        self._drain(my_ips)
+        except OSError as e:
+            log.debug("Socket error (likely closed): %s", e)
+        finally:
+            selector.close()
             try:
-                data, addr = self._sock.recvfrom(4096)
-                ip = addr[0]
-                if ip in my_ips:
-                    continue
-                msg = json.loads(data.decode("utf-8"))
-                if msg.get("type") == "HELLO":
-                    self._peers[ip] = now
-                    self.peer_discovered.emit(msg["hostname"], ip, msg["control_port"])
-                elif msg.get("type") == "BYE":
-                    _log(f"Received BYE from {ip}")
-                    if ip in self._peers:
-                        del self._peers[ip]
-                    self.peer_lost.emit(ip)
-            except socket.timeout:
+                self._sock.close()
+            except OSError:
                 pass
-            except OSError as e:
-                _log(f"Socket error (likely closed): {e}")
-                break
-            except json.JSONDecodeError:
-                continue
 
-            # check for dead peers
-            dead = [ip for ip, ts in self._peers.items() if now - ts > 10.0]
-            for ip in dead:
-                _log(f"Peer timeout: {ip}")
-                del self._peers[ip]
-                self.peer_lost.emit(ip)
-
-        _log("Loop exited, sending BYE")
+        log.debug("Loop exited, sending BYE")
         # send BYE before stopping
         try:
             bye_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
@@ -96,27 +116,94 @@ class DiscoveryService(QThread):
                 ("<broadcast>", DISCOVERY_PORT),
             )
             bye_sock.close()
-            _log("BYE sent")
+            log.debug("BYE sent")
         except OSError as e:
-            _log(f"BYE send error: {e}")
+            log.warning("BYE send error: %s", e)
+
+        log.debug("Thread exiting")
 
-        _log("Thread exiting")
+    def _broadcast_hello(self):
+        hello = make_hello(self._hostname, self._control_port, self._manifest_getter())
+        hello = json.dumps(hello).encode("utf-8")
+        try:
+            self._sock.sendto(hello, ("<broadcast>", DISCOVERY_PORT))
+        except OSError as e:
+            log.warning("Broadcast send error: %s", e)
+
+    def _drain(self, my_ips: set[str]):
+        """Read every queued datagram without blocking."""
+        while True:
+            try:
+                data, addr = self._sock.recvfrom(4096)
+            except (BlockingIOError, InterruptedError):
+                return
+            PACKETS_RECEIVED.inc()
+            ip = addr[0]
+            if ip in my_ips:
+                continue
+            try:
+                msg = json.loads(data.decode("utf-8"))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if msg.get("type") == "HELLO":
+                self._on_hello(ip, msg)
+            elif msg.get("type") == "BYE":
+                log.info("Received BYE from %s", ip)
+                self._forget(ip)
+
+    def _on_hello(self, ip: str, msg: dict):
+        try:
+            state = (
+                msg["hostname"], int(msg["control_port"]), tuple(msg.get("features", ())), str(msg.get("manifest", "")),
+            )
+        except (KeyError, TypeError, ValueError):
+            return
+        now = time.monotonic()
+        known = ip in self._peers
+        self._last_seen[ip] = now
+        if known and self._peers[ip] == state:
+            return  # refresh only; the heap entry is re-armed lazily on expiry
+        if ip not in self._scheduled:
+            self._scheduled.add(ip)
+            heapq.heappush(self._expiry, (now + PEER_TIMEOUT, ip))
+        self._peers[ip] = state
+        self.peer_discovered.emit(state[0], ip, state[1], list(state[2]), state[3])
+
+    def _expire_peers(self, now: float):
+        while self._expiry and self._expiry[0][0] <= now:
+            _, ip = heapq.heappop(self._expiry)
+            if ip not in self._peers:
+                self._scheduled.discard(ip)  # stale entry for a peer that already left
+                continue
+            deadline = self._last_seen[ip] + PEER_TIMEOUT
+            if deadline > now:
+                heapq.heappush(self._expiry, (deadline, ip))
+                continue
+            log.info("Peer timeout: %s", ip)
+            self._scheduled.discard(ip)
+            self._forget(ip)
+
+    def _forget(self, ip: str):
+        self._last_seen.pop(ip, None)
+        if self._peers.pop(ip, None) is not None:
+            self.peer_lost.emit(ip)
 
     def stop(self):
-        _log("stop() called")
+        log.debug("stop() called")
         self._running = False
-        if self._sock:
+        try:
+            self._wake_w.send(b"\0")
+        except OSError as e:
+            log.warning("Wakeup send error: %s", e)
+        log.debug("Waiting for thread...")
+        if not self.wait(3.0):
+            log.warning("Thread did not stop in 3s, abandoning daemon thread")
+        for s in (self._wake_r, self._wake_w):
             try:
-                self._sock.close()
-                _log("Socket closed")
-            except OSError as e:
-                _log(f"Socket close error: {e}")
-        _log("Waiting for thread...")
-        if not self.wait(3000):
-            _log("Thread did not stop in 3s, terminating")
-            self.terminate()
-            self.wait(1000)
-        _log("stop() done")
+                s.close()
+            except OSError:
+                pass
+        log.debug("stop() done")
 
     @staticmethod
     def _get_local_ips() -> set[str]:
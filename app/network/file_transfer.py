@@ -1,42 +1,88 @@
 """TCP file transfer with chunked streaming, progress, and checksum verification."""
 from __future__ import annotations
 
-import hashlib
+import logging
 import os
 import socket
 import struct
-
-from PySide6.QtCore import QThread, Signal
-
-from app.network.protocol import CHUNK_SIZE, TRANSFER_PORT
-
-
-def _log(prefix: str, msg: str):
-    print(f"{prefix} {msg}", flush=True)
-
-
-class FileTransferServer(QThread):
+import threading
+import time
+from typing import Iterator
+
+from app.core import merkle, metrics
+from app.core.snapshot import SNAPSHOT_FROZEN, Snapshot, SnapshotManager
+from app.core.staging import FSYNC_FINAL, StagedDownload
+from app.core.hashing import ALGORITHMS, LEGACY_ALGORITHM, hash_file, mapped_view
+from app.core.events import Event
+from app.core.models import SharedFile
+from app.network.protocol import (
+    CHUNK_SIZE, MAX_BATCH_FILES, MAX_PROBE_BYTES, TRANSFER_PORT, XFER_MAGIC, encode_message,
+    make_file_batch_request, make_file_error, make_file_header, make_file_request, recv_message, send_message,
+)
+from app.network.ratelimit import DOWNLOAD, UPLOAD, BandwidthManager
+from app.network.service import ServiceThread
+from app.network.tuning import AdaptiveSizer
+
+
+log = logging.getLogger(__name__)
+
+BYTES_SENT = metrics.counter("subparty_bytes_sent_total", "File bytes sent to peers")
+BYTES_RECEIVED = metrics.counter("subparty_bytes_received_total", "File bytes received from peers")
+HASH_SECONDS = metrics.histogram("subparty_hash_seconds", "Time to hash one whole file")
+DISK_READ_SECONDS = metrics.histogram("subparty_disk_read_seconds", "Latency of one chunk read while serving")
+DISK_WRITE_SECONDS = metrics.histogram("subparty_disk_write_seconds", "Latency of one chunk write while downloading")
+UPLOAD_CONNECTIONS = metrics.counter("subparty_upload_connections_total", "Transfer connections accepted")
+UPLOADS_ACTIVE = metrics.gauge("subparty_uploads_active", "Transfer connections being served")
+DOWNLOADS_ACTIVE = metrics.gauge("subparty_downloads_active", "Downloads in progress")
+CONTROL_CONNECTIONS = metrics.counter("subparty_control_connections_total", "Control connections accepted")
+CONTROL_ACTIVE = metrics.gauge("subparty_control_connections_active", "Control connections being read")
+CONTROL_MESSAGES = metrics.counter("subparty_control_messages_total", "Control messages received")
+BLOCKS_REFETCHED = metrics.counter("subparty_blocks_refetched_total", "Downloaded blocks that failed verification")
+
+REPAIR_ATTEMPTS = 3  # rounds of re-fetching blocks that fail tree verification
+PACK_BYTES = 64 * 1024  # files of a batch up to this size are sent together with their neighbours
+
+
+class FileTransferServer(ServiceThread):
     """Listens for incoming file transfer requests and serves file data."""
 
-    transfer_started = Signal(str, str)  # file_id, requester_ip
+    LOG = log.getChild("TransferServer")
 
-    LOG = "[TransferServer]"
-
-    def __init__(self, shared_files_getter, parent=None):
-        super().__init__(parent)
+    def __init__(
+        self, shared_files_getter, bandwidth: BandwidthManager | None = None,
+        chunk_size: int = 0, buffer_size: int = 0, port: int = TRANSFER_PORT,
+        digest_getter=None, snapshot_mode: str = SNAPSHOT_FROZEN,
+    ):
+        super().__init__()
+        self.transfer_started = Event()  # file_id, requester_ip
+        self.file_changed = Event()  # file_id, size, mtime_ns: a shared file differs from its listing
         self._running = False
+        self._port = port
         self._get_shared_files = shared_files_getter
+        # (SharedFile, algorithm) -> digest; HashPool.digest serves cached digests and prioritises the rest
+        self._get_digest = digest_getter
+        # what each request reads; its `changed` event reports files modified since they were listed
+        self.snapshots = SnapshotManager(snapshot_mode)
+        self.snapshots.changed.connect(self.file_changed.emit)
+        self._bandwidth = bandwidth
+        self._chunk_size = chunk_size  # 0 = adaptive
+        self._buffer_size = buffer_size  # 0 = adaptive
         self._server_sock: socket.socket | None = None
 
+    def set_tuning(self, chunk_size: int, buffer_size: int):
+        """Change the chunk/socket buffer overrides for new connections (0 = adaptive)."""
+        self._chunk_size = chunk_size
+        self._buffer_size = buffer_size
+
     def run(self):
-        _log(self.LOG, "Thread started")
+        self.LOG.debug("Thread started")
         self._running = True
         self._server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self._server_sock.bind(("", TRANSFER_PORT))
-        self._server_sock.listen(5)
+        self._server_sock.bind(("", self._port))
+        self._server_sock.listen(32)
         self._server_sock.settimeout(1.0)
-        _log(self.LOG, f"Listening on TCP port {TRANSFER_PORT}")
+        self.LOG.info("Listening on TCP port %d", self._port)
 
         while self._running:
             try:
@@ -44,214 +90,695 @@ class FileTransferServer(QThread):
             except socket.timeout:
                 continue
             except OSError as e:
-                _log(self.LOG, f"Accept error (likely closed): {e}")
+                self.LOG.debug("Accept error (likely closed): %s", e)
                 break
-            _log(self.LOG, f"Connection from {addr[0]}")
-            try:
-                self._serve_file(conn, addr[0])
-            except Exception as e:
-                _log(self.LOG, f"Serve error: {e}")
-            finally:
-                conn.close()
+            self.LOG.debug("Connection from %s", addr[0])
+            # concurrent uploads run side by side and share the bandwidth limits
+            threading.Thread(
+                target=self._serve_connection, args=(conn, addr[0]), daemon=True,
+            ).start()
 
-        _log(self.LOG, "Loop exited")
+        self.LOG.debug("Loop exited")
         try:
             self._server_sock.close()
         except OSError:
             pass
-        _log(self.LOG, "Thread exiting")
+        self.LOG.debug("Thread exiting")
+
+    def _serve_connection(self, conn: socket.socket, requester_ip: str):
+        UPLOAD_CONNECTIONS.inc()
+        UPLOADS_ACTIVE.inc()
+        try:
+            self._serve_file(conn, requester_ip)
+        except Exception as e:
+            self.LOG.warning("Serve error for %s: %s", requester_ip, e)
+        finally:
+            UPLOADS_ACTIVE.dec()
+            conn.close()
 
     def _serve_file(self, conn: socket.socket, requester_ip: str):
-        # Protocol: client sends 12-byte file_id + 8-byte offset
-        header = _recv_exact(conn, 20)
-        if not header:
-            _log(self.LOG, "Failed to receive request header")
-            return
-        file_id = header[:12].decode("ascii")
-        offset = struct.unpack("!Q", header[12:20])[0]
-        _log(self.LOG, f"File request: id={file_id}, offset={offset}")
+        # Protocol: XFER_MAGIC + FILE_REQ message, or (legacy) 12-byte file_id + 8-byte offset
+        head = _recv_exact(conn, len(XFER_MAGIC))
+        if head == XFER_MAGIC:
+            request = recv_message(conn)
+            if request and request.get("type") == "PROBE":
+                self._send_probe(conn, requester_ip, min(int(request.get("bytes", 0)), MAX_PROBE_BYTES))
+                return
+            if request and request.get("type") == "FILE_BATCH_REQ":
+                self._serve_batch(conn, requester_ip, request)
+                return
+            if not request or request.get("type") != "FILE_REQ":
+                self.LOG.debug("Bad FILE_REQ from %s", requester_ip)
+                return
+            file_id = str(request.get("file_id", ""))
+            offset = int(request.get("offset", 0))
+            length = int(request.get("length", 0))
+            accepted = [a for a in request.get("hashes", []) if a in ALGORITHMS]
+            wanted = bytes.fromhex(request.get("digest", ""))  # the version a block re-fetch is for
+            verify = request.get("verify", True) is not False
+            negotiated = True
+        else:
+            rest = _recv_exact(conn, 20 - len(XFER_MAGIC)) if head else None
+            if not rest:
+                self.LOG.debug("Failed to receive request header from %s", requester_ip)
+                return
+            header = head + rest
+            file_id = header[:12].decode("ascii")
+            offset = struct.unpack("!Q", header[12:20])[0]
+            length = 0
+            wanted = b""
+            accepted = [LEGACY_ALGORITHM]
+            verify = True
+            negotiated = False
+        self.LOG.debug("File request from %s: id=%s, offset=%d", requester_ip, file_id, offset)
 
         self.transfer_started.emit(file_id, requester_ip)
 
-        # find the file
-        shared = self._get_shared_files()
-        target = None
-        for f in shared:
-            if f.file_id == file_id:
-                target = f
-                break
-        if not target or not target.file_path or not os.path.isfile(target.file_path):
-            _log(self.LOG, f"File not found: {file_id}")
-            conn.sendall(struct.pack("!Q", 0))
+        target = self._find(file_id)
+        if target is None:
+            self.LOG.warning("File not found: %s", file_id)
+            if negotiated:
+                send_message(conn, make_file_error("not found"))
+            else:
+                conn.sendall(struct.pack("!Q", 0))
+            return
+        if not accepted and verify:
+            self.LOG.warning("No common hash algorithm with %s", requester_ip)
+            send_message(conn, make_file_error("no common hash algorithm"))
             return
 
-        file_size = os.path.getsize(target.file_path)
-        _log(self.LOG, f"Serving {target.filename} ({file_size} bytes)")
-        sha = hashlib.sha256()
-        with open(target.file_path, "rb") as f:
-            while True:
-                chunk = f.read(CHUNK_SIZE)
-                if not chunk:
-                    break
-                sha.update(chunk)
-
-        conn.sendall(struct.pack("!Q", file_size) + sha.digest())
-
-        with open(target.file_path, "rb") as f:
-            f.seek(offset)
-            remaining = file_size - offset
-            while remaining > 0 and self._running:
-                to_read = min(CHUNK_SIZE, remaining)
-                chunk = f.read(to_read)
-                if not chunk:
-                    break
+        snap = self.snapshots.acquire(target, wanted)
+        try:
+            file_size = snap.size
+            if verify:
+                algorithm, digest = self._digest(snap, target, accepted)
+                self.LOG.debug("Serving %s (%d bytes, %s) to %s", target.filename, file_size, algorithm, requester_ip)
+            else:
+                # a range read for a preview or a stream; hashing a whole file for it would defeat the point
+                algorithm, digest = "", b""
+                self.LOG.debug("Serving %s [%d+%d] to %s", target.filename, offset, length, requester_ip)
+
+            sizer = AdaptiveSizer(self._chunk_size, self._buffer_size)
+            sizer.apply_buffer(conn, socket.SO_SNDBUF)
+            if negotiated:
+                send_message(conn, make_file_header(file_size, algorithm, digest))
+            else:
+                conn.sendall(struct.pack("!Q", file_size) + digest)
+
+            end = min(offset + length, file_size) if length else file_size
+            # only our own clones are mapped: a shared file truncated meanwhile would SIGBUS the mapping
+            with open(snap.path, "rb") as f, mapped_view(f, file_size if snap.owned else 0) as view:
+                sent = self._send_range(conn, f, view, file_id, requester_ip, offset, end, sizer)
+            if sent < end - offset and self._running:
+                raise OSError(f"{target.filename} shrank while being served")
+        finally:
+            self.snapshots.release(snap)
+        self.LOG.debug("Serve complete: %s", file_id)
+
+    def _serve_batch(self, conn: socket.socket, requester_ip: str, request: dict):
+        """Serve the files of a FILE_BATCH_REQ back to back. Files of up to
+        PACK_BYTES are buffered together with their headers and go out in as
+        few sends as possible, so many small files cost about as much as one
+        big one instead of a connection and a round trip each."""
+        accepted = [a for a in request.get("hashes", []) if a in ALGORITHMS]
+        files = request.get("files", [])[:MAX_BATCH_FILES]
+        self.LOG.debug("Batch of %d files for %s", len(files), requester_ip)
+        sizer = AdaptiveSizer(self._chunk_size, self._buffer_size)
+        sizer.apply_buffer(conn, socket.SO_SNDBUF)
+        pack = bytearray()
+        for file_id, offset in files:
+            if not self._running:
+                return
+            file_id, offset = str(file_id), int(offset)
+            self.transfer_started.emit(file_id, requester_ip)
+            target = self._find(file_id)
+            if target is None or not accepted:
+                self.LOG.warning("Cannot serve %s to %s", file_id, requester_ip)
+                pack += encode_message(make_file_error("not found" if target is None else "no common hash algorithm",
+                                                       file_id))
+                continue
+            try:
+                snap = self.snapshots.acquire(target)
+            except OSError as e:
+                pack += encode_message(make_file_error(str(e), file_id))
+                continue
+            try:
+                algorithm, digest = self._digest(snap, target, accepted)
+                complete = len(pack)  # the files packed so far, all whole
+                pack += encode_message(make_file_header(snap.size, algorithm, digest, file_id))
+                with open(snap.path, "rb") as f:
+                    if snap.size - offset <= PACK_BYTES:
+                        f.seek(offset)
+                        data = f.read(snap.size - offset)
+                        if len(data) != max(0, snap.size - offset):
+                            # the header promised more and the rest of the stream would be
+                            # misread, so the connection ends after the files before this one
+                            conn.sendall(pack[:complete])
+                            raise OSError(f"{target.filename} shrank while being served")
+                        if self._bandwidth:
+                            self._bandwidth.throttle(UPLOAD, requester_ip, len(data))
+                        pack += data
+                        BYTES_SENT.inc(len(data))
+                    else:
+                        conn.sendall(pack)
+                        pack.clear()
+                        with mapped_view(f, snap.size if snap.owned else 0) as view:
+                            sent = self._send_range(conn, f, view, file_id, requester_ip, offset, snap.size, sizer)
+                        if sent < snap.size - offset:
+                            if not self._running:
+                                return
+                            raise OSError(f"{target.filename} shrank while being served")
+            finally:
+                self.snapshots.release(snap)
+            if len(pack) >= PACK_BYTES:
+                conn.sendall(pack)
+                pack.clear()
+        conn.sendall(pack)
+        self.LOG.debug("Batch complete for %s", requester_ip)
+
+    def _find(self, file_id: str) -> SharedFile | None:
+        """The shared file `file_id`, if it still exists on disk."""
+        for f in self._get_shared_files():
+            if f.file_id == file_id:
+                return f if f.file_path and os.path.isfile(f.file_path) else None
+        return None
+
+    def _digest(self, snap: Snapshot, target: SharedFile, accepted: list[str]) -> tuple[str, bytes]:
+        """The algorithm to use for a snapshot of `target`, and its digest in it."""
+        # a digest that is already cached beats hashing again in the requester's first choice
+        algorithm = next(
+            (a for a in accepted if a in snap.digests or target.cached_digest(a) is not None), accepted[0],
+        )
+        hash_start = time.perf_counter()
+        digest = self.snapshots.digest(snap, target, algorithm, self._get_digest)
+        HASH_SECONDS.observe(time.perf_counter() - hash_start)
+        return algorithm, digest
+
+    def _send_probe(self, conn: socket.socket, requester_ip: str, nbytes: int):
+        """Filler bytes for a peer's throughput sample, under the same upload limits as files."""
+        chunk = bytes(min(nbytes, 65536))
+        sent = 0
+        while sent < nbytes and self._running:
+            n = min(len(chunk), nbytes - sent)
+            if self._bandwidth:
+                self._bandwidth.throttle(UPLOAD, requester_ip, n)
+            conn.sendall(chunk[:n])
+            sent += n
+
+    def _send_range(self, conn: socket.socket, f, view: memoryview | None, file_id: str,
+                    requester_ip: str, pos: int, end: int, sizer: AdaptiveSizer) -> int:
+        """Send bytes [pos, end) of the file, as slices of `view` when the
+        file is mapped (no copy into Python bytes), else with sendfile()
+        from `f` (no copy through Python at all). Returns the bytes sent:
+        fewer if the file shrank or the server is stopping, and the caller
+        must then end the connection rather than send anything after them."""
+        start = pos
+        bandwidth = self._bandwidth
+        # checked once, so disabled metrics add nothing per chunk; otherwise
+        # the disk reads happen inside sendall (page faults) or sendfile
+        timed = metrics.enabled() and view is None
+        if timed:
+            f.seek(pos)
+        while pos < end and self._running:
+            n = min(sizer.chunk_size, end - pos)
+            if bandwidth:
+                bandwidth.throttle(UPLOAD, requester_ip, n)
+            if view is not None:
+                conn.sendall(view[pos:pos + n])
+            elif timed:
+                read_start = time.perf_counter()
+                chunk = f.read(n)
+                DISK_READ_SECONDS.observe(time.perf_counter() - read_start)
                 conn.sendall(chunk)
-                remaining -= len(chunk)
-        _log(self.LOG, f"Serve complete: {file_id}")
+                n = len(chunk)
+            else:
+                n = conn.sendfile(f, pos, n)
+            if not n:
+                break  # the file is shorter than it was
+            BYTES_SENT.inc(n)
+            pos += n
+            if sizer.record(n):
+                sizer.apply_buffer(conn, socket.SO_SNDBUF)
+                if self.LOG.isEnabledFor(logging.DEBUG):
+                    self.LOG.debug("Tuned %s: %s", file_id, sizer.stats())
+        return pos - start
 
     def stop(self):
-        _log(self.LOG, "stop() called")
+        self.LOG.debug("stop() called")
         self._running = False
         if self._server_sock:
             try:
                 self._server_sock.close()
-                _log(self.LOG, "Server socket closed")
+                self.LOG.debug("Server socket closed")
             except OSError as e:
-                _log(self.LOG, f"Server socket close error: {e}")
-        _log(self.LOG, "Waiting for thread...")
-        if not self.wait(3000):
-            _log(self.LOG, "Thread did not stop in 3s, terminating")
-            self.terminate()
-            self.wait(1000)
-        _log(self.LOG, "stop() done")
+                self.LOG.debug("Server socket close error: %s", e)
+        self.LOG.debug("Waiting for thread...")
+        if not self.wait(3.0):
+            self.LOG.warning("Thread did not stop in 3s, abandoning daemon thread")
+        self.snapshots.close()
+        self.LOG.debug("stop() done")
 
 
-class FileDownloadTask(QThread):
+class FileDownloadTask(ServiceThread):
     """Downloads a file from a peer."""
 
-    progress = Signal(str, int, int)  # file_id, bytes_downloaded, total_bytes
-    completed = Signal(str, str)  # file_id, saved_path
-    failed = Signal(str, str)  # file_id, error_message
-    cancelled_signal = Signal(str)  # file_id
-
-    LOG = "[Download]"
-
-    def __init__(self, file_id: str, filename: str, peer_ip: str, save_dir: str, offset: int = 0, parent=None):
-        super().__init__(parent)
+    LOG = log.getChild("Download")
+
+    def __init__(
+        self, file_id: str, filename: str, peer_ip: str, save_dir: str, offset: int = 0,
+        bandwidth: BandwidthManager | None = None, chunk_size: int = 0, buffer_size: int = 0,
+        port: int = TRANSFER_PORT, hashes: list[str] | None = None, connect_timeout: float = 30.0,
+        fsync: str = FSYNC_FINAL,
+    ):
+        super().__init__(name=f"Download-{file_id}")
+        self.progress = Event()  # file_id, bytes_downloaded, total_bytes
+        self.completed = Event()  # file_id, saved_path
+        self.failed = Event()  # file_id, error_message
+        self.cancelled_signal = Event()  # file_id
+        self.stats = Event()  # file_id, AdaptiveSizer.stats()
         self.file_id = file_id
         self.filename = filename
         self.peer_ip = peer_ip
+        self.port = port
         self.save_dir = save_dir
         self.offset = offset
+        self.hashes = hashes  # acceptable algorithms, best first; None = legacy SHA-256 request
+        self.connect_timeout = connect_timeout  # shorter when a probe has just reached the peer
+        self.fsync = fsync  # app.core.staging fsync policy
+        self._staged: StagedDownload | None = None
+        self._bandwidth = bandwidth
+        self._sizer = AdaptiveSizer(chunk_size, buffer_size)
         self._cancelled = False
 
     def cancel(self):
-        _log(self.LOG, f"cancel() called: {self.file_id}")
+        self.LOG.debug("cancel() called: %s", self.file_id)
         self._cancelled = True
 
     def run(self):
-        _log(self.LOG, f"Thread started: {self.file_id} from {self.peer_ip}")
-        save_path = os.path.join(self.save_dir, self.filename)
-        temp_path = save_path + ".part"
+        self.LOG.debug("Thread started: %s from %s", self.file_id, self.peer_ip)
+        DOWNLOADS_ACTIVE.inc()
+        try:
+            sock = self._connect()
+            with sock:
+                header = self._request(sock, self.offset, 0, self.hashes)
+                if header is None:
+                    self.failed.emit(self.file_id, "Failed to receive file header")
+                    self.LOG.warning("Failed to receive header for %s", self.file_id)
+                    return
+                if isinstance(header, str):
+                    self.failed.emit(self.file_id, header)
+                    self.LOG.warning("%s: %s", header, self.file_id)
+                    return
+                self._download(sock, *header)
+        except Exception as e:
+            self.failed.emit(self.file_id, str(e))
+            self.LOG.warning("Download of %s failed: %s", self.filename, e)
+        finally:
+            DOWNLOADS_ACTIVE.dec()
+
+        self.LOG.debug("Thread exiting")
 
+    def _download(self, sock: socket.socket, file_size: int, algorithm: str, expected_digest: bytes) -> bool:
+        """Receive the file whose header was just read from `sock`, verify it
+        and move it into place, emitting completed, failed or cancelled_signal.
+
+        Returns False if cancelled. Raises if the connection fails; the part
+        file is then kept for resuming.
+        """
+        verifier = None
+        discard = False  # a part file left by a dropped connection is kept for resuming
         try:
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.settimeout(30)
-            sock.connect((self.peer_ip, TRANSFER_PORT))
-            _log(self.LOG, f"Connected to {self.peer_ip}:{TRANSFER_PORT}")
+            sizer = self._sizer
+            self.LOG.info("Downloading %s (%d bytes) from %s", self.filename, file_size, self.peer_ip)
+            staged = self._staged = StagedDownload(self.save_dir, self.filename, self.file_id, file_size, self.fsync)
+            temp_path = staged.part_path
+            if merkle.is_tree(algorithm):
+                # blocks are checked on other threads as soon as they are complete on disk
+                verifier = merkle.BlockVerifier(temp_path, file_size, expected_digest, ALGORITHMS[algorithm])
 
-            sock.sendall(self.file_id.encode("ascii") + struct.pack("!Q", self.offset))
+            mode = "ab" if self.offset > 0 else "wb"
+            with open(temp_path, mode) as f:
+                received = self._receive(sock, f, self.offset, file_size, file_size, verifier, report=True)
+            if received is None:
+                discard = True
+                self.cancelled_signal.emit(self.file_id)
+                self.LOG.info("Cancelled: %s", self.filename)
+                return False
+            self.stats.emit(self.file_id, sizer.stats())
+
+            if verifier is not None:
+                verified = self._repair(temp_path, file_size, algorithm, expected_digest, verifier)
+                if verified is None:
+                    discard = True
+                    self.cancelled_signal.emit(self.file_id)
+                    self.LOG.info("Cancelled: %s", self.filename)
+                    return False
+            else:
+                hash_start = time.perf_counter()
+                verified = hash_file(temp_path, algorithm, mapped=True) == expected_digest  # our own part file
+                HASH_SECONDS.observe(time.perf_counter() - hash_start)
+
+            if not verified:
+                discard = True
+                self.failed.emit(self.file_id, "Checksum mismatch")
+                self.LOG.error("Checksum mismatch: %s", self.filename)
+                return True
 
+            save_path = staged.finalize()
+            self.completed.emit(self.file_id, save_path)
+            self.LOG.info("Completed: %s", save_path)
+            return True
+        finally:
+            if verifier is not None:
+                verifier.close()
+            if discard:
+                self._staged.discard()
+
+    def _connect(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sizer.apply_buffer(sock, socket.SO_RCVBUF)  # before connect so the window scale can use it
+        sock.settimeout(self.connect_timeout)
+        sock.connect((self.peer_ip, self.port))
+        sock.settimeout(30)
+        self.LOG.debug("Connected to %s:%d", self.peer_ip, self.port)
+        return sock
+
+    def _request(
+        self, sock: socket.socket, offset: int, length: int, hashes: list[str] | None, digest: bytes = b"",
+    ) -> tuple[int, str, bytes] | str | None:
+        """Send the file request and read the reply header.
+
+        Returns (size, algorithm, digest), an error message from the peer, or
+        None if the connection dropped. `length` 0 asks for the rest of the file;
+        `digest` asks for the version of the file with that digest.
+        """
+        if hashes is None:
+            sock.sendall(self.file_id.encode("ascii") + struct.pack("!Q", offset))
             header = _recv_exact(sock, 40)
             if not header:
-                self.failed.emit(self.file_id, "Failed to receive file header")
-                _log(self.LOG, "Failed to receive header")
-                return
-
+                return None
             file_size = struct.unpack("!Q", header[:8])[0]
-            if file_size == 0:
-                self.failed.emit(self.file_id, "File not found on peer")
-                _log(self.LOG, "File not found on peer")
-                return
-
-            expected_sha = header[8:40]
-            remaining = file_size - self.offset
-            downloaded = self.offset
-            _log(self.LOG, f"Downloading {file_size} bytes")
+            if file_size == 0:  # the legacy header cannot tell an empty file from a missing one
+                return "File not found on peer"
+            return file_size, LEGACY_ALGORITHM, header[8:40]
 
-            mode = "ab" if self.offset > 0 else "wb"
-            with open(temp_path, mode) as f:
-                while remaining > 0:
-                    if self._cancelled:
+        sock.sendall(XFER_MAGIC + encode_message(make_file_request(self.file_id, offset, hashes, length, digest)))
+        reply = recv_message(sock)
+        if not reply or reply.get("type") != "FILE_HDR":
+            return None
+        if "error" in reply:
+            return f"Peer refused: {reply['error']}"
+        if reply.get("hash") not in hashes:
+            return f"Peer chose unrequested hash {reply.get('hash')!r}"
+        return int(reply["size"]), reply["hash"], bytes.fromhex(reply["digest"])
+
+    def _receive(self, sock: socket.socket, f, pos: int, end: int, file_size: int,
+                 verifier: merkle.BlockVerifier | None, report: bool) -> int | None:
+        """Write bytes [pos, end) from `sock` to `f` (positioned at `pos`),
+        queueing each block on `verifier` once it is complete.
+
+        Returns the position reached, or None if the download was cancelled.
+        Progress is reported only when `report` is set, i.e. for the main
+        stream; a repair re-fetching a block (even the last one) would send
+        the progress bar backwards.
+        """
+        sizer = self._sizer
+        bandwidth = self._bandwidth
+        timed = metrics.enabled()
+        next_block = 0
+        while True:
+            if verifier is not None and report:
+                # whole blocks before `pos` (or the tail at the end) are on disk
+                while next_block < len(verifier) and min((next_block + 1) * verifier.block_size, file_size) <= pos:
+                    f.flush()
+                    verifier.submit(next_block)
+                    next_block += 1
+            if pos >= end:
+                break
+            if self._cancelled:
+                return None
+            chunk = sock.recv(min(sizer.chunk_size, end - pos))
+            if not chunk:
+                break
+            if bandwidth:
+                # pausing reads lets TCP flow control slow the sender down
+                bandwidth.throttle(DOWNLOAD, self.peer_ip, len(chunk))
+            if timed:
+                write_start = time.perf_counter()
+                f.write(chunk)
+                DISK_WRITE_SECONDS.observe(time.perf_counter() - write_start)
+            else:
+                f.write(chunk)
+            self._staged.wrote(f, len(chunk))
+            BYTES_RECEIVED.inc(len(chunk))
+            pos += len(chunk)
+            if report:
+                self.progress.emit(self.file_id, pos, file_size)
+            if sizer.record(len(chunk)):
+                sizer.apply_buffer(sock, socket.SO_RCVBUF)
+                self.stats.emit(self.file_id, sizer.stats())
+        return pos
+
+    def _repair(self, temp_path: str, file_size: int, algorithm: str, digest: bytes,
+                verifier: merkle.BlockVerifier) -> bool | None:
+        """Collect block verification results and fetch failed blocks again.
+
+        Returns whether every block verified, or None if cancelled.
+        """
+        if os.path.getsize(temp_path) < file_size:
+            return False  # the stream ended early; blocks past the end were never queued
+        bad = verifier.bad_blocks()
+        for attempt in range(REPAIR_ATTEMPTS):
+            if not bad:
+                return True
+            BLOCKS_REFETCHED.inc(len(bad))
+            self.LOG.warning("%d bad blocks in %s, fetching again (attempt %d)", len(bad), self.filename, attempt + 1)
+            with open(temp_path, "r+b") as f:
+                for index in bad:
+                    start = index * verifier.block_size
+                    end = min(start + verifier.block_size, file_size)
+                    sock = self._connect()
+                    try:
+                        header = self._request(sock, start, end - start, [algorithm], digest)
+                        if header != (file_size, algorithm, digest):
+                            self.LOG.warning("Peer's copy of %s changed: %s", self.filename, header)
+                            return False
+                        f.seek(start)
+                        if self._receive(sock, f, start, end, file_size, None, report=False) is None:
+                            return None
+                    finally:
                         sock.close()
-                        self.cancelled_signal.emit(self.file_id)
-                        _log(self.LOG, "Cancelled")
-                        return
-                    to_recv = min(CHUNK_SIZE, remaining)
-                    chunk = sock.recv(to_recv)
-                    if not chunk:
-                        break
-                    f.write(chunk)
-                    downloaded += len(chunk)
-                    remaining -= len(chunk)
-                    self.progress.emit(self.file_id, downloaded, file_size)
-
-            sock.close()
-
-            sha = hashlib.sha256()
-            with open(temp_path, "rb") as f:
-                while True:
-                    chunk = f.read(CHUNK_SIZE)
-                    if not chunk:
-                        break
-                    sha.update(chunk)
-
-            if sha.digest() != expected_sha:
-                self.failed.emit(self.file_id, "Checksum mismatch")
-                _log(self.LOG, "Checksum mismatch")
-                return
+            for index in bad:
+                verifier.submit(index)
+            bad = verifier.bad_blocks()
+        return not bad
+
+
+class BatchDownloadTask(FileDownloadTask):
+    """Downloads several files from one peer over a single connection with
+    one FILE_BATCH_REQ; the peer sends them back to back.
+
+    Reports through the same events as FileDownloadTask, for each file_id.
+    Needs a peer with FEATURE_BATCH and a list of acceptable `hashes`.
+    """
+
+    LOG = log.getChild("BatchDownload")
+
+    def __init__(
+        self, files: list[tuple[str, str]], peer_ip: str, save_dir: str, hashes: list[str],
+        bandwidth: BandwidthManager | None = None, chunk_size: int = 0, buffer_size: int = 0,
+        port: int = TRANSFER_PORT, connect_timeout: float = 30.0, fsync: str = FSYNC_FINAL,
+    ):
+        file_id, filename = files[0]
+        super().__init__(
+            file_id, filename, peer_ip, save_dir, bandwidth=bandwidth, chunk_size=chunk_size,
+            buffer_size=buffer_size, port=port, hashes=hashes, connect_timeout=connect_timeout, fsync=fsync,
+        )
+        self.name = f"BatchDownload-{file_id}+{len(files) - 1}"
+        self.files = files[:MAX_BATCH_FILES]  # (file_id, filename), in the order requested
+        self._skipped: set[str] = set()  # cancelled files
+        self._cancel_all = False
+
+    def cancel(self, file_id: str = ""):
+        """Cancel one file of the batch, or all of them."""
+        self.LOG.debug("cancel() called: %s", file_id or "all")
+        if not file_id:
+            self._cancel_all = True
+        self._skipped.add(file_id)
+        if not file_id or file_id == self.file_id:
+            self._cancelled = True
 
-            if os.path.exists(save_path):
-                base, ext = os.path.splitext(save_path)
-                i = 1
-                while os.path.exists(f"{base}_{i}{ext}"):
-                    i += 1
-                save_path = f"{base}_{i}{ext}"
+    def run(self):
+        self.LOG.debug("Thread started: %d files from %s", len(self.files), self.peer_ip)
+        DOWNLOADS_ACTIVE.inc()
+        try:
+            pending = self.files
+            while pending:
+                pending = self._fetch(pending)
+        finally:
+            DOWNLOADS_ACTIVE.dec()
+        self.LOG.debug("Thread exiting")
+
+    def _fetch(self, batch: list[tuple[str, str]]) -> list[tuple[str, str]]:
+        """Request `batch` on a new connection and receive it. Returns the
+        files still to fetch when a cancellation cut the stream short."""
+        for i, (file_id, _) in enumerate(batch):
+            if not (self._cancel_all or file_id in self._skipped):
+                break
+            self.cancelled_signal.emit(file_id)
+        else:
+            return []
+        batch = batch[i:]
+        try:
+            sock = self._connect()
+        except OSError as e:
+            self._fail(batch, str(e))
+            return []
+        with sock:
+            request = make_file_batch_request([(file_id, 0) for file_id, _ in batch], self.hashes)
+            sock.sendall(XFER_MAGIC + encode_message(request))
+            for i, (file_id, filename) in enumerate(batch):
+                self.file_id, self.filename = file_id, filename
+                self._cancelled = self._cancel_all or file_id in self._skipped
+                if self._cancelled:
+                    # its bytes are already on the way; ask again for the rest instead
+                    return batch[i:]
+                try:
+                    reply = recv_message(sock)
+                    if not reply or reply.get("type") != "FILE_HDR" or reply.get("file_id") != file_id:
+                        raise ConnectionError("Failed to receive file header")
+                    if "error" in reply:
+                        self.failed.emit(file_id, f"Peer refused: {reply['error']}")
+                        self.LOG.warning("Peer refused %s: %s", filename, reply["error"])
+                        continue
+                    if reply.get("hash") not in self.hashes:
+                        raise ConnectionError(f"Peer chose unrequested hash {reply.get('hash')!r}")
+                    done = self._download(sock, int(reply["size"]), reply["hash"], bytes.fromhex(reply["digest"]))
+                except Exception as e:
+                    # the rest of the stream is lost with this file
+                    self.LOG.warning("Batch download from %s failed at %s: %s", self.peer_ip, filename, e)
+                    self._fail(batch[i:], str(e))
+                    return []
+                if not done:
+                    return batch[i + 1:]
+        return []
+
+    def _fail(self, files: list[tuple[str, str]], error: str):
+        for file_id, _ in files:
+            self.failed.emit(file_id, error)
+
+
+# ── Range reads ───────────────────────────────────────────────
+
+def open_range(
+    peer_ip: str, file_id: str, offset: int = 0, length: int = 0, port: int = TRANSFER_PORT,
+    connect_timeout: float = 10.0,
+) -> tuple[socket.socket, int, int]:
+    """Ask a peer for bytes [offset, offset + length) of a file (to its end if
+    `length` is 0), unverified and without saving anything.
+
+    Returns the connected socket, positioned at the first byte, the file's
+    size and how many bytes follow. Raises OSError; ConnectionError if the
+    peer refuses.
+    """
+    sock = socket.create_connection((peer_ip, port), timeout=connect_timeout)
+    try:
+        sock.settimeout(30)
+        request = make_file_request(file_id, offset, [LEGACY_ALGORITHM], length, verify=False)
+        sock.sendall(XFER_MAGIC + encode_message(request))
+        reply = recv_message(sock)
+        if not reply or reply.get("type") != "FILE_HDR":
+            raise ConnectionError("Failed to receive file header")
+        if "error" in reply:
+            raise ConnectionError(f"Peer refused: {reply['error']}")
+    except BaseException:
+        sock.close()
+        raise
+    size = int(reply["size"])
+    end = min(offset + length, size) if length else size
+    return sock, size, max(0, end - offset)
 
-            os.rename(temp_path, save_path)
-            self.completed.emit(self.file_id, save_path)
-            _log(self.LOG, f"Completed: {save_path}")
 
-        except Exception as e:
-            self.failed.emit(self.file_id, str(e))
-            _log(self.LOG, f"Error: {e}")
+def iter_range(sock: socket.socket, nbytes: int, peer_ip: str = "",
+               bandwidth: BandwidthManager | None = None) -> Iterator[bytes]:
+    """The `nbytes` bytes that follow open_range()'s reply, as they arrive."""
+    while nbytes > 0:
+        chunk = sock.recv(min(CHUNK_SIZE, nbytes))
+        if not chunk:
+            raise ConnectionError("Connection closed by peer")
+        if bandwidth:
+            bandwidth.throttle(DOWNLOAD, peer_ip, len(chunk))
+        BYTES_RECEIVED.inc(len(chunk))
+        nbytes -= len(chunk)
+        yield chunk
 
-        _log(self.LOG, "Thread exiting")
 
+def read_range(peer_ip: str, file_id: str, offset: int, length: int, port: int = TRANSFER_PORT,
+               bandwidth: BandwidthManager | None = None) -> tuple[bytes, int]:
+    """Bytes [offset, offset + length) of a peer's file in memory, and the file's size."""
+    sock, size, nbytes = open_range(peer_ip, file_id, offset, length, port)
+    with sock:
+        return b"".join(iter_range(sock, nbytes, peer_ip, bandwidth)), size
 
-class ControlServer(QThread):
-    """TCP server for control messages (file lists, chat)."""
 
-    file_list_received = Signal(str, str, list)  # hostname, ip, files (list of dicts)
-    chat_received = Signal(dict)  # raw chat message dict
+class RangeReadTask(ServiceThread):
+    """Reads a bounded range of a peer's file into memory, e.g. for a preview."""
 
-    LOG = "[ControlServer]"
+    LOG = log.getChild("RangeRead")
 
-    def __init__(self, port: int, parent=None):
-        super().__init__(parent)
+    def __init__(self, file_id: str, peer_ip: str, offset: int = 0, length: int = 0,
+                 bandwidth: BandwidthManager | None = None, port: int = TRANSFER_PORT):
+        super().__init__(name=f"RangeRead-{file_id}")
+        self.finished = Event()  # file_id, data, file_size
+        self.failed = Event()  # file_id, error_message
+        self.file_id = file_id
+        self.peer_ip = peer_ip
+        self.offset = offset
+        self.length = length
+        self.port = port
+        self._bandwidth = bandwidth
+
+    def run(self):
+        try:
+            data, size = read_range(self.peer_ip, self.file_id, self.offset, self.length, self.port, self._bandwidth)
+        except OSError as e:
+            self.LOG.warning("Range read of %s from %s failed: %s", self.file_id, self.peer_ip, e)
+            self.failed.emit(self.file_id, str(e))
+            return
+        self.LOG.debug("Read %d bytes of %s from %s", len(data), self.file_id, self.peer_ip)
+        self.finished.emit(self.file_id, data, size)
+
+    def stop(self):
+        pass  # bounded, and the result is simply dropped if nobody listens any more
+
+
+class ControlServer(ServiceThread):
+    """TCP server for control messages (file lists, chat)."""
+
+    LOG = log.getChild("ControlServer")
+
+    def __init__(self, port: int):
+        super().__init__()
+        self.file_list_received = Event()  # hostname, ip, files (list of dicts)
+        self.file_list_page_received = Event()  # ip, raw FILE_LIST_PAGE message dict
+        self.chat_received = Event()  # raw chat message dict
+        self.chat_sync_requested = Event()  # ip, raw CHAT_SYNC message dict
+        self.chat_history_received = Event()  # raw CHAT_HISTORY message dict
+        self.file_delta_received = Event()  # ip, raw FILE_DELTA message dict
+        self.file_list_sync_requested = Event()  # ip, raw FILE_LIST_SYNC message dict
         self._port = port
         self._running = False
         self._server_sock: socket.socket | None = None
 
     def run(self):
-        _log(self.LOG, "Thread started")
+        self.LOG.debug("Thread started")
         self._running = True
         self._server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self._server_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         self._server_sock.bind(("", self._port))
         self._server_sock.listen(10)
         self._server_sock.settimeout(1.0)
-        _log(self.LOG, f"Listening on TCP port {self._port}")
+        self.LOG.info("Listening on TCP port %d", self._port)
 
         while self._running:
             try:
@@ -259,61 +786,91 @@ class ControlServer(QThread):
             except socket.timeout:
                 continue
             except OSError as e:
-                _log(self.LOG, f"Accept error (likely closed): {e}")
+                self.LOG.debug("Accept error (likely closed): %s", e)
                 break
-            try:
-                self._handle_connection(conn, addr[0])
-            except Exception as e:
-                _log(self.LOG, f"Handle error: {e}")
-            finally:
-                conn.close()
+            # connections may stream many messages, so each gets its own thread
+            threading.Thread(
+                target=self._serve_connection, args=(conn, addr[0]), daemon=True,
+            ).start()
 
-        _log(self.LOG, "Loop exited")
+        self.LOG.debug("Loop exited")
         try:
             self._server_sock.close()
         except OSError:
             pass
-        _log(self.LOG, "Thread exiting")
+        self.LOG.debug("Thread exiting")
+
+    def _serve_connection(self, conn: socket.socket, ip: str):
+        CONTROL_CONNECTIONS.inc()
+        CONTROL_ACTIVE.inc()
+        try:
+            conn.settimeout(30)
+            self._handle_connection(conn, ip)
+        except Exception as e:
+            self.LOG.warning("Handle error for %s: %s", ip, e)
+        finally:
+            CONTROL_ACTIVE.dec()
+            conn.close()
 
     def _handle_connection(self, conn: socket.socket, ip: str):
-        from app.network.protocol import recv_message
-        msg = recv_message(conn)
-        if not msg:
-            _log(self.LOG, f"Empty message from {ip}")
-            return
-        msg_type = msg.get("type")
-        _log(self.LOG, f"Received {msg_type} from {ip}")
-        if msg_type == "FILE_LIST":
-            files = msg.get("files", [])
-            self.file_list_received.emit(msg["hostname"], ip, files)
-        elif msg_type == "CHAT":
-            self.chat_received.emit(msg)
+        received = 0
+        while self._running:
+            msg = recv_message(conn)
+            if not msg:
+                break
+            received += 1
+            CONTROL_MESSAGES.inc()
+            msg_type = msg.get("type")
+            self.LOG.debug("Received %s from %s", msg_type, ip)
+            if msg_type == "FILE_LIST":
+                files = msg.get("files", [])
+                self.file_list_received.emit(msg["hostname"], ip, files)
+            elif msg_type == "FILE_LIST_PAGE":
+                self.file_list_page_received.emit(ip, msg)
+            elif msg_type == "CHAT":
+                self.chat_received.emit(msg)
+            elif msg_type == "CHAT_SYNC":
+                self.chat_sync_requested.emit(ip, msg)
+            elif msg_type == "CHAT_HISTORY":
+                self.chat_history_received.emit(msg)
+            elif msg_type == "FILE_DELTA":
+                self.file_delta_received.emit(ip, msg)
+            elif msg_type == "FILE_LIST_SYNC":
+                self.file_list_sync_requested.emit(ip, msg)
+        if not received:
+            self.LOG.debug("Empty message from %s", ip)
 
     def stop(self):
-        _log(self.LOG, "stop() called")
+        self.LOG.debug("stop() called")
         self._running = False
         if self._server_sock:
             try:
                 self._server_sock.close()
-                _log(self.LOG, "Server socket closed")
+                self.LOG.debug("Server socket closed")
             except OSError as e:
-                _log(self.LOG, f"Server socket close error: {e}")
-        _log(self.LOG, "Waiting for thread...")
-        if not self.wait(3000):
-            _log(self.LOG, "Thread did not stop in 3s, terminating")
-            self.terminate()
-            self.wait(1000)
-        _log(self.LOG, "stop() done")
+                self.LOG.debug("Server socket close error: %s", e)
+        self.LOG.debug("Waiting for thread...")
+        if not self.wait(3.0):
+            self.LOG.warning("Thread did not stop in 3s, abandoning daemon thread")
+        self.LOG.debug("stop() done")
 
 
-def send_to_peer(ip: str, port: int, msg: dict):
+def send_to_peer(ip: str, port: int, msg: dict, binary: bool = False):
     """Send a control message to a peer (fire-and-forget)."""
+    send_messages_to_peer(ip, port, [msg], binary)
+
+
+def send_messages_to_peer(ip: str, port: int, msgs, binary: bool = False):
+    """Send a sequence of control messages over one connection (fire-and-forget).
+
+    `msgs` may be a generator, so pages are encoded one at a time as they are sent.
+    """
     try:
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(5)
         sock.connect((ip, port))
-        from app.network.protocol import send_message
-        send_message(sock, msg)
+        for msg in msgs:
+            send_message(sock, msg, binary)
         sock.close()
     except OSError:
         pass
@@ -0,0 +1,65 @@
+"""Batched delivery of control messages to peers.
+
+send() only queues. A sender thread waits BATCH_DELAY for a burst to
+accumulate, then sends everything queued for a peer over one connection,
+with the peers handled in parallel. This replaces a blocking connect per
+message per peer on the caller's (GUI) thread, and an unreachable peer no
+longer delays the others.
+"""
+from __future__ import annotations
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.core import metrics
+from app.network.file_transfer import send_messages_to_peer
+
+BATCH_DELAY = 0.05  # seconds to wait for more messages before sending
+MAX_PARALLEL = 8  # peers sent to at once
+
+BATCHES_SENT = metrics.counter("subparty_outbox_batches_total", "Connections opened by the control outbox")
+MESSAGES_SENT = metrics.counter("subparty_outbox_messages_total", "Control messages sent through the outbox")
+
+
+class Outbox:
+    """Queues control messages per peer and flushes them in batches."""
+
+    def __init__(self):
+        # (ip, port, binary) -> messages in send order
+        self._queued: dict[tuple[str, int, bool], list[dict]] = {}
+        self._cond = threading.Condition()
+        self._running = True
+        self._pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL, thread_name_prefix="Outbox")
+        self._thread = threading.Thread(target=self._run, name="Outbox", daemon=True)
+        self._thread.start()
+
+    def send(self, ip: str, port: int, msg: dict, binary: bool = False):
+        with self._cond:
+            self._queued.setdefault((ip, port, binary), []).append(msg)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and not self._queued:
+                    self._cond.wait()
+                if not self._queued:
+                    return
+            # let a burst (a pasted paragraph, a broadcast to many peers) pile up
+            if self._running:
+                time.sleep(BATCH_DELAY)
+            with self._cond:
+                batches, self._queued = self._queued, {}
+            for (ip, port, binary), msgs in batches.items():
+                BATCHES_SENT.inc()
+                MESSAGES_SENT.inc(len(msgs))
+                self._pool.submit(send_messages_to_peer, ip, port, msgs, binary)
+
+    def stop(self):
+        """Hand off what is still queued, then stop the sender thread."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join(2.0)
+        self._pool.shutdown(wait=False)
@@ -0,0 +1,171 @@
+"""Background reachability and link quality probes of peers' transfer ports.
+
+Discovery only proves a peer's UDP HELLOs reach us; a firewall can still
+block its TCP transfer port, and a download would then sit in a 30 s
+connect timeout. Each watched peer is probed on a timer: the TCP connect
+time to its transfer port is the RTT estimate. Peers that advertise
+FEATURE_PROBE also send back a short throughput sample, but only on the
+first probe and then once the last sample is SAMPLE_INTERVAL old and our
+downloads are idle: a sample costs the peer upload bandwidth that real
+transfers share, and every node samples every peer.
+
+One failed connect is retried after RETRY_INTERVAL; a peer is reported
+unreachable only after FAILURES_UNREACHABLE in a row, since downloads
+from it are refused meanwhile. recheck() probes a peer right away.
+"""
+from __future__ import annotations
+
+import heapq
+import logging
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+from app.core import metrics
+from app.core.events import Event
+from app.network.protocol import TRANSFER_PORT, XFER_MAGIC, encode_message, make_probe
+from app.network.service import ServiceThread
+
+log = logging.getLogger(__name__)
+
+PROBE_INTERVAL = 30.0  # seconds between probes of one peer
+RETRY_INTERVAL = 5.0  # seconds before probing again after a failed connect
+FAILURES_UNREACHABLE = 2  # failed connects in a row that make a peer unreachable
+SAMPLE_INTERVAL = 600.0  # seconds before a throughput sample is taken again
+CONNECT_TIMEOUT = 3.0
+SAMPLE_BYTES = 1024 * 1024  # throughput sample size
+MAX_PARALLEL = 4
+
+PROBES = metrics.counter("subparty_probes_total", "Peer link probes run")
+PROBE_FAILURES = metrics.counter("subparty_probe_failures_total", "Peer link probes that could not connect")
+
+
+def probe(ip: str, port: int = TRANSFER_PORT, sample_bytes: int = 0) -> tuple[float, float]:
+    """Connect to a peer's transfer port and optionally time a sample download.
+
+    Returns (connect time in ms, bytes per second or 0.0 without a sample);
+    raises OSError if the port cannot be reached.
+    """
+    start = time.perf_counter()
+    with socket.create_connection((ip, port), timeout=CONNECT_TIMEOUT) as sock:
+        rtt_ms = (time.perf_counter() - start) * 1000
+        if not sample_bytes:
+            return rtt_ms, 0.0
+        sock.settimeout(CONNECT_TIMEOUT * 2)
+        sock.sendall(XFER_MAGIC + encode_message(make_probe(sample_bytes)))
+        buf = bytearray(65536)
+        received = 0
+        sample_start = time.perf_counter()
+        while received < sample_bytes:
+            n = sock.recv_into(buf)
+            if not n:
+                break
+            received += n
+        elapsed = time.perf_counter() - sample_start
+    return rtt_ms, received / elapsed if elapsed > 0 and received else 0.0
+
+
+class PeerProber(ServiceThread):
+    """Probes watched peers every PROBE_INTERVAL seconds (new ones right away).
+
+    `idle()` tells whether a stale throughput sample may be refreshed now;
+    without it the link is taken to be idle.
+    """
+
+    def __init__(self, port: int = TRANSFER_PORT, idle: Callable[[], bool] | None = None):
+        super().__init__()
+        self.probed = Event()  # ip, reachable, rtt_ms, bytes_per_second (0.0 when not sampled)
+        self._port = port
+        self._idle = idle
+        self._targets: dict[str, bool] = {}  # ip -> understands FEATURE_PROBE
+        self._sampled: dict[str, float] = {}  # ip -> monotonic time of its last throughput sample
+        self._failures: dict[str, int] = {}  # ip -> failed connects in a row
+        self._next: dict[str, float] = {}  # ip -> monotonic time of its next probe
+        self._due: list[tuple[float, str]] = []  # heap of (deadline, ip); entries not matching _next are stale
+        self._cond = threading.Condition()
+        self._running = False
+        self._pool = ThreadPoolExecutor(max_workers=MAX_PARALLEL, thread_name_prefix="Probe")
+
+    def watch(self, ip: str, sample: bool):
+        """Start probing `ip` now; `sample` if it understands FEATURE_PROBE."""
+        with self._cond:
+            self._targets[ip] = sample
+            self._schedule(ip, time.monotonic())
+            self._cond.notify()
+
+    def recheck(self, ip: str):
+        """Probe a watched peer now, e.g. before giving up on a download from it."""
+        with self._cond:
+            if ip in self._targets:
+                self._schedule(ip, time.monotonic())
+                self._cond.notify()
+
+    def forget(self, ip: str):
+        with self._cond:
+            self._targets.pop(ip, None)
+            self._next.pop(ip, None)
+            self._sampled.pop(ip, None)
+            self._failures.pop(ip, None)
+
+    def _schedule(self, ip: str, deadline: float):
+        # called with the lock held
+        self._next[ip] = deadline
+        heapq.heappush(self._due, (deadline, ip))
+
+    def run(self):
+        log.debug("Thread started")
+        self._running = True
+        while True:
+            with self._cond:
+                while self._running:
+                    now = time.monotonic()
+                    if self._due and self._due[0][0] <= now:
+                        break
+                    self._cond.wait(self._due[0][0] - now if self._due else None)
+                if not self._running:
+                    break
+                deadline, ip = heapq.heappop(self._due)
+                if self._next.get(ip) != deadline:
+                    continue  # forgotten or rescheduled since
+                now = time.monotonic()
+                last = self._sampled.get(ip)
+                sample = self._targets[ip] and (
+                    last is None or now - last >= SAMPLE_INTERVAL and (self._idle is None or self._idle())
+                )
+                self._schedule(ip, now + PROBE_INTERVAL)
+            self._pool.submit(self._probe, ip, sample)
+        log.debug("Thread exiting")
+
+    def _probe(self, ip: str, sample: bool):
+        PROBES.inc()
+        try:
+            rtt_ms, rate = probe(ip, self._port, SAMPLE_BYTES if sample else 0)
+        except OSError as e:
+            PROBE_FAILURES.inc()
+            log.debug("Probe of %s failed: %s", ip, e)
+            with self._cond:
+                if ip not in self._targets:
+                    return
+                failures = self._failures[ip] = self._failures.get(ip, 0) + 1
+                if failures < FAILURES_UNREACHABLE:
+                    self._schedule(ip, time.monotonic() + RETRY_INTERVAL)
+                    self._cond.notify()
+                    return
+            self.probed.emit(ip, False, 0.0, 0.0)
+            return
+        with self._cond:
+            self._failures.pop(ip, None)
+            if rate and ip in self._targets:
+                self._sampled[ip] = time.monotonic()
+        log.debug("Probe of %s: %.1f ms, %.0f B/s", ip, rtt_ms, rate)
+        self.probed.emit(ip, True, rtt_ms, rate)
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._pool.shutdown(wait=False, cancel_futures=True)
+        if not self.wait(3.0):
+            log.warning("Thread did not stop in 3s, abandoning daemon thread")
@@ -1,36 +1,84 @@
 """
 Sub Party Network Protocol
 
-All control messages are JSON, framed with 4-byte big-endian length prefix.
+All control messages are framed with a 4-byte big-endian length prefix.
+The payload is JSON, or the compact binary encoding from app.network.codec
+when the receiving peer advertised it in the "features" list of its HELLO.
 
 Message types:
-  HELLO      - UDP broadcast for discovery
+  HELLO      - UDP broadcast for discovery, with the version of the sender's file list
   BYE        - graceful disconnect
   FILE_LIST  - share file list with peers
-  CHAT       - chat message
-  FILE_REQ   - request file download
+  FILE_LIST_PAGE - one page of a file list, streamed over a single connection
+  FILE_DELTA - changes to the sender's file list: new versions of files, removals
+  FILE_LIST_SYNC - ask a peer for its file list, or for what changed since a version
+  CHAT       - chat message, numbered ("seq") per sending run ("sender") for deduplication
+  CHAT_SYNC  - ask a peer for the chat messages sent since a timestamp
+  CHAT_HISTORY - reply to CHAT_SYNC: recent messages as compact rows
+  FILE_REQ   - request file download, listing acceptable integrity hashes
+  FILE_BATCH_REQ - request several files at once; they come back on the same
+               connection, one FILE_HDR (with its "file_id") and its bytes each
+  PROBE      - ask the transfer server for a short run of filler bytes (link test)
+  FILE_HDR   - transfer server's reply: size and digest in the chosen hash
+               (for a "-tree" hash, the per-block layer of its Merkle tree;
+               no digest for a range read, a FILE_REQ with "verify": false)
+
+FILE_REQ/FILE_HDR and PROBE travel on the transfer port behind XFER_MAGIC, and
+only to peers that advertised FEATURE_XFER or FEATURE_PROBE; older peers get
+the fixed 20-byte request and answer with a raw size + SHA-256 header.
 """
 from __future__ import annotations
 
 import json
+import logging
 import socket
 import struct
 from typing import Any
 
+from app.network import codec
+
+log = logging.getLogger(__name__)
+
 DISCOVERY_PORT = 37710
 CONTROL_PORT = 37711
 TRANSFER_PORT = 37712
 
 HEADER_SIZE = 4  # 4 bytes length prefix
-CHUNK_SIZE = 65536  # 64KB chunks for file transfer
-
-
-def encode_message(msg: dict[str, Any]) -> bytes:
-    data = json.dumps(msg, ensure_ascii=False).encode("utf-8")
+CHUNK_SIZE = 65536  # default transfer chunk until the link has been probed
+MAX_MESSAGE_SIZE = 10 * 1024 * 1024  # sanity limit for one control message
+MAX_PROBE_BYTES = 4 * 1024 * 1024  # largest PROBE sample a server sends
+FILE_LIST_PAGE_SIZE = 500  # files per FILE_LIST_PAGE message
+MAX_BATCH_FILES = 1000  # files per FILE_BATCH_REQ
+
+FEATURE_PAGES = "pages"
+FEATURE_XFER = "xfer2"  # FILE_REQ/FILE_HDR with hash negotiation on the transfer port
+FEATURE_CHAT_SYNC = "chatsync"  # CHAT seq numbers and CHAT_SYNC/CHAT_HISTORY
+FEATURE_PROBE = "probe"  # PROBE throughput samples on the transfer port
+FEATURE_DELTA = "delta"  # FILE_DELTA updates instead of resending the whole list
+FEATURE_CATALOG = "catalog"  # manifest versions and FILE_LIST_SYNC; lists are pulled, not pushed
+FEATURE_BATCH = "batch"  # FILE_BATCH_REQ on the transfer port
+
+# optional protocol capabilities this build understands, advertised in HELLO
+FEATURES = [
+    codec.FEATURE, FEATURE_PAGES, FEATURE_XFER, FEATURE_CHAT_SYNC, FEATURE_PROBE, FEATURE_DELTA, FEATURE_CATALOG,
+    FEATURE_BATCH,
+]
+
+# opens a negotiated transfer request; a legacy request starts with an ASCII file id
+XFER_MAGIC = b"\x00SPX"
+
+
+def encode_message(msg: dict[str, Any], binary: bool = False) -> bytes:
+    if binary:
+        data = codec.encode(msg)
+    else:
+        data = json.dumps(msg, ensure_ascii=False).encode("utf-8")
     return struct.pack("!I", len(data)) + data
 
 
 def decode_message(data: bytes) -> dict[str, Any]:
+    if codec.is_binary(data):
+        return codec.decode(data)
     return json.loads(data.decode("utf-8"))
 
 
@@ -39,16 +87,17 @@ def recv_message(sock: socket.socket) -> dict[str, Any] | None:
     if header is None:
         return None
     length = struct.unpack("!I", header)[0]
-    if length > 10 * 1024 * 1024:  # 10MB sanity limit for control messages
+    if length > MAX_MESSAGE_SIZE:
+        log.warning("Dropping oversized message (%d bytes)", length)
         return None
     data = _recv_exact(sock, length)
     if data is None:
         return None
-    return json.loads(data.decode("utf-8"))
+    return decode_message(data)
 
 
-def send_message(sock: socket.socket, msg: dict[str, Any]):
-    sock.sendall(encode_message(msg))
+def send_message(sock: socket.socket, msg: dict[str, Any], binary: bool = False):
+    sock.sendall(encode_message(msg, binary))
 
 
 def _recv_exact(sock: socket.socket, n: int) -> bytes | None:
@@ -64,8 +113,11 @@ def _recv_exact(sock: socket.socket, n: int) -> bytes | None:
     return bytes(buf)
 
 
-def make_hello(hostname: str, control_port: int) -> dict:
-    return {"type": "HELLO", "hostname": hostname, "control_port": control_port}
+def make_hello(hostname: str, control_port: int, manifest: str = "") -> dict:
+    return {
+        "type": "HELLO", "hostname": hostname, "control_port": control_port, "features": FEATURES,
+        "manifest": manifest,
+    }
 
 
 def make_bye(hostname: str) -> dict:
@@ -76,9 +128,107 @@ def make_file_list(hostname: str, files: list[dict]) -> dict:
     return {"type": "FILE_LIST", "hostname": hostname, "files": files}
 
 
-def make_chat(hostname: str, ip: str, text: str, timestamp: float) -> dict:
-    return {"type": "CHAT", "hostname": hostname, "ip": ip, "text": text, "timestamp": timestamp}
-
-
-def make_file_request(file_id: str, offset: int = 0) -> dict:
-    return {"type": "FILE_REQ", "file_id": file_id, "offset": offset}
+def make_file_list_page(
+    hostname: str, version: int, cursor: int, next_cursor: int | None, total: int, files: list[dict],
+) -> dict:
+    return {
+        "type": "FILE_LIST_PAGE", "hostname": hostname, "version": version,
+        "cursor": cursor, "next_cursor": next_cursor, "total": total, "files": files,
+    }
+
+
+def iter_file_list_pages(hostname: str, version: int, files: list[dict], page_size: int = FILE_LIST_PAGE_SIZE):
+    """Split a file list into FILE_LIST_PAGE messages.
+
+    `cursor` is the index of the page's first file and `next_cursor` is None on
+    the last page. An empty list still yields one (empty) page so the receiver
+    clears what it had.
+    """
+    total = len(files)
+    for cursor in range(0, max(total, 1), page_size):
+        end = cursor + page_size
+        yield make_file_list_page(hostname, version, cursor, end if end < total else None, total, files[cursor:end])
+
+
+def make_file_delta(
+    hostname: str, changed: list[dict], removed: list[str], base: str = "", version: str = "",
+) -> dict:
+    """`changed` are full entries (as in FILE_LIST) of new or updated files,
+    `removed` the ids of files no longer shared; the delta turns manifest
+    version `base` of the list into `version`."""
+    return {
+        "type": "FILE_DELTA", "hostname": hostname, "changed": changed, "removed": removed,
+        "base": base, "version": version,
+    }
+
+
+def make_file_list_sync(hostname: str, control_port: int, version: str) -> dict:
+    """Answered with a FILE_DELTA from `version`, or the full list as pages
+    if `version` is empty or too old."""
+    return {
+        "type": "FILE_LIST_SYNC", "hostname": hostname, "control_port": control_port, "version": version,
+        "features": FEATURES,
+    }
+
+
+def make_chat(hostname: str, ip: str, text: str, timestamp: float, seq: int = 0, sender: str = "") -> dict:
+    msg = {"type": "CHAT", "hostname": hostname, "ip": ip, "text": text, "timestamp": timestamp, "seq": seq}
+    if sender:
+        msg["sender"] = sender
+    return msg
+
+
+def make_chat_sync(hostname: str, control_port: int, since: float) -> dict:
+    return {"type": "CHAT_SYNC", "hostname": hostname, "control_port": control_port, "since": since}
+
+
+def make_chat_history(hostname: str, rows: list[list], senders: list[str] | None = None) -> dict:
+    """`rows` are [hostname, ip, text, timestamp, seq] lists, oldest first, and
+    `senders` their sender ids; a separate list, since older peers unpack
+    rows of exactly five."""
+    msg = {"type": "CHAT_HISTORY", "hostname": hostname, "rows": rows}
+    if senders is not None:
+        msg["senders"] = senders
+    return msg
+
+
+def make_file_request(
+    file_id: str, offset: int = 0, hashes: list[str] | None = None, length: int = 0, digest: bytes = b"",
+    verify: bool = True,
+) -> dict:
+    """`hashes` are the integrity algorithms the requester accepts, most preferred first;
+    a nonzero `length` asks for just that many bytes from `offset` (e.g. to re-fetch a block),
+    and `digest` for the version of the file that digest was sent for, if the server still has it.
+    With `verify` False (a preview or stream) the server sends no digest and so need not hash
+    the file; servers that predate it send one anyway."""
+    msg = {"type": "FILE_REQ", "file_id": file_id, "offset": offset, "hashes": hashes or ["sha256"]}
+    if length:
+        msg["length"] = length
+    if digest:
+        msg["digest"] = digest.hex()
+    if not verify:
+        msg["verify"] = False
+    return msg
+
+
+def make_file_batch_request(files: list[tuple[str, int]], hashes: list[str]) -> dict:
+    """`files` are (file_id, offset) pairs, served in that order."""
+    return {"type": "FILE_BATCH_REQ", "files": [[fid, offset] for fid, offset in files], "hashes": hashes}
+
+
+def make_probe(nbytes: int) -> dict:
+    return {"type": "PROBE", "bytes": nbytes}
+
+
+def make_file_header(size: int, algorithm: str, digest: bytes, file_id: str = "") -> dict:
+    msg = {"type": "FILE_HDR", "size": size, "hash": algorithm, "digest": digest.hex()}
+    if file_id:  # which file of a batch follows
+        msg["file_id"] = file_id
+    return msg
+
+
+def make_file_error(error: str, file_id: str = "") -> dict:
+    msg = {"type": "FILE_HDR", "error": error}
+    if file_id:
+        msg["file_id"] = file_id
+    return msg
@@ -0,0 +1,100 @@
+"""Token-bucket bandwidth shaping shared by uploads and downloads."""
+from __future__ import annotations
+
+import threading
+import time
+
+from app.core import metrics
+
+UPLOAD = "up"
+DOWNLOAD = "down"
+
+THROTTLE_SECONDS = metrics.histogram("subparty_throttle_wait_seconds", "Sleeps imposed by bandwidth limits")
+
+
+class TokenBucket:
+    """Thread-safe token bucket measured in bytes per second.
+
+    Callers reserve bytes before sending them and sleep for the returned
+    delay outside the lock. Tokens may go negative, so concurrent transfers
+    queue behind each other's debt and each gets an equal share of the rate
+    as long as they reserve similar chunk sizes. A rate of 0 is unlimited.
+    """
+
+    def __init__(self, rate: float = 0, burst_seconds: float = 0.25):
+        self._lock = threading.Lock()
+        self._burst_seconds = burst_seconds
+        self._rate = 0.0
+        self._tokens = 0.0
+        self._stamp = time.monotonic()
+        self.set_rate(rate)
+
+    @property
+    def rate(self) -> float:
+        return self._rate
+
+    def set_rate(self, rate: float):
+        with self._lock:
+            self._rate = max(0.0, float(rate))
+            self._tokens = min(self._tokens, self._capacity())
+            self._stamp = time.monotonic()
+
+    def _capacity(self) -> float:
+        return self._rate * self._burst_seconds
+
+    def reserve(self, n: int) -> float:
+        """Take `n` bytes of budget and return how long to wait before using it."""
+        if not self._rate:
+            return 0.0
+        with self._lock:
+            rate = self._rate
+            if not rate:
+                return 0.0
+            now = time.monotonic()
+            self._tokens = min(self._capacity(), self._tokens + (now - self._stamp) * rate)
+            self._stamp = now
+            self._tokens -= n
+            return -self._tokens / rate if self._tokens < 0 else 0.0
+
+
+class BandwidthManager:
+    """Global and per-peer limits for each direction, adjustable at runtime."""
+
+    def __init__(self, upload: float = 0, download: float = 0, per_peer: float = 0):
+        self._global = {UPLOAD: TokenBucket(upload), DOWNLOAD: TokenBucket(download)}
+        self._per_peer_rate = float(per_peer)
+        self._peers: dict[tuple[str, str], TokenBucket] = {}  # (direction, ip) -> bucket
+        self._lock = threading.Lock()
+
+    def configure(self, upload: float, download: float, per_peer: float):
+        """Apply new limits in bytes per second (0 = unlimited) to all transfers."""
+        self._global[UPLOAD].set_rate(upload)
+        self._global[DOWNLOAD].set_rate(download)
+        with self._lock:
+            self._per_peer_rate = float(per_peer)
+            for bucket in self._peers.values():
+                bucket.set_rate(per_peer)
+
+    def _peer_bucket(self, direction: str, ip: str) -> TokenBucket:
+        key = (direction, ip)
+        bucket = self._peers.get(key)
+        if bucket is None:
+            with self._lock:
+                bucket = self._peers.setdefault(key, TokenBucket(self._per_peer_rate))
+        return bucket
+
+    def forget(self, ip: str):
+        """Drop the per-peer buckets of a peer that has left; a transfer
+        still running with it just starts a fresh one."""
+        with self._lock:
+            for direction in (UPLOAD, DOWNLOAD):
+                self._peers.pop((direction, ip), None)
+
+    def throttle(self, direction: str, ip: str, n: int):
+        """Block until `n` bytes may be transferred to/from `ip`."""
+        delay = self._global[direction].reserve(n)
+        if self._per_peer_rate:
+            delay = max(delay, self._peer_bucket(direction, ip).reserve(n))
+        if delay > 0:
+            THROTTLE_SECONDS.observe(delay)
+            time.sleep(delay)
@@ -0,0 +1,22 @@
+"""Base class for the networking core's background threads."""
+from __future__ import annotations
+
+import threading
+
+
+class ServiceThread(threading.Thread):
+    """A daemon thread with a QThread-style wait().
+
+    Subclasses implement run() and stop(). Threads are daemonic so a stuck
+    socket can never keep the process alive after shutdown.
+    """
+
+    def __init__(self, name: str | None = None):
+        super().__init__(name=name or type(self).__name__, daemon=True)
+
+    def wait(self, timeout: float | None = None) -> bool:
+        """Join the thread if it was started; True once it is no longer running."""
+        if self.ident is None:
+            return True
+        self.join(timeout)
+        return not self.is_alive()
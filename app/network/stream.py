@@ -0,0 +1,147 @@
+"""Loopback HTTP endpoint that streams peers' files with range support.
+
+    GET /<token>/<peer ip>/<file id>/<filename>
+
+Each request, and each Range in it, becomes an unverified range read from
+the peer (app.network.file_transfer.open_range), relayed as it arrives.
+A media player can seek in a peer's video without it being downloaded
+first. Binds to 127.0.0.1 only, on an ephemeral port; the random token in
+the path keeps other local users from using it as a proxy to the LAN.
+"""
+from __future__ import annotations
+
+import logging
+import mimetypes
+import os
+import re
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import quote, unquote
+
+from app.network.file_transfer import iter_range, open_range
+from app.network.protocol import TRANSFER_PORT
+from app.network.ratelimit import BandwidthManager
+from app.network.service import ServiceThread
+
+log = logging.getLogger(__name__)
+
+_RANGE = re.compile(r"bytes=(\d*)-(\d*)$")
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: _StreamHTTPServer
+
+    def do_HEAD(self):
+        self._stream(body=False)
+
+    def do_GET(self):
+        self._stream(body=True)
+
+    def _stream(self, body: bool):
+        parts = self.path.split("/", 4)
+        if len(parts) != 5 or parts[1] != self.server.token:
+            self._reply(404, "Not found\n")
+            return
+        peer_ip, file_id, filename = parts[2], parts[3], unquote(parts[4])
+        header = self.headers.get("Range", "")
+        m = _RANGE.match(header.strip())
+        if header and (not m or m.groups() == ("", "")):
+            m = None  # multiple or malformed ranges: RFC 9110 lets us send the whole file
+        first = int(m.group(1)) if m and m.group(1) else None
+        last = int(m.group(2)) if m and m.group(2) else None
+        try:
+            if first is None and last is not None or not body:
+                # a suffix range (or a HEAD) needs the size before the real request
+                probe, size, _ = open_range(peer_ip, file_id, 0, 1, self.server.port)
+                probe.close()
+                if first is None and last is not None:
+                    first, last = max(0, size - last), None
+            start = first or 0
+            length = last - start + 1 if last is not None and last >= start else 0
+            if body:
+                sock, size, nbytes = open_range(peer_ip, file_id, start, length, self.server.port)
+            else:
+                sock = None
+                end = min(start + length, size) if length else size
+                nbytes = max(0, end - start)
+        except OSError as e:
+            log.info("Cannot stream %s from %s: %s", file_id, peer_ip, e)
+            self._reply(502, f"{e}\n")
+            return
+
+        try:
+            if m and start >= size:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            self.send_response(206 if m else 200)
+            if m:
+                self.send_header("Content-Range", f"bytes {start}-{start + nbytes - 1}/{size}")
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Type", mimetypes.guess_type(filename)[0] or "application/octet-stream")
+            self.send_header("Content-Length", str(nbytes))
+            self.end_headers()
+            if sock:
+                for chunk in iter_range(sock, nbytes, peer_ip, self.server.bandwidth):
+                    self.wfile.write(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # players drop the connection whenever they seek
+        except OSError as e:
+            log.info("Stream of %s from %s ended: %s", file_id, peer_ip, e)
+        finally:
+            if sock:
+                sock.close()
+
+    def _reply(self, status: int, body: str):
+        data = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        log.debug("%s %s", self.address_string(), format % args)
+
+
+class _StreamHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    token = ""
+    port = TRANSFER_PORT
+    bandwidth: BandwidthManager | None = None
+
+
+class StreamServer(ServiceThread):
+    """Serves the stream endpoint on 127.0.0.1; the port is bound by start()."""
+
+    def __init__(self, bandwidth: BandwidthManager | None = None, port: int = TRANSFER_PORT):
+        super().__init__()
+        self.port = 0
+        self._transfer_port = port
+        self._bandwidth = bandwidth
+        self._token = os.urandom(12).hex()
+        self._httpd: _StreamHTTPServer | None = None
+
+    def start(self):
+        # bound here rather than in run() so url() works as soon as start() returns
+        self._httpd = _StreamHTTPServer(("127.0.0.1", 0), _Handler)
+        self._httpd.token = self._token
+        self._httpd.port = self._transfer_port
+        self._httpd.bandwidth = self._bandwidth
+        self.port = self._httpd.server_address[1]
+        log.info("Streaming endpoint on 127.0.0.1:%d", self.port)
+        super().start()
+
+    def url(self, peer_ip: str, file_id: str, filename: str) -> str:
+        return f"http://127.0.0.1:{self.port}/{self._token}/{peer_ip}/{file_id}/{quote(filename)}"
+
+    def run(self):
+        self._httpd.serve_forever(poll_interval=0.5)
+        self._httpd.server_close()
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+        if not self.wait(3.0):
+            log.warning("Thread did not stop in 3s, abandoning daemon thread")
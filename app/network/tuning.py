@@ -0,0 +1,87 @@
+"""Adaptive chunk and socket buffer sizing for file transfers."""
+from __future__ import annotations
+
+import socket
+import time
+
+from app.network.protocol import CHUNK_SIZE
+
+MIN_CHUNK = 16 * 1024
+MAX_CHUNK = 1024 * 1024
+MIN_BUFFER = 64 * 1024
+MAX_BUFFER = 8 * 1024 * 1024
+
+PROBE_SECONDS = 2.0  # how long to measure before picking sizes
+PROBE_BYTES = 64 * 1024 * 1024  # ...or stop early once this much has moved
+CHUNK_SECONDS = 0.01  # aim for ~10 ms of data per chunk
+BUFFER_SECONDS = 0.02  # ~20 ms of data in flight covers LAN round trips with headroom
+
+
+def _pow2_clamp(n: float, lo: int, hi: int) -> int:
+    size = lo
+    while size < n and size < hi:
+        size <<= 1
+    return size
+
+
+class AdaptiveSizer:
+    """Probes the link during the first seconds of a transfer and picks sizes.
+
+    A non-zero `chunk_size` or `buffer_size` is a fixed override (from
+    AppSettings) and is never changed by the probe.
+    """
+
+    def __init__(self, chunk_size: int = 0, buffer_size: int = 0):
+        self._fixed_chunk = chunk_size
+        self._fixed_buffer = buffer_size
+        self.chunk_size = chunk_size or CHUNK_SIZE
+        self.buffer_size = buffer_size  # 0 = OS default
+        self.throughput = 0.0  # bytes/s measured by the probe
+        self.probing = not (chunk_size and buffer_size)
+        self._start = 0.0
+        self._bytes = 0
+
+    def record(self, n: int) -> bool:
+        """Account `n` transferred bytes; returns True once when sizes are picked."""
+        if not self.probing:
+            return False
+        now = time.monotonic()
+        if not self._start:
+            self._start = now
+        self._bytes += n
+        elapsed = now - self._start
+        if elapsed < PROBE_SECONDS and self._bytes < PROBE_BYTES:
+            return False
+        self.probing = False
+        self.throughput = self._bytes / max(elapsed, 1e-3)
+        if not self._fixed_chunk:
+            self.chunk_size = _pow2_clamp(self.throughput * CHUNK_SECONDS, MIN_CHUNK, MAX_CHUNK)
+        if not self._fixed_buffer:
+            self.buffer_size = _pow2_clamp(self.throughput * BUFFER_SECONDS, MIN_BUFFER, MAX_BUFFER)
+        return True
+
+    def apply_buffer(self, sock: socket.socket, option: int):
+        """Set SO_SNDBUF/SO_RCVBUF on `sock`.
+
+        A fixed override is applied as is. Probed sizes only ever grow the
+        buffer past the OS default, since shrinking would disable kernel
+        autotuning without saving much memory.
+        """
+        if not self.buffer_size:
+            return
+        try:
+            if self._fixed_buffer or sock.getsockopt(socket.SOL_SOCKET, option) < self.buffer_size:
+                sock.setsockopt(socket.SOL_SOCKET, option, self.buffer_size)
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        throughput = self.throughput
+        if self.probing and self._start:
+            throughput = self._bytes / max(time.monotonic() - self._start, 1e-3)
+        return {
+            "chunk_size": self.chunk_size,
+            "buffer_size": self.buffer_size,
+            "throughput": throughput,
+            "probing": self.probing,
+        }
@@ -0,0 +1,42 @@
+from __future__ import annotations
+
+from PySide6.QtWidgets import QDialog, QDialogButtonBox, QFormLayout, QLabel, QSpinBox
+
+
+def _limit_box(value: int) -> QSpinBox:
+    box = QSpinBox()
+    box.setRange(0, 10_000_000)
+    box.setSuffix(" KB/s")
+    box.setSpecialValueText("Unlimited")
+    box.setSingleStep(100)
+    box.setValue(value)
+    return box
+
+
+class BandwidthDialog(QDialog):
+    """Edit upload/download/per-peer limits in KB/s (0 = unlimited)."""
+
+    def __init__(self, upload: int, download: int, per_peer: int, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Bandwidth Limits")
+
+        layout = QFormLayout(self)
+        self._upload = _limit_box(upload)
+        self._download = _limit_box(download)
+        self._per_peer = _limit_box(per_peer)
+        layout.addRow("Upload (all peers):", self._upload)
+        layout.addRow("Download (all peers):", self._download)
+        layout.addRow("Per peer, each direction:", self._per_peer)
+
+        hint = QLabel("Changes apply immediately to running transfers.")
+        hint.setStyleSheet("font-size: 11px; color: #a6adc8;")
+        layout.addRow(hint)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+
+    @property
+    def limits(self) -> tuple[int, int, int]:
+        return self._upload.value(), self._download.value(), self._per_peer.value()
@@ -1,12 +1,166 @@
 from __future__ import annotations
 
+import html
+import itertools
 import time
 
-from PySide6.QtCore import Qt, Signal
-from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTextEdit, QLineEdit, QPushButton
+from PySide6.QtCore import QAbstractListModel, QModelIndex, QSize, Qt, Signal
+from PySide6.QtGui import QTextDocument
+from PySide6.QtWidgets import (
+    QAbstractItemView, QHBoxLayout, QLabel, QLineEdit, QListView, QPushButton, QStyle, QStyledItemDelegate,
+    QVBoxLayout, QWidget,
+)
 
 from app.core.models import ChatMessage
 
+PAGE_SIZE = 200  # messages loaded from the store per scroll step
+MAX_ROWS = 1000  # messages held by the view; the rest stay on disk
+
+
+def _message_html(msg: ChatMessage) -> str:
+    ts = time.strftime("%H:%M", time.localtime(msg.timestamp))
+    if msg.system:
+        return f'<span style="color:#6c7086;">[{ts}] {html.escape(msg.text)}</span>'
+    return (
+        f'<span style="color:#89b4fa;">[{ts}]</span> '
+        f'<span style="color:#a6e3a1;font-weight:bold;">{html.escape(msg.sender_hostname)}</span>: '
+        f'{html.escape(msg.text)}'
+    )
+
+
+class ChatModel(QAbstractListModel):
+    """A window of at most MAX_ROWS messages over the ChatStore.
+
+    Older pages are loaded when the view scrolls to the top and newer ones
+    when it scrolls back down; whatever falls outside the window is dropped
+    and re-read from disk when needed.
+    """
+
+    KeyRole = Qt.UserRole + 1
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._store = None
+        self._rows: list[tuple[int, ChatMessage]] = []  # (row id, message), oldest first
+        self._at_tail = True  # the newest stored message is in the window
+        self._local_ids = itertools.count(-1, -1)  # keys for messages added before a store is attached
+
+    def set_store(self, store):
+        self.beginResetModel()
+        self._store = store
+        self._rows = store.before(None, PAGE_SIZE) + self._rows
+        self._at_tail = True
+        self.endResetModel()
+
+    @property
+    def at_tail(self) -> bool:
+        return self._at_tail
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self._rows)
+
+    def data(self, index: QModelIndex, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row_id, msg = self._rows[index.row()]
+        if role == Qt.DisplayRole:
+            return _message_html(msg)
+        if role == Qt.ToolTipRole:
+            return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(msg.timestamp))
+        if role == self.KeyRole:
+            return row_id
+        return None
+
+    def append(self, msg: ChatMessage) -> bool:
+        """Store and show a message; False if the store already had it."""
+        row_id = self._store.append(msg) if self._store else next(self._local_ids)
+        if row_id is None:
+            return False
+        if not self._at_tail:
+            return True  # scrolled back into history; load_newer() reads it from the store
+        row = len(self._rows)
+        self.beginInsertRows(QModelIndex(), row, row)
+        self._rows.append((row_id, msg))
+        self.endInsertRows()
+        self._trim_front()
+        return True
+
+    def load_older(self) -> int:
+        """Prepend the page before the window; returns how many rows were added."""
+        if not self._store or not self._rows:
+            return 0
+        older = self._store.before(self._rows[0][0], PAGE_SIZE)
+        if not older:
+            return 0
+        self.beginInsertRows(QModelIndex(), 0, len(older) - 1)
+        self._rows[:0] = older
+        self.endInsertRows()
+        excess = len(self._rows) - MAX_ROWS
+        if excess > 0:
+            self.beginRemoveRows(QModelIndex(), len(self._rows) - excess, len(self._rows) - 1)
+            del self._rows[-excess:]
+            self.endRemoveRows()
+            self._at_tail = False
+        return len(older)
+
+    def load_newer(self) -> int:
+        """Append the page after the window; returns how many rows were removed from the front."""
+        if self._at_tail or not self._store:
+            return 0
+        newer = self._store.after(self._rows[-1][0], PAGE_SIZE) if self._rows else []
+        if newer:
+            row = len(self._rows)
+            self.beginInsertRows(QModelIndex(), row, row + len(newer) - 1)
+            self._rows.extend(newer)
+            self.endInsertRows()
+        if len(newer) < PAGE_SIZE:
+            self._at_tail = True
+        return self._trim_front()
+
+    def _trim_front(self) -> int:
+        excess = len(self._rows) - MAX_ROWS
+        if excess <= 0:
+            return 0
+        self.beginRemoveRows(QModelIndex(), 0, excess - 1)
+        del self._rows[:excess]
+        self.endRemoveRows()
+        return excess
+
+
+class ChatDelegate(QStyledItemDelegate):
+    """Draws a message's rich text, word-wrapped to the view width."""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._doc = QTextDocument()
+        self._doc.setDocumentMargin(2)
+        self._heights: dict[tuple[int, int], int] = {}  # (row id, width) -> height
+
+    def _layout(self, index: QModelIndex, width: int) -> QTextDocument:
+        self._doc.setDefaultFont(self.parent().font())
+        self._doc.setHtml(index.data(Qt.DisplayRole))
+        self._doc.setTextWidth(width)
+        return self._doc
+
+    def paint(self, painter, option, index):
+        if option.state & QStyle.State_MouseOver:
+            painter.fillRect(option.rect, option.palette.alternateBase())
+        doc = self._layout(index, option.rect.width())
+        painter.save()
+        painter.translate(option.rect.topLeft())
+        doc.drawContents(painter)
+        painter.restore()
+
+    def sizeHint(self, option, index) -> QSize:
+        width = option.rect.width() or self.parent().viewport().width()
+        key = (index.data(ChatModel.KeyRole), width)
+        height = self._heights.get(key)
+        if height is None:
+            if len(self._heights) > 4 * MAX_ROWS:
+                self._heights.clear()  # widths from old window sizes
+            height = self._heights[key] = int(self._layout(index, width).size().height())
+        return QSize(width, height)
+
 
 class ChatWidget(QWidget):
     message_sent = Signal(str)  # text
@@ -20,8 +174,15 @@ class ChatWidget(QWidget):
         label.setObjectName("sectionLabel")
         layout.addWidget(label)
 
-        self._display = QTextEdit()
-        self._display.setReadOnly(True)
+        self._model = ChatModel(self)
+        self._display = QListView()
+        self._display.setObjectName("chatView")
+        self._display.setModel(self._model)
+        self._display.setItemDelegate(ChatDelegate(self._display))
+        self._display.setSelectionMode(QAbstractItemView.NoSelection)
+        self._display.setVerticalScrollMode(QAbstractItemView.ScrollPerItem)
+        self._display.setResizeMode(QListView.Adjust)  # re-wrap on resize
+        self._display.verticalScrollBar().valueChanged.connect(self._on_scrolled)
         layout.addWidget(self._display, 1)
 
         input_layout = QHBoxLayout()
@@ -36,6 +197,11 @@ class ChatWidget(QWidget):
 
         layout.addLayout(input_layout)
 
+    def set_store(self, store):
+        """Show history from `store` (a ChatStore) and record new messages in it."""
+        self._model.set_store(store)
+        self._display.scrollToBottom()
+
     def _send(self):
         text = self._input.text().strip()
         if not text:
@@ -43,16 +209,25 @@ class ChatWidget(QWidget):
         self._input.clear()
         self.message_sent.emit(text)
 
-    def add_message(self, msg: ChatMessage):
-        ts = time.strftime("%H:%M", time.localtime(msg.timestamp))
-        self._display.append(
-            f'<span style="color:#89b4fa;">[{ts}]</span> '
-            f'<span style="color:#a6e3a1;font-weight:bold;">{msg.sender_hostname}</span>: '
-            f'{msg.text}'
-        )
+    def add_message(self, msg: ChatMessage) -> bool:
+        """Show a message; False if it is a duplicate of one already in the history."""
+        bar = self._display.verticalScrollBar()
+        follow = self._model.at_tail and bar.value() >= bar.maximum()
+        added = self._model.append(msg)
+        if added and follow:
+            self._display.scrollToBottom()
+        return added
 
     def add_system_message(self, text: str):
-        ts = time.strftime("%H:%M")
-        self._display.append(
-            f'<span style="color:#6c7086;">[{ts}] {text}</span>'
-        )
+        self.add_message(ChatMessage(sender_hostname="", sender_ip="", text=text, system=True))
+
+    def _on_scrolled(self, value: int):
+        bar = self._display.verticalScrollBar()
+        if value == bar.minimum():
+            added = self._model.load_older()
+            if added:
+                bar.setValue(value + added)  # keep the same message at the top
+        elif value == bar.maximum() and not self._model.at_tail:
+            removed = self._model.load_newer()
+            if removed:
+                bar.setValue(max(0, value - removed))
@@ -7,7 +7,7 @@ import sys
 from PySide6.QtCore import Qt, Signal
 from PySide6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QLabel,
-    QScrollArea, QPushButton, QFrame,
+    QScrollArea, QPushButton, QFrame, QCheckBox,
 )
 
 from app.core.models import SharedFile
@@ -16,10 +16,13 @@ from app.core.models import SharedFile
 class FileItemWidget(QFrame):
     remove_clicked = Signal(str)  # file_id
     download_clicked = Signal(str, str, str)  # file_id, filename, owner_ip
+    preview_clicked = Signal(str, str, str)  # file_id, filename, owner_ip
+    selection_changed = Signal()
 
     def __init__(self, shared_file: SharedFile, is_mine: bool, parent=None):
         super().__init__(parent)
         self._file = shared_file
+        self.peer_ip = shared_file.owner_ip  # address the file list came from
         self.setFrameShape(QFrame.NoFrame)
 
         outer = QVBoxLayout(self)
@@ -30,6 +33,13 @@ class FileItemWidget(QFrame):
         layout = QHBoxLayout(content)
         layout.setContentsMargins(8, 8, 8, 8)
 
+        self._check: QCheckBox | None = None
+        if not is_mine:
+            self._check = QCheckBox()
+            self._check.setToolTip("Select for Download selected")
+            self._check.toggled.connect(lambda _: self.selection_changed.emit())
+            layout.addWidget(self._check)
+
         info_layout = QVBoxLayout()
         name_label = QLabel(shared_file.filename)
         name_label.setStyleSheet("font-weight: bold;")
@@ -51,6 +61,15 @@ class FileItemWidget(QFrame):
             btn.clicked.connect(lambda: self.remove_clicked.emit(shared_file.file_id))
             layout.addWidget(btn)
         else:
+            preview_btn = QPushButton("Preview")
+            preview_btn.setToolTip("Look inside, or stream it to a player, without downloading")
+            preview_btn.clicked.connect(
+                lambda: self.preview_clicked.emit(
+                    shared_file.file_id, shared_file.filename, shared_file.owner_ip
+                )
+            )
+            layout.addWidget(preview_btn)
+
             self._download_btn = QPushButton("Download")
             self._download_btn.setObjectName("downloadBtn")
             self._download_btn.clicked.connect(
@@ -74,6 +93,20 @@ class FileItemWidget(QFrame):
         separator.setFixedHeight(1)
         outer.addWidget(separator)
 
+    @property
+    def shared_file(self) -> SharedFile:
+        return self._file
+
+    def is_selected(self) -> bool:
+        return self._check is not None and self._check.isChecked()
+
+    def set_selected(self, selected: bool):
+        """Check or uncheck without emitting selection_changed, for changes made in bulk."""
+        if self._check is not None:
+            self._check.blockSignals(True)
+            self._check.setChecked(selected)
+            self._check.blockSignals(False)
+
     def show_open_folder(self, folder_path: str):
         """Show the Open folder button after download completes."""
         if hasattr(self, "_open_folder_btn"):
@@ -84,6 +117,8 @@ class FileItemWidget(QFrame):
 class FileListWidget(QWidget):
     file_removed = Signal(str)  # file_id
     download_requested = Signal(str, str, str)  # file_id, filename, owner_ip
+    preview_requested = Signal(str, str, str)  # file_id, filename, owner_ip
+    batch_download_requested = Signal(list)  # [(file_id, filename, owner_ip)]
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -110,9 +145,17 @@ class FileListWidget(QWidget):
         layout.addWidget(self._my_area, 1)
 
         # peer files section
+        peer_header = QHBoxLayout()
         self._peer_label = QLabel("Peer Files")
         self._peer_label.setStyleSheet("font-weight: bold; padding-top: 4px;")
-        layout.addWidget(self._peer_label)
+        peer_header.addWidget(self._peer_label, 1)
+        self._download_selected_btn = QPushButton("Download selected")
+        self._download_selected_btn.setObjectName("downloadBtn")
+        self._download_selected_btn.setToolTip("Fetch the checked files, one connection per peer")
+        self._download_selected_btn.setEnabled(False)
+        self._download_selected_btn.clicked.connect(self._on_download_selected)
+        peer_header.addWidget(self._download_selected_btn)
+        layout.addLayout(peer_header)
 
         self._peer_area = QScrollArea()
         self._peer_area.setWidgetResizable(True)
@@ -125,16 +168,35 @@ class FileListWidget(QWidget):
         layout.addWidget(self._peer_area, 1)
 
         self._my_items: dict[str, FileItemWidget] = {}
-        self._peer_items: dict[str, FileItemWidget] = {}
+        # ids are unique per owner only: two peers sharing the same file give it the same id
+        self._peer_items: dict[tuple[str, str], FileItemWidget] = {}  # (peer ip, file_id) -> item
 
     def add_my_file(self, shared_file: SharedFile):
         if shared_file.file_id in self._my_items:
             return
-        item = FileItemWidget(shared_file, is_mine=True)
-        item.remove_clicked.connect(self._on_remove)
+        item = self._my_item(shared_file)
         self._my_items[shared_file.file_id] = item
         self._my_layout.insertWidget(self._my_layout.count() - 1, item)
 
+    def _my_item(self, shared_file: SharedFile) -> FileItemWidget:
+        item = FileItemWidget(shared_file, is_mine=True)
+        item.remove_clicked.connect(self._on_remove)
+        return item
+
+    def update_my_file(self, shared_file: SharedFile):
+        """Redraw a shared file whose size changed on disk."""
+        if shared_file.file_id in self._my_items:
+            self._replace(self._my_layout, self._my_items, shared_file.file_id, self._my_item(shared_file))
+
+    def add_my_files(self, files: list[SharedFile]):
+        """Add many files with a single relayout, e.g. after a drop of a whole folder's worth."""
+        self.setUpdatesEnabled(False)
+        try:
+            for f in files:
+                self.add_my_file(f)
+        finally:
+            self.setUpdatesEnabled(True)
+
     def remove_my_file(self, file_id: str):
         if file_id in self._my_items:
             widget = self._my_items.pop(file_id)
@@ -147,33 +209,86 @@ class FileListWidget(QWidget):
 
     def update_peer_files(self, peer_ip: str, peer_hostname: str, files: list[SharedFile]):
         # remove old entries for this peer
-        to_remove = [fid for fid, w in self._peer_items.items() if w._file.owner_ip == peer_ip]
-        for fid in to_remove:
-            widget = self._peer_items.pop(fid)
-            self._peer_layout.removeWidget(widget)
-            widget.deleteLater()
+        self.remove_peer_files(peer_ip)
+        self.append_peer_files(peer_ip, files)
 
-        # add new
+    def append_peer_files(self, peer_ip: str, files: list[SharedFile]):
+        """Add files to the peer section, e.g. as FILE_LIST_PAGE messages arrive."""
         for f in files:
-            item = FileItemWidget(f, is_mine=False)
-            item.download_clicked.connect(
-                lambda fid, fn, oip: self.download_requested.emit(fid, fn, oip)
-            )
-            self._peer_items[f.file_id] = item
+            item = self._peer_item(peer_ip, f)
+            if (peer_ip, f.file_id) in self._peer_items:
+                self._replace(self._peer_layout, self._peer_items, (peer_ip, f.file_id), item)
+                continue
+            self._peer_items[peer_ip, f.file_id] = item
             self._peer_layout.insertWidget(self._peer_layout.count() - 1, item)
 
+    def _peer_item(self, peer_ip: str, shared_file: SharedFile) -> FileItemWidget:
+        item = FileItemWidget(shared_file, is_mine=False)
+        item.peer_ip = peer_ip
+        item.download_clicked.connect(
+            lambda fid, fn, oip: self.download_requested.emit(fid, fn, oip)
+        )
+        item.preview_clicked.connect(
+            lambda fid, fn, oip: self.preview_requested.emit(fid, fn, oip)
+        )
+        item.selection_changed.connect(self._update_selection)
+        return item
+
+    def _selected_items(self) -> list[FileItemWidget]:
+        return [w for w in self._peer_items.values() if w.is_selected()]
+
+    def _update_selection(self):
+        count = len(self._selected_items())
+        self._download_selected_btn.setEnabled(count > 0)
+        self._download_selected_btn.setText(f"Download selected ({count})" if count else "Download selected")
+
+    def _on_download_selected(self):
+        items = self._selected_items()
+        files = [(w.shared_file.file_id, w.shared_file.filename, w.shared_file.owner_ip) for w in items]
+        for w in items:
+            w.set_selected(False)
+        self._update_selection()
+        if files:
+            self.batch_download_requested.emit(files)
+
+    def apply_peer_delta(self, peer_ip: str, changed: list[SharedFile], removed: list[str]):
+        """Apply a FILE_DELTA: redraw changed files in place, append new ones, drop removed ones."""
+        for fid in removed:
+            widget = self._peer_items.pop((peer_ip, fid), None)
+            if widget is not None:
+                self._peer_layout.removeWidget(widget)
+                widget.deleteLater()
+        added = []
+        for f in changed:
+            if (peer_ip, f.file_id) in self._peer_items:
+                self._replace(self._peer_layout, self._peer_items, (peer_ip, f.file_id), self._peer_item(peer_ip, f))
+            else:
+                added.append(f)
+        self.append_peer_files(peer_ip, added)
+        self._update_selection()
+
+    @staticmethod
+    def _replace(layout: QVBoxLayout, items: dict, key, item: FileItemWidget):
+        # swap the widget for `key`, keeping its position
+        old = items[key]
+        layout.insertWidget(layout.indexOf(old), item)
+        layout.removeWidget(old)
+        old.deleteLater()
+        items[key] = item
+
     def remove_peer_files(self, peer_ip: str):
-        to_remove = [fid for fid, w in self._peer_items.items() if w._file.owner_ip == peer_ip]
-        for fid in to_remove:
-            widget = self._peer_items.pop(fid)
+        to_remove = [key for key in self._peer_items if key[0] == peer_ip]
+        for key in to_remove:
+            widget = self._peer_items.pop(key)
             self._peer_layout.removeWidget(widget)
             widget.deleteLater()
+        self._update_selection()
 
-    def mark_download_completed(self, file_id: str, saved_path: str):
+    def mark_download_completed(self, owner_ip: str, file_id: str, saved_path: str):
         """Show Open folder button on the peer file item after download."""
-        if file_id in self._peer_items:
+        if (owner_ip, file_id) in self._peer_items:
             folder = os.path.dirname(saved_path)
-            self._peer_items[file_id].show_open_folder(folder)
+            self._peer_items[owner_ip, file_id].show_open_folder(folder)
 
 
 def _open_folder(folder_path: str):
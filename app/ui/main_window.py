@@ -1,35 +1,38 @@
 from __future__ import annotations
 
+import logging
 import os
 import socket
 import threading
+from typing import TYPE_CHECKING
 
-from PySide6.QtCore import Qt, QUrl, QMimeData
+from PySide6.QtCore import Qt, QTimer
 from PySide6.QtGui import QAction, QDragEnterEvent, QDropEvent
 from PySide6.QtWidgets import (
     QMainWindow, QSplitter, QWidget, QVBoxLayout,
-    QMenu, QFileDialog, QApplication, QMessageBox,
+    QMenu, QFileDialog, QApplication, QMessageBox, QProgressBar,
 )
 
-from app.core.models import SharedFile, Peer, ChatMessage
+from app.core import startup
+from app.core.catalog import CatalogCache, Manifest, is_older
+from app.core.models import SharedFile, Peer, apply_file_delta
 from app.core.settings import AppSettings
-from app.network.protocol import CONTROL_PORT, make_file_list, make_chat
-from app.network.discovery import DiscoveryService
-from app.network.file_transfer import (
-    ControlServer, FileTransferServer, FileDownloadTask, send_to_peer,
-)
-from app.network.chat import create_chat_message, parse_chat_message
+from app.network.ratelimit import BandwidthManager
 from app.ui.peer_list import PeerListWidget
 from app.ui.file_list import FileListWidget
 from app.ui.chat_widget import ChatWidget
 from app.ui.transfer_dialog import TransferPanel
-from app.ui.styles import THEMES
 
-LOG_PREFIX = "[MainWindow]"
+# The network stack (app.network.protocol/discovery/file_transfer, the Qt
+# adapters), the settings dialogs and the stylesheets are imported where they
+# are first used, so none of them delay the first frame.
+if TYPE_CHECKING:
+    from app.core.share_store import ShareStore
+    from app.ui.qt_bridge import QtFileDownloadTask, QtFileWatcher, QtHashPool
 
+log = logging.getLogger(__name__)
 
-def _log(msg: str):
-    print(f"{LOG_PREFIX} {msg}", flush=True)
+NETWORK_FALLBACK_MS = 1000  # start the network anyway if no frame is painted (e.g. started minimized)
 
 
 class MainWindow(QMainWindow):
@@ -42,16 +45,32 @@ class MainWindow(QMainWindow):
 
         self._settings = AppSettings()
         self._hostname = socket.gethostname()
-        self._my_ip = self._get_local_ip()
+        self._my_ip = ""  # resolved when the network starts
         self._peers: dict[str, Peer] = {}  # ip -> Peer
         self._my_shared_files: list[SharedFile] = []
-        self._downloads: dict[str, FileDownloadTask] = {}
-
+        self._shared_dirs: set[str] = set()  # shared directories; new files in them are shared too
+        self._excluded: set[str] = set()  # files in shared directories the user removed from the list
+        self._manifest = Manifest()  # version of _my_shared_files, bumped on every change
+        self._catalog = CatalogCache()  # file lists of peers that left, for when they come back
+        self._incoming_lists: dict[str, str] = {}  # ip -> version of the paged list being received
+        self._downloads: dict[tuple[str, str], QtFileDownloadTask] = {}  # (owner_ip, file_id) -> task
+        self._bandwidth = BandwidthManager()
+        self._apply_bandwidth_limits()
+        self._network_started = False
+        self._metrics_server = None  # app.network.diagnostics.MetricsServer while enabled
+        self._stream_server = None  # app.network.stream.StreamServer, from the first preview on
+        self._hash_pool: QtHashPool | None = None  # created with the network
+        self._watcher: QtFileWatcher | None = None  # likewise
+        self._share_store: ShareStore | None = None  # likewise; the share list from the last run
+        self._share_save_timer = QTimer(self, singleShot=True)
+        self._share_save_timer.timeout.connect(self._save_shares)
+
+        # stylesheet first, so widgets are polished once instead of again after creation
+        self._apply_theme()
         self._setup_ui()
         self._setup_menu()
-        self._setup_network()
-        self._apply_theme()
-        _log(f"Initialized: {self._hostname} ({self._my_ip})")
+        QTimer.singleShot(NETWORK_FALLBACK_MS, self._start_network)
+        log.info("Initialized: %s", self._hostname)
 
     # ── UI Setup ──────────────────────────────────────────────
 
@@ -80,6 +99,8 @@ class MainWindow(QMainWindow):
         self._file_list = FileListWidget()
         self._file_list.file_removed.connect(self._on_file_removed)
         self._file_list.download_requested.connect(self._on_download_requested)
+        self._file_list.preview_requested.connect(self._on_preview_requested)
+        self._file_list.batch_download_requested.connect(self._on_batch_download_requested)
         right_splitter.addWidget(self._file_list)
 
         # bottom container: transfers + chat
@@ -104,6 +125,13 @@ class MainWindow(QMainWindow):
 
         main_layout.addWidget(splitter)
 
+        # hashing progress for newly shared files, hidden while idle
+        self._hash_progress = QProgressBar()
+        self._hash_progress.setMaximumWidth(260)
+        self._hash_progress.setRange(0, 1000)
+        self._hash_progress.hide()
+        self.statusBar().addPermanentWidget(self._hash_progress)
+
     def _setup_menu(self):
         menu_bar = self.menuBar()
 
@@ -114,6 +142,14 @@ class MainWindow(QMainWindow):
         dl_folder_action.triggered.connect(self._change_download_folder)
         settings_menu.addAction(dl_folder_action)
 
+        bandwidth_action = QAction("Bandwidth Limits...", self)
+        bandwidth_action.triggered.connect(self._change_bandwidth_limits)
+        settings_menu.addAction(bandwidth_action)
+
+        tuning_action = QAction("Transfer Tuning...", self)
+        tuning_action.triggered.connect(self._change_transfer_tuning)
+        settings_menu.addAction(tuning_action)
+
         theme_menu = settings_menu.addMenu("Theme")
         dark_action = QAction("Dark", self)
         dark_action.triggered.connect(lambda: self._set_theme("dark"))
@@ -128,32 +164,126 @@ class MainWindow(QMainWindow):
         quit_action.triggered.connect(self.close)
         settings_menu.addAction(quit_action)
 
+        # Diagnostics menu
+        diagnostics_menu = menu_bar.addMenu("Diagnostics")
+
+        metrics_action = QAction("Metrics Endpoint", self, checkable=True)
+        metrics_action.setChecked(bool(self._settings.metrics_port))
+        metrics_action.setStatusTip("Serve Prometheus metrics and profiling on 127.0.0.1")
+        metrics_action.toggled.connect(self._set_metrics_enabled)
+        diagnostics_menu.addAction(metrics_action)
+
+        self._profile_action = QAction("CPU Profile", self, checkable=True)
+        self._profile_action.toggled.connect(self._set_profiling)
+        diagnostics_menu.addAction(self._profile_action)
+
     # ── Network Setup ─────────────────────────────────────────
 
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self._network_started:
+            startup.mark("first frame painted")
+            # queued, so the frame is flushed to the screen before the servers bind
+            QTimer.singleShot(0, self._start_network)
+
+    def _start_network(self):
+        if self._network_started:
+            return
+        self._network_started = True
+        self._setup_network()
+        startup.mark("network started")
+        startup.report()
+
     def _setup_network(self):
-        _log("Setting up network...")
+        from app.core.chat_store import ChatStore
+        from app.core.share_store import SAVE_DELAY, ShareStore
+        from app.network.outbox import Outbox
+        from app.network.protocol import CONTROL_PORT
+        from app.ui.qt_bridge import (
+            QtControlServer, QtDiscoveryService, QtFileTransferServer, QtFileWatcher, QtHashPool, QtPeerProber,
+        )
+        from app.core.watcher import is_under, list_files
+
+        log.debug("Setting up network...")
+        self._my_ip = self._get_local_ip()
+
+        # Shares from the last run: a parallel stat sweep, nothing is re-hashed
+        self._share_store = ShareStore()
+        self._share_save_timer.setInterval(int(SAVE_DELAY * 1000))
+        restored, dirs, excluded = self._share_store.restore(self._my_ip, self._hostname)
+        known = {f.file_path for f in self._my_shared_files}
+        restored = [f for f in restored if f.file_path not in known]
+        self._my_shared_files.extend(restored)
+        # a widget per file is slow for big shares; serve first, draw after
+        QTimer.singleShot(0, lambda: self._file_list.add_my_files(restored))
+        self._shared_dirs |= dirs
+        self._excluded |= excluded
+        startup.mark("shares restored")
 
         # Control server (file lists, chat)
-        self._control_server = ControlServer(CONTROL_PORT, parent=self)
+        self._control_server = QtControlServer(CONTROL_PORT, parent=self)
         self._control_server.file_list_received.connect(self._on_file_list_received)
+        self._control_server.file_list_page_received.connect(self._on_file_list_page_received)
         self._control_server.chat_received.connect(self._on_chat_received)
+        self._control_server.chat_sync_requested.connect(self._on_chat_sync_requested)
+        self._control_server.chat_history_received.connect(self._on_chat_history_received)
+        self._control_server.file_delta_received.connect(self._on_file_delta_received)
+        self._control_server.file_list_sync_requested.connect(self._on_file_list_sync_requested)
         self._control_server.start()
+        self._outbox = Outbox()  # chat to peers, batched off the GUI thread
+
+        # Digests of shared files, computed in the background
+        self._hash_pool = QtHashPool(parent=self)
+        self._hash_pool.progress.connect(self._on_hash_progress)
+        self._hash_pool.finished.connect(self._schedule_share_save)
+        self._hash_pool.submit(self._my_shared_files)
 
         # File transfer server
-        self._transfer_server = FileTransferServer(
+        self._transfer_server = QtFileTransferServer(
             shared_files_getter=lambda: self._my_shared_files,
+            digest_getter=self._hash_pool.digest,
+            bandwidth=self._bandwidth,
+            chunk_size=self._settings.chunk_size_kb * 1024,
+            buffer_size=self._settings.socket_buffer_kb * 1024,
+            snapshot_mode=self._settings.snapshot_mode,
             parent=self,
         )
+        self._transfer_server.file_changed.connect(self._on_shared_file_changed)
         self._transfer_server.start()
 
+        # Changes to shared files and directories on disk
+        self._watcher = QtFileWatcher(parent=self)
+        self._watcher.changed.connect(self._on_paths_changed)
+        self._watcher.start()
+        for path in self._shared_dirs | {f.file_path for f in self._my_shared_files}:
+            if not is_under(path, self._shared_dirs - {path}):
+                self._watcher.watch(path)
+        # files added to shared directories while we were not running
+        known = {f.file_path for f in self._my_shared_files}
+        self._update_shares([], [], [
+            p for d in sorted(dirs) for p in list_files(d) if p not in known and p not in self._excluded
+        ])
+
+        # TCP reachability and link quality of discovered peers
+        self._prober = QtPeerProber(idle=lambda: not self._downloads, parent=self)
+        self._prober.probed.connect(self._on_peer_probed)
+        self._prober.start()
+
         # Discovery
-        self._discovery = DiscoveryService(self._hostname, CONTROL_PORT, parent=self)
+        self._discovery = QtDiscoveryService(
+            self._hostname, CONTROL_PORT, manifest_getter=lambda: self._manifest.version, parent=self,
+        )
         self._discovery.peer_discovered.connect(self._on_peer_discovered)
         self._discovery.peer_lost.connect(self._on_peer_lost)
         self._discovery.start()
 
+        if self._settings.metrics_port:
+            self._start_metrics_server()
+
+        self._chat_store = ChatStore()
+        self._chat.set_store(self._chat_store)
         self._chat.add_system_message(f"Started as {self._hostname} ({self._my_ip})")
-        _log("Network setup complete")
+        log.info("Network started as %s (%s)", self._hostname, self._my_ip)
 
     # ── Drag & Drop ───────────────────────────────────────────
 
@@ -162,108 +292,461 @@ class MainWindow(QMainWindow):
             event.acceptProposedAction()
 
     def dropEvent(self, event: QDropEvent):
-        for url in event.mimeData().urls():
-            path = url.toLocalFile()
-            if os.path.isfile(path):
-                self._add_shared_file(path)
-
-    def _add_shared_file(self, path: str):
-        size = os.path.getsize(path)
-        sf = SharedFile.create(
-            filename=os.path.basename(path),
-            size=size,
-            owner_ip=self._my_ip,
-            owner_hostname=self._hostname,
-            file_path=path,
-        )
-        self._my_shared_files.append(sf)
-        self._file_list.add_my_file(sf)
-        self._broadcast_file_list()
+        paths = [url.toLocalFile() for url in event.mimeData().urls()]
+        for path in paths:
+            if os.path.isdir(path):
+                self._add_shared_dir(path)
+        self._add_shared_files([p for p in paths if os.path.isfile(p)])
+
+    def _add_shared_dir(self, path: str):
+        """Share everything in a directory, and whatever is added to it later."""
+        from app.core.watcher import list_files
+
+        path = os.path.abspath(path)
+        if path in self._shared_dirs:
+            return
+        self._shared_dirs.add(path)
+        if self._watcher:
+            self._watcher.watch(path)
+        known = {f.file_path for f in self._my_shared_files}
+        self._update_shares([], [], [p for p in list_files(path) if p not in known])
+
+    def _add_shared_files(self, paths: list[str]):
+        """Register a batch of files: one list update, one broadcast, hashing in the background."""
+        from app.core.watcher import is_under
+
+        if not paths:
+            return
+        known = {f.file_path for f in self._my_shared_files}
+        paths = [p for p in map(os.path.abspath, paths) if p not in known]
+        for path in paths:
+            self._excluded.discard(path)
+            if self._watcher and not is_under(path, self._shared_dirs):
+                self._watcher.watch(path)
+        self._update_shares([], [], paths)
+
+    def _update_shares(self, changed: list[tuple[SharedFile, int, int]], removed: list[SharedFile],
+                       new_paths: list[str]):
+        """Apply (file, size, mtime_ns) updates, removals and new files to the
+        share list in one go: one list update, one FILE_DELTA, hashing in the background."""
+        taken = {f.file_id for f in self._my_shared_files}
+        added = []
+        for path in new_paths:
+            try:
+                sf = SharedFile.from_path(path, self._my_ip, self._hostname, taken)
+            except OSError as e:
+                log.warning("Cannot share %s: %s", path, e)
+                continue
+            taken.add(sf.file_id)
+            added.append(sf)
+        for sf, size, mtime_ns in changed:
+            sf.size, sf.mtime_ns = size, mtime_ns
+            self._file_list.update_my_file(sf)
+        gone = {sf.file_id for sf in removed}
+        for file_id in gone:
+            self._file_list.remove_my_file(file_id)
+            if self._hash_pool:
+                self._hash_pool.cancel(file_id)
+            if self._network_started:
+                self._transfer_server.snapshots.forget(file_id)
+        if gone:
+            self._my_shared_files = [f for f in self._my_shared_files if f.file_id not in gone]
+        self._my_shared_files.extend(added)
+        self._file_list.add_my_files(added)
+        updated = [sf for sf, _, _ in changed]
+        if self._hash_pool:
+            self._hash_pool.submit(updated + added)
+        if updated or gone or added:
+            self._broadcast_file_delta(updated + added, sorted(gone))
+            self._schedule_share_save()
+
+    def _schedule_share_save(self, *_):
+        # at most one write per SAVE_DELAY, however many changes come in
+        if self._share_store and not self._share_save_timer.isActive():
+            self._share_save_timer.start()
+
+    def _save_shares(self):
+        self._share_store.save(self._my_shared_files, self._shared_dirs, self._excluded)
+
+    def _on_hash_progress(self, files_done: int, files_total: int, bytes_done: int, bytes_total: int):
+        if not files_total:
+            self._hash_progress.hide()
+            return
+        self._hash_progress.setValue(int(bytes_done * 1000 / bytes_total) if bytes_total else 0)
+        self._hash_progress.setFormat(f"Hashing {files_done}/{files_total} files")
+        self._hash_progress.show()
 
     def _on_file_removed(self, file_id: str):
-        self._my_shared_files = [f for f in self._my_shared_files if f.file_id != file_id]
-        self._broadcast_file_list()
+        from app.core.watcher import is_under
+
+        sf = next((f for f in self._my_shared_files if f.file_id == file_id), None)
+        if sf is None:
+            return
+        if is_under(sf.file_path, self._shared_dirs):
+            self._excluded.add(sf.file_path)  # don't share it again when its directory changes
+        elif self._watcher:
+            self._watcher.unwatch(sf.file_path)
+        self._update_shares([], [sf], [])
+
+    def _on_paths_changed(self, paths: list):
+        from app.core.watcher import is_under, resolve_changes
+
+        changed, removed, new = resolve_changes(paths, self._my_shared_files, self._shared_dirs, self._excluded)
+        for sf in removed:
+            if not is_under(sf.file_path, self._shared_dirs):
+                self._watcher.unwatch(sf.file_path)
+        self._update_shares([(sf, st.st_size, st.st_mtime_ns) for sf, st in changed], removed, new)
+
+    def _on_shared_file_changed(self, file_id: str, size: int, mtime_ns: int):
+        sf = next((f for f in self._my_shared_files if f.file_id == file_id), None)
+        if sf is not None and (sf.size, sf.mtime_ns) != (size, mtime_ns):
+            self._update_shares([(sf, size, mtime_ns)], [], [])
 
     # ── File List Broadcasting ────────────────────────────────
 
-    def _broadcast_file_list(self):
-        files_data = [f.to_dict() for f in self._my_shared_files]
-        msg = make_file_list(self._hostname, files_data)
+    def _broadcast_file_delta(self, changed: list[SharedFile], removed: list[str]):
+        """Tell peers about changed or removed files; peers that predate FILE_DELTA get the whole list."""
+        from app.network.codec import FEATURE as BINARY_CODEC
+        from app.network.protocol import FEATURE_DELTA, make_file_delta
+
+        base, version = self._manifest.record([f.file_id for f in changed], removed)
+        msg = make_file_delta(self._hostname, [f.to_dict() for f in changed], removed, base, version)
+        files_data = None
         for peer in self._peers.values():
-            send_to_peer(peer.ip, peer.control_port, msg)
+            if peer.supports(FEATURE_DELTA):
+                self._outbox.send(peer.ip, peer.control_port, msg, peer.supports(BINARY_CODEC))
+                continue
+            if files_data is None:
+                files_data = [f.to_dict() for f in self._my_shared_files]
+            self._send_file_list(peer, files_data)
+
+    def _send_file_list(self, peer: Peer, files_data: list[dict]):
+        from app.network.codec import FEATURE as BINARY_CODEC
+        from app.network.file_transfer import send_messages_to_peer, send_to_peer
+        from app.network.protocol import FEATURE_PAGES, iter_file_list_pages, make_file_list
+
+        binary = peer.supports(BINARY_CODEC)
+        if not peer.supports(FEATURE_PAGES):
+            send_to_peer(peer.ip, peer.control_port, make_file_list(self._hostname, files_data), binary)
+            return
+        # pages are encoded lazily and streamed over one connection off the GUI thread
+        pages = iter_file_list_pages(self._hostname, self._manifest.version, files_data)
+        threading.Thread(
+            target=send_messages_to_peer,
+            args=(peer.ip, peer.control_port, pages, binary),
+            daemon=True,
+        ).start()
+
+    def _request_file_list(self, peer: Peer):
+        """Ask a peer for what changed in its list since the version we have (all of it if none)."""
+        from app.network.codec import FEATURE as BINARY_CODEC
+        from app.network.protocol import CONTROL_PORT, make_file_list_sync
+
+        msg = make_file_list_sync(self._hostname, CONTROL_PORT, peer.manifest)
+        self._outbox.send(peer.ip, peer.control_port, msg, peer.supports(BINARY_CODEC))
+
+    def _on_file_list_sync_requested(self, ip: str, data: dict):
+        from app.network.codec import FEATURE as BINARY_CODEC
+        from app.network.protocol import make_file_delta
+
+        peer = Peer(
+            hostname=data.get("hostname", ""), ip=ip, control_port=int(data["control_port"]),
+            features=list(data.get("features", [])),
+        )
+        base = str(data.get("version", ""))
+        delta = self._manifest.since(base) if base else None
+        if delta is None:
+            self._send_file_list(peer, [f.to_dict() for f in self._my_shared_files])
+            return
+        changed_ids, removed = delta
+        if not changed_ids and not removed:
+            return  # already up to date
+        changed = [f.to_dict() for f in self._my_shared_files if f.file_id in changed_ids]
+        msg = make_file_delta(self._hostname, changed, sorted(removed), base, self._manifest.version)
+        self._outbox.send(ip, peer.control_port, msg, peer.supports(BINARY_CODEC))
 
     def _on_file_list_received(self, hostname: str, ip: str, files: list):
         shared = [SharedFile.from_dict(f) for f in files]
         if ip in self._peers:
             self._peers[ip].shared_files = shared
+            self._peers[ip].manifest = ""
         self._file_list.update_peer_files(ip, hostname, shared)
 
+    def _on_file_list_page_received(self, ip: str, page: dict):
+        shared = [SharedFile.from_dict(f) for f in page["files"]]
+        peer = self._peers.get(ip)
+        newest = (self._incoming_lists.get(ip), peer and peer.manifest)
+        if page["cursor"] == 0 and any(is_older(page["version"], v) for v in newest if v):
+            return  # pages of each list are sent on their own thread; an older one can arrive last
+        if page["cursor"] == 0:
+            # first page of a new list replaces whatever we had
+            self._incoming_lists[ip] = page["version"]
+            if peer:
+                peer.shared_files = shared
+                peer.manifest = str(page["version"])
+            self._file_list.update_peer_files(ip, page["hostname"], shared)
+        elif self._incoming_lists.get(ip) == page["version"]:
+            if peer:
+                peer.shared_files.extend(shared)
+            self._file_list.append_peer_files(ip, shared)
+        else:
+            return  # page of a list that has since been superseded
+        if page["next_cursor"] is None:
+            self._incoming_lists.pop(ip, None)
+
+    def _on_file_delta_received(self, ip: str, delta: dict):
+        peer = self._peers.get(ip)
+        if not peer:
+            return
+        base = delta.get("base", "")
+        if base and base != peer.manifest:
+            # it doesn't apply to the list we have (a delta got lost): get what we missed
+            self._request_file_list(peer)
+            return
+        changed = [SharedFile.from_dict(f) for f in delta.get("changed", [])]
+        removed = list(delta.get("removed", []))
+        peer.shared_files = apply_file_delta(peer.shared_files, changed, removed)
+        peer.manifest = delta.get("version", "")
+        self._file_list.apply_peer_delta(ip, changed, removed)
+
     # ── File Download ─────────────────────────────────────────
 
     def _on_download_requested(self, file_id: str, filename: str, owner_ip: str):
-        if file_id in self._downloads:
+        from app.core.hashing import preferred_algorithms
+        from app.network.prober import CONNECT_TIMEOUT
+        from app.network.protocol import FEATURE_XFER
+        from app.ui.qt_bridge import QtFileDownloadTask
+
+        if (owner_ip, file_id) in self._downloads:
             return
         save_dir = self._settings.download_folder
-        task = FileDownloadTask(file_id, filename, owner_ip, save_dir, parent=self)
-        task.progress.connect(self._transfer_panel.update_progress)
-        task.completed.connect(self._on_download_completed)
-        task.failed.connect(self._on_download_failed)
-        task.cancelled_signal.connect(self._transfer_panel.mark_cancelled)
-        self._downloads[file_id] = task
-        self._transfer_panel.add_transfer(file_id, filename)
+        peer = self._peers.get(owner_ip)
+        if peer and peer.reachable is False:
+            # the last probes could not connect; don't sit in a connect timeout, but look again
+            self._prober.recheck(owner_ip)
+            self._transfer_panel.add_transfer(owner_ip, file_id, filename)
+            self._transfer_panel.mark_failed(owner_ip, file_id, "Peer's transfer port is not reachable; checking again")
+            return
+        task = QtFileDownloadTask(
+            file_id, filename, owner_ip, save_dir,
+            bandwidth=self._bandwidth,
+            chunk_size=self._settings.chunk_size_kb * 1024,
+            buffer_size=self._settings.socket_buffer_kb * 1024,
+            hashes=preferred_algorithms() if peer and peer.supports(FEATURE_XFER) else None,
+            connect_timeout=CONNECT_TIMEOUT if peer and peer.reachable else 30.0,
+            fsync=self._settings.fsync_policy,
+            parent=self,
+        )
+        self._start_download(task, owner_ip, [(file_id, filename)])
+
+    def _on_batch_download_requested(self, files: list):
+        """Download the selected (file_id, filename, owner_ip) entries, each
+        peer's over one connection if it supports FILE_BATCH_REQ."""
+        from app.core.hashing import preferred_algorithms
+        from app.network.prober import CONNECT_TIMEOUT
+        from app.network.protocol import FEATURE_BATCH, MAX_BATCH_FILES
+        from app.ui.qt_bridge import QtBatchDownloadTask
+
+        by_peer: dict[str, list[tuple[str, str]]] = {}
+        for file_id, filename, owner_ip in files:
+            if (owner_ip, file_id) not in self._downloads:
+                by_peer.setdefault(owner_ip, []).append((file_id, filename))
+        for owner_ip, batch in by_peer.items():
+            peer = self._peers.get(owner_ip)
+            if len(batch) == 1 or not peer or not peer.supports(FEATURE_BATCH) or peer.reachable is False:
+                for file_id, filename in batch:
+                    self._on_download_requested(file_id, filename, owner_ip)
+                continue
+            for start in range(0, len(batch), MAX_BATCH_FILES):
+                task = QtBatchDownloadTask(
+                    batch[start:start + MAX_BATCH_FILES], owner_ip, self._settings.download_folder,
+                    preferred_algorithms(),
+                    bandwidth=self._bandwidth,
+                    chunk_size=self._settings.chunk_size_kb * 1024,
+                    buffer_size=self._settings.socket_buffer_kb * 1024,
+                    connect_timeout=CONNECT_TIMEOUT if peer.reachable else 30.0,
+                    fsync=self._settings.fsync_policy,
+                    parent=self,
+                )
+                self._start_download(task, owner_ip, batch[start:start + MAX_BATCH_FILES])
+
+    def _start_download(self, task, owner_ip: str, files: list[tuple[str, str]]):
+        """Show `files` (file_id, filename) from `owner_ip` in the transfer panel
+        and start the task fetching them."""
+        # the task's signals carry only the file id; which peer it is from is known here
+        panel = self._transfer_panel
+        task.progress.connect(lambda fid, done, total: panel.update_progress(owner_ip, fid, done, total))
+        task.stats.connect(lambda fid, stats: panel.update_stats(owner_ip, fid, stats))
+        task.completed.connect(lambda fid, path: self._on_download_completed(owner_ip, fid, path))
+        task.failed.connect(lambda fid, error: self._on_download_failed(owner_ip, fid, error))
+        task.cancelled_signal.connect(lambda fid: self._on_download_cancelled(owner_ip, fid))
+        for file_id, filename in files:
+            self._downloads[owner_ip, file_id] = task
+            panel.add_transfer(owner_ip, file_id, filename)
         task.start()
 
-    def _on_download_completed(self, file_id: str, saved_path: str):
-        self._transfer_panel.mark_completed(file_id)
-        self._file_list.mark_download_completed(file_id, saved_path)
-        self._downloads.pop(file_id, None)
+    def _on_download_completed(self, owner_ip: str, file_id: str, saved_path: str):
+        self._transfer_panel.mark_completed(owner_ip, file_id)
+        self._file_list.mark_download_completed(owner_ip, file_id, saved_path)
+        self._downloads.pop((owner_ip, file_id), None)
+
+    def _on_download_failed(self, owner_ip: str, file_id: str, error: str):
+        self._transfer_panel.mark_failed(owner_ip, file_id, error)
+        self._downloads.pop((owner_ip, file_id), None)
+
+    def _on_download_cancelled(self, owner_ip: str, file_id: str):
+        self._transfer_panel.mark_cancelled(owner_ip, file_id)
+        self._downloads.pop((owner_ip, file_id), None)
 
-    def _on_download_failed(self, file_id: str, error: str):
-        self._transfer_panel.mark_failed(file_id, error)
-        self._downloads.pop(file_id, None)
+    def _on_cancel_transfer(self, owner_ip: str, file_id: str):
+        from app.ui.qt_bridge import QtBatchDownloadTask
 
-    def _on_cancel_transfer(self, file_id: str):
-        task = self._downloads.get(file_id)
-        if task:
+        task = self._downloads.get((owner_ip, file_id))
+        if isinstance(task, QtBatchDownloadTask):
+            task.cancel(file_id)  # just this file; the rest of the batch carries on
+        elif task:
             task.cancel()
 
+    # ── Preview ───────────────────────────────────────────────
+
+    def _on_preview_requested(self, file_id: str, filename: str, owner_ip: str):
+        from app.ui.preview_dialog import PreviewDialog, open_stream, preview_kind
+        from app.ui.qt_bridge import QtRangeReadTask
+
+        url = self._stream_url(owner_ip, file_id, filename)
+        if preview_kind(filename) == "media":
+            open_stream(url)  # the player reads it through the stream endpoint as it plays
+            return
+        dialog = PreviewDialog(filename, url, parent=self)
+        dialog.setAttribute(Qt.WA_DeleteOnClose)
+        task = QtRangeReadTask(file_id, owner_ip, 0, dialog.length, bandwidth=self._bandwidth, parent=self)
+        task.finished.connect(dialog.show_data)  # dropped if the dialog was closed first
+        task.failed.connect(dialog.show_error)
+        task.finished.connect(task.deleteLater)
+        task.failed.connect(task.deleteLater)
+        dialog.show()
+        task.start()
+
+    def _stream_url(self, peer_ip: str, file_id: str, filename: str) -> str:
+        from app.network.stream import StreamServer
+
+        if self._stream_server is None:
+            self._stream_server = StreamServer(self._bandwidth)
+            self._stream_server.start()
+        return self._stream_server.url(peer_ip, file_id, filename)
+
     # ── Chat ──────────────────────────────────────────────────
 
     def _on_chat_send(self, text: str):
-        msg_dict, chat_msg = create_chat_message(self._hostname, self._my_ip, text)
+        from app.network.chat import create_chat_message
+        from app.network.codec import FEATURE as BINARY_CODEC
+
+        seq = self._chat_store.next_seq()
+        msg_dict, chat_msg = create_chat_message(self._hostname, self._my_ip, text, seq, self._chat_store.sender)
         self._chat.add_message(chat_msg)
         for peer in self._peers.values():
-            send_to_peer(peer.ip, peer.control_port, msg_dict)
+            self._outbox.send(peer.ip, peer.control_port, msg_dict, peer.supports(BINARY_CODEC))
 
     def _on_chat_received(self, data: dict):
+        from app.network.chat import parse_chat_message
+
         chat_msg = parse_chat_message(data)
         self._chat.add_message(chat_msg)
 
+    def _request_chat_sync(self, peer: Peer):
+        from app.network.chat import SYNC_SLACK
+        from app.network.codec import FEATURE as BINARY_CODEC
+        from app.network.protocol import CONTROL_PORT, make_chat_sync
+
+        since = max(0.0, self._chat_store.latest_timestamp() - SYNC_SLACK)
+        msg = make_chat_sync(self._hostname, CONTROL_PORT, since)
+        self._outbox.send(peer.ip, peer.control_port, msg, peer.supports(BINARY_CODEC))
+
+    def _on_chat_sync_requested(self, ip: str, data: dict):
+        from app.network.chat import SYNC_LIMIT, create_chat_history
+        from app.network.codec import FEATURE as BINARY_CODEC
+
+        try:
+            port = int(data.get("control_port"))
+            since = float(data.get("since", 0))
+        except (TypeError, ValueError):
+            port = 0
+        if not 0 < port < 65536:
+            log.debug("Ignoring malformed CHAT_SYNC from %s", ip)
+            return
+        messages = self._chat_store.recent(since, SYNC_LIMIT)
+        if not messages:
+            return
+        peer = self._peers.get(ip)
+        binary = peer.supports(BINARY_CODEC) if peer else False
+        self._outbox.send(ip, port, create_chat_history(self._hostname, messages), binary)
+
+    def _on_chat_history_received(self, data: dict):
+        from app.network.chat import parse_chat_history
+
+        added = sum(self._chat.add_message(m) for m in parse_chat_history(data))
+        if added:
+            log.info("Caught up on %d chat messages from %s", added, data.get("hostname"))
+
     # ── Peer Discovery ────────────────────────────────────────
 
-    def _on_peer_discovered(self, hostname: str, ip: str, control_port: int):
-        is_new = ip not in self._peers
-        self._peers[ip] = Peer(hostname=hostname, ip=ip, control_port=control_port)
-        self._peers[ip].update_seen()
+    def _on_peer_discovered(self, hostname: str, ip: str, control_port: int, features: list, manifest: str):
+        from app.network.protocol import FEATURE_CATALOG, FEATURE_CHAT_SYNC, FEATURE_PROBE
+
+        # DiscoveryService only emits on state changes, so an existing peer
+        # here means its hostname, control port, features or file list changed.
+        peer = self._peers.get(ip)
+        is_new = peer is None
+        if is_new:
+            peer = Peer(hostname=hostname, ip=ip, control_port=control_port, features=features)
+            self._peers[ip] = peer
+            cached = self._catalog.get(hostname, ip) if peer.supports(FEATURE_CATALOG) else None
+            if cached:
+                # back after a drop-out: show what it had right away
+                peer.manifest, peer.shared_files = cached
+                self._file_list.update_peer_files(ip, hostname, peer.shared_files)
+        else:
+            peer.hostname = hostname
+            peer.control_port = control_port
+            peer.features = features
+            peer.update_seen()
         self._peer_list.add_or_update_peer(hostname, ip)
+        self._prober.watch(ip, peer.supports(FEATURE_PROBE))
+        if peer.supports(FEATURE_CATALOG) and manifest != peer.manifest:
+            self._request_file_list(peer)
         if is_new:
             self._chat.add_system_message(f"{hostname} joined")
-            # send our file list to new peer
-            if self._my_shared_files:
-                files_data = [f.to_dict() for f in self._my_shared_files]
-                msg = make_file_list(self._hostname, files_data)
-                send_to_peer(ip, control_port, msg)
+            if peer.supports(FEATURE_CHAT_SYNC):
+                self._request_chat_sync(peer)
+            # peers with FEATURE_CATALOG ask for our list; push it to older ones
+            if self._my_shared_files and not peer.supports(FEATURE_CATALOG):
+                self._send_file_list(peer, [f.to_dict() for f in self._my_shared_files])
 
     def _on_peer_lost(self, ip: str):
         peer = self._peers.pop(ip, None)
+        self._prober.forget(ip)
+        self._bandwidth.forget(ip)
         if peer:
+            if peer.manifest:
+                self._catalog.put(peer.hostname, peer.manifest, peer.shared_files)
             self._peer_list.remove_peer(ip)
             self._file_list.remove_peer_files(ip)
             self._chat.add_system_message(f"{peer.hostname} left")
 
+    def _on_peer_probed(self, ip: str, reachable: bool, rtt_ms: float, throughput: float):
+        peer = self._peers.get(ip)
+        if not peer:
+            return
+        if peer.reachable is not False and not reachable:
+            log.warning("%s (%s) is not reachable on its transfer port", peer.hostname, ip)
+        peer.update_link(reachable, rtt_ms, throughput)
+        self._peer_list.update_link(ip, reachable, rtt_ms, throughput)
+
     # ── Theme ─────────────────────────────────────────────────
 
     def _apply_theme(self):
+        from app.ui.styles import THEMES
+
         theme = self._settings.theme
         qss = THEMES.get(theme, THEMES["dark"])
         QApplication.instance().setStyleSheet(qss)
@@ -279,10 +762,80 @@ class MainWindow(QMainWindow):
         if folder:
             self._settings.download_folder = folder
 
+    def _change_bandwidth_limits(self):
+        from app.ui.bandwidth_dialog import BandwidthDialog
+
+        s = self._settings
+        dialog = BandwidthDialog(s.upload_limit_kbps, s.download_limit_kbps, s.per_peer_limit_kbps, self)
+        if dialog.exec() != BandwidthDialog.Accepted:
+            return
+        s.upload_limit_kbps, s.download_limit_kbps, s.per_peer_limit_kbps = dialog.limits
+        self._apply_bandwidth_limits()
+
+    def _change_transfer_tuning(self):
+        from app.ui.tuning_dialog import TuningDialog
+
+        s = self._settings
+        dialog = TuningDialog(s.chunk_size_kb, s.socket_buffer_kb, s.fsync_policy, s.snapshot_mode, self)
+        if dialog.exec() != TuningDialog.Accepted:
+            return
+        s.chunk_size_kb, s.socket_buffer_kb = dialog.sizes
+        s.fsync_policy = dialog.fsync
+        s.snapshot_mode = dialog.snapshot
+        if self._network_started:
+            self._transfer_server.set_tuning(s.chunk_size_kb * 1024, s.socket_buffer_kb * 1024)
+            self._transfer_server.snapshots.mode = s.snapshot_mode
+
+    def _apply_bandwidth_limits(self):
+        s = self._settings
+        self._bandwidth.configure(
+            upload=s.upload_limit_kbps * 1024,
+            download=s.download_limit_kbps * 1024,
+            per_peer=s.per_peer_limit_kbps * 1024,
+        )
+
+    # ── Diagnostics ───────────────────────────────────────────
+
+    def _set_metrics_enabled(self, enabled: bool):
+        from app.network.diagnostics import METRICS_PORT
+
+        self._settings.metrics_port = METRICS_PORT if enabled else 0
+        if not self._network_started:
+            return  # picked up by _setup_network
+        if enabled:
+            self._start_metrics_server()
+        elif self._metrics_server:
+            self._metrics_server.stop()
+            self._metrics_server = None
+
+    def _start_metrics_server(self):
+        from app.network.diagnostics import MetricsServer
+
+        if self._metrics_server is None:
+            self._metrics_server = MetricsServer(self._settings.metrics_port)
+            self._metrics_server.start()
+
+    def _set_profiling(self, enabled: bool):
+        from app.core import profiler
+
+        try:
+            if enabled:
+                profiler.start()
+                return
+            path, _ = profiler.stop()
+        except RuntimeError as e:
+            QMessageBox.warning(self, "CPU Profile", str(e))
+            self._profile_action.blockSignals(True)
+            self._profile_action.setChecked(profiler.running())
+            self._profile_action.blockSignals(False)
+            return
+        log.info("CPU profile written to %s", path)
+        QMessageBox.information(self, "CPU Profile", f"Profile saved to:\n{path}")
+
     # ── Close ─────────────────────────────────────────────────
 
     def closeEvent(self, event):
-        _log("closeEvent: showing confirm dialog")
+        log.debug("closeEvent: showing confirm dialog")
         reply = QMessageBox.question(
             self,
             "Sub Party",
@@ -291,47 +844,54 @@ class MainWindow(QMainWindow):
             QMessageBox.No,
         )
         if reply == QMessageBox.Yes:
-            _log("closeEvent: user confirmed quit")
+            log.debug("closeEvent: user confirmed quit")
             event.accept()
             QApplication.quit()
         else:
-            _log("closeEvent: user cancelled quit")
+            log.debug("closeEvent: user cancelled quit")
             event.ignore()
 
     def shutdown(self):
         """Stop all network threads. Called from app.aboutToQuit signal."""
-        _log("shutdown() called")
-        _log(f"Active threads before shutdown: {threading.active_count()}")
+        log.info("Shutting down")
+        log.debug("Active threads before shutdown: %d", threading.active_count())
         for t in threading.enumerate():
-            _log(f"  Thread: {t.name} (daemon={t.daemon})")
-
-        _log("Stopping discovery...")
-        self._discovery.stop()
-        _log("Stopping control server...")
-        self._control_server.stop()
-        _log("Stopping transfer server...")
-        self._transfer_server.stop()
-
-        _log(f"Cancelling {len(self._downloads)} downloads...")
-        for file_id, task in self._downloads.items():
-            _log(f"  Cancelling download: {file_id}")
+            log.debug("  Thread: %s (daemon=%s)", t.name, t.daemon)
+
+        if self._network_started:
+            log.debug("Stopping discovery...")
+            self._discovery.stop()
+            log.debug("Stopping control server...")
+            self._control_server.stop()
+            log.debug("Stopping transfer server...")
+            self._transfer_server.stop()
+            self._prober.stop()
+            self._watcher.stop()
+            self._hash_pool.stop()
+            self._share_save_timer.stop()
+            self._save_shares()
+            if self._metrics_server:
+                self._metrics_server.stop()
+            if self._stream_server:
+                self._stream_server.stop()
+            self._outbox.stop()
+            self._chat_store.close()
+
+        log.debug("Cancelling %d downloads...", len(self._downloads))
+        for (owner_ip, file_id), task in self._downloads.items():
+            log.debug("  Cancelling download: %s from %s", file_id, owner_ip)
             task.cancel()
-            task.wait(2000)
+            task.wait(2.0)
 
-        _log(f"Active threads after shutdown: {threading.active_count()}")
+        log.debug("Active threads after shutdown: %d", threading.active_count())
         for t in threading.enumerate():
-            _log(f"  Thread: {t.name} (daemon={t.daemon})")
-        _log("shutdown() done")
+            log.debug("  Thread: %s (daemon=%s)", t.name, t.daemon)
+        log.debug("shutdown() done")
 
     # ── Helpers ───────────────────────────────────────────────
 
     @staticmethod
     def _get_local_ip() -> str:
-        try:
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            ip = s.getsockname()[0]
-            s.close()
-            return ip
-        except OSError:
-            return "127.0.0.1"
+        from app.network.discovery import get_local_ip
+
+        return get_local_ip()
@@ -19,6 +19,7 @@ def _dot_icon(color: str, size: int = 12) -> QIcon:
 
 ONLINE_ICON = None
 OFFLINE_ICON = None
+BLOCKED_ICON = None
 
 
 def _get_online_icon():
@@ -35,6 +36,23 @@ def _get_offline_icon():
     return OFFLINE_ICON
 
 
+def _get_blocked_icon():
+    # seen on UDP, but its transfer port does not answer
+    global BLOCKED_ICON
+    if BLOCKED_ICON is None:
+        BLOCKED_ICON = _dot_icon("#f9e2af")
+    return BLOCKED_ICON
+
+
+def _link_text(reachable: bool, rtt_ms: float, throughput: float) -> str:
+    if not reachable:
+        return "unreachable"
+    text = f"{rtt_ms:.0f} ms"
+    if throughput:
+        text += f", {throughput / 1024 ** 2:.1f} MB/s"
+    return text
+
+
 class PeerListWidget(QWidget):
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -54,17 +72,39 @@ class PeerListWidget(QWidget):
         layout.addWidget(self._list)
 
         self._peers: dict[str, QListWidgetItem] = {}  # ip -> item
+        self._hostnames: dict[str, str] = {}  # ip -> hostname
+        self._links: dict[str, tuple[bool, float, float]] = {}  # ip -> last probe result
 
     def add_or_update_peer(self, hostname: str, ip: str):
+        self._hostnames[ip] = hostname
         if ip in self._peers:
-            item = self._peers[ip]
-            item.setText(f"{hostname}  ({ip})")
-            item.setIcon(_get_online_icon())
+            self._refresh(ip)
         else:
             item = QListWidgetItem(_get_online_icon(), f"{hostname}  ({ip})")
             self._list.addItem(item)
             self._peers[ip] = item
 
+    def update_link(self, ip: str, reachable: bool, rtt_ms: float, throughput: float):
+        """Show a probe result; a sample-less probe keeps the last throughput shown."""
+        if ip not in self._peers:
+            return
+        if reachable and not throughput and ip in self._links:
+            throughput = self._links[ip][2]
+        self._links[ip] = (reachable, rtt_ms, throughput)
+        self._refresh(ip)
+
+    def _refresh(self, ip: str):
+        item = self._peers[ip]
+        text = f"{self._hostnames[ip]}  ({ip})"
+        link = self._links.get(ip)
+        if link is None:
+            item.setIcon(_get_online_icon())
+        else:
+            text += f"\n{_link_text(*link)}"
+            item.setIcon(_get_online_icon() if link[0] else _get_blocked_icon())
+            item.setToolTip("" if link[0] else "Seen on the network, but its transfer port does not answer")
+        item.setText(text)
+
     def remove_peer(self, ip: str):
         if ip in self._peers:
             item = self._peers[ip]
@@ -75,6 +115,8 @@ class PeerListWidget(QWidget):
             row = self._list.row(self._peers[ip])
             self._list.takeItem(row)
             del self._peers[ip]
+            self._hostnames.pop(ip, None)
+            self._links.pop(ip, None)
 
     @property
     def peer_count(self) -> int:
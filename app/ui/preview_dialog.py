@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import mimetypes
+
+from PySide6.QtCore import Qt, QUrl
+from PySide6.QtGui import QDesktopServices, QFontDatabase, QImage, QPixmap
+from PySide6.QtWidgets import QDialog, QHBoxLayout, QLabel, QPlainTextEdit, QPushButton, QScrollArea, QVBoxLayout
+
+# how much of a file a preview reads, by kind; images need all of it
+PREVIEW_BYTES = {
+    "text": 256 * 1024,
+    "image": 16 * 1024 ** 2,
+    "binary": 4 * 1024,
+}
+_TEXT_TYPES = {"application/json", "application/xml", "application/javascript", "application/x-sh"}
+
+
+def preview_kind(filename: str) -> str:
+    """"text", "image", "media" (audio/video, streamed to a player) or "binary"."""
+    mime = mimetypes.guess_type(filename)[0] or ""
+    if mime.startswith("text/") or mime in _TEXT_TYPES:
+        return "text"
+    if mime.startswith("image/"):
+        return "image"
+    if mime.startswith(("audio/", "video/")):
+        return "media"
+    return "binary"
+
+
+def open_stream(url: str):
+    """Hand a stream URL to the system's default player."""
+    QDesktopServices.openUrl(QUrl(url))
+
+
+def _hex_dump(data: bytes) -> str:
+    lines = []
+    for pos in range(0, len(data), 16):
+        row = data[pos:pos + 16]
+        text = "".join(chr(b) if 32 <= b < 127 else "." for b in row)
+        lines.append(f"{pos:08x}  {row.hex(' '):<47}  {text}")
+    return "\n".join(lines)
+
+
+class PreviewDialog(QDialog):
+    """Shows the start of a peer's file while it is read; nothing is saved."""
+
+    def __init__(self, filename: str, stream_url: str, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle(f"Preview — {filename}")
+        self.resize(720, 520)
+        self._kind = preview_kind(filename)
+
+        layout = QVBoxLayout(self)
+        self._status = QLabel("Loading preview...")
+        self._status.setStyleSheet("font-size: 11px; color: #a6adc8;")
+        layout.addWidget(self._status)
+
+        if self._kind == "image":
+            self._image = QLabel()
+            self._image.setAlignment(Qt.AlignCenter)
+            self._view = QScrollArea()
+            self._view.setWidgetResizable(True)
+            self._view.setWidget(self._image)
+        else:
+            self._view = QPlainTextEdit()
+            self._view.setReadOnly(True)
+            if self._kind == "binary":
+                self._view.setFont(QFontDatabase.systemFont(QFontDatabase.FixedFont))
+        layout.addWidget(self._view, 1)
+
+        buttons = QHBoxLayout()
+        buttons.addStretch(1)
+        stream_btn = QPushButton("Open in player")
+        stream_btn.setToolTip("Stream the whole file to the default application without downloading it")
+        stream_btn.clicked.connect(lambda: open_stream(stream_url))
+        buttons.addWidget(stream_btn)
+        close_btn = QPushButton("Close")
+        close_btn.clicked.connect(self.close)
+        buttons.addWidget(close_btn)
+        layout.addLayout(buttons)
+
+    @property
+    def length(self) -> int:
+        """Bytes to read for this preview."""
+        return PREVIEW_BYTES.get(self._kind, PREVIEW_BYTES["binary"])
+
+    def show_data(self, file_id: str, data: bytes, file_size: int):
+        shown = f"first {len(data):,} of {file_size:,} bytes" if len(data) < file_size else f"{file_size:,} bytes"
+        if self._kind == "image":
+            image = QImage.fromData(data)
+            if image.isNull():
+                too_big = len(data) < file_size
+                self._status.setText("Image too large to preview" if too_big else "Not a readable image")
+                return
+            self._image.setPixmap(QPixmap.fromImage(image))
+            self._status.setText(f"{image.width()} × {image.height()}, {shown}")
+        elif self._kind == "text":
+            self._view.setPlainText(data.decode("utf-8", errors="replace"))
+            self._status.setText(f"Text, {shown}")
+        else:
+            self._view.setPlainText(_hex_dump(data))
+            self._status.setText(f"Binary, {shown}")
+
+    def show_error(self, file_id: str, error: str):
+        self._status.setText(f"Preview failed: {error}")
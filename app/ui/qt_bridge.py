@@ -0,0 +1,116 @@
+"""Thin Qt adapters over the Qt-free networking core.
+
+Each adapter owns a core object, re-emits its events as Qt signals and
+forwards everything else (start, stop, cancel, ...) to it. Core events fire
+on worker threads; emitting a Qt signal from there queues the call onto the
+receiver's thread, so slots on MainWindow always run on the GUI thread.
+"""
+from __future__ import annotations
+
+from PySide6.QtCore import QObject, Signal
+
+from app.core.hash_pool import HashPool
+from app.core.watcher import FileWatcher
+from app.network.discovery import DiscoveryService
+from app.network.file_transfer import (
+    BatchDownloadTask, ControlServer, FileDownloadTask, FileTransferServer, RangeReadTask,
+)
+from app.network.prober import PeerProber
+
+
+class _QtAdapter(QObject):
+    CORE: type = object
+    EVENTS: tuple[str, ...] = ()
+
+    def __init__(self, *args, parent=None, **kwargs):
+        super().__init__(parent)
+        self.core = self.CORE(*args, **kwargs)
+        for name in self.EVENTS:
+            getattr(self.core, name).connect(getattr(self, name).emit)
+
+    def __getattr__(self, name: str):
+        # only reached for attributes the adapter itself does not define
+        core = self.__dict__.get("core")
+        if core is None:
+            raise AttributeError(name)
+        return getattr(core, name)
+
+
+class QtDiscoveryService(_QtAdapter):
+    peer_discovered = Signal(str, str, int, list, str)  # hostname, ip, control_port, features, manifest
+    peer_lost = Signal(str)  # ip
+
+    CORE = DiscoveryService
+    EVENTS = ("peer_discovered", "peer_lost")
+
+
+class QtPeerProber(_QtAdapter):
+    probed = Signal(str, bool, float, float)  # ip, reachable, rtt_ms, bytes_per_second
+
+    CORE = PeerProber
+    EVENTS = ("probed",)
+
+
+class QtControlServer(_QtAdapter):
+    file_list_received = Signal(str, str, list)  # hostname, ip, files (list of dicts)
+    file_list_page_received = Signal(str, dict)  # ip, raw FILE_LIST_PAGE message dict
+    chat_received = Signal(dict)  # raw chat message dict
+    chat_sync_requested = Signal(str, dict)  # ip, raw CHAT_SYNC message dict
+    chat_history_received = Signal(dict)  # raw CHAT_HISTORY message dict
+    file_delta_received = Signal(str, dict)  # ip, raw FILE_DELTA message dict
+    file_list_sync_requested = Signal(str, dict)  # ip, raw FILE_LIST_SYNC message dict
+
+    CORE = ControlServer
+    EVENTS = (
+        "file_list_received", "file_list_page_received", "chat_received", "chat_sync_requested",
+        "chat_history_received", "file_delta_received", "file_list_sync_requested",
+    )
+
+
+class QtFileTransferServer(_QtAdapter):
+    transfer_started = Signal(str, str)  # file_id, requester_ip
+    # sizes can exceed a C++ int, so they travel as Python objects
+    file_changed = Signal(str, object, object)  # file_id, size, mtime_ns
+
+    CORE = FileTransferServer
+    EVENTS = ("transfer_started", "file_changed")
+
+
+class QtFileDownloadTask(_QtAdapter):
+    progress = Signal(str, int, int)  # file_id, bytes_downloaded, total_bytes
+    completed = Signal(str, str)  # file_id, saved_path
+    failed = Signal(str, str)  # file_id, error_message
+    cancelled_signal = Signal(str)  # file_id
+    stats = Signal(str, dict)  # file_id, AdaptiveSizer.stats()
+
+    CORE = FileDownloadTask
+    EVENTS = ("progress", "completed", "failed", "cancelled_signal", "stats")
+
+
+class QtBatchDownloadTask(QtFileDownloadTask):
+    CORE = BatchDownloadTask
+
+
+class QtRangeReadTask(_QtAdapter):
+    finished = Signal(str, bytes, object)  # file_id, data, file_size
+    failed = Signal(str, str)  # file_id, error_message
+
+    CORE = RangeReadTask
+    EVENTS = ("finished", "failed")
+
+
+class QtFileWatcher(_QtAdapter):
+    changed = Signal(list)  # paths created, modified or deleted
+
+    CORE = FileWatcher
+    EVENTS = ("changed",)
+
+
+class QtHashPool(_QtAdapter):
+    # byte counts can exceed a C++ int, so they travel as Python objects
+    progress = Signal(int, int, object, object)  # files_done, files_total, bytes_done, bytes_total
+    finished = Signal(str, str, bytes)  # file_id, algorithm, digest
+    failed = Signal(str, str)  # file_id, error_message
+
+    CORE = HashPool
+    EVENTS = ("progress", "finished", "failed")
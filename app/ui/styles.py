@@ -27,7 +27,7 @@ QListWidget::item:hover {
 QListWidget::item:selected {
     background-color: #45475a;
 }
-QTextEdit, QPlainTextEdit {
+QTextEdit, QPlainTextEdit, QListView#chatView {
     background-color: #181825;
     border: 1px solid #313244;
     border-radius: 6px;
@@ -181,7 +181,7 @@ QListWidget::item:hover {
 QListWidget::item:selected {
     background-color: #ccd0da;
 }
-QTextEdit, QPlainTextEdit {
+QTextEdit, QPlainTextEdit, QListView#chatView {
     background-color: #ffffff;
     border: 1px solid #ccd0da;
     border-radius: 6px;
@@ -8,10 +8,11 @@ from PySide6.QtWidgets import (
 
 
 class TransferItemWidget(QFrame):
-    cancel_clicked = Signal(str)  # file_id
+    cancel_clicked = Signal(str, str)  # owner_ip, file_id
 
-    def __init__(self, file_id: str, filename: str, parent=None):
+    def __init__(self, owner_ip: str, file_id: str, filename: str, parent=None):
         super().__init__(parent)
+        self.owner_ip = owner_ip
         self.file_id = file_id
         self.setFrameShape(QFrame.NoFrame)
 
@@ -29,7 +30,7 @@ class TransferItemWidget(QFrame):
 
         cancel_btn = QPushButton("Cancel")
         cancel_btn.setStyleSheet("padding: 2px 8px; font-size: 11px; background-color: #f38ba8;")
-        cancel_btn.clicked.connect(lambda: self.cancel_clicked.emit(file_id))
+        cancel_btn.clicked.connect(lambda: self.cancel_clicked.emit(owner_ip, file_id))
         self._cancel_btn = cancel_btn
         top.addWidget(cancel_btn)
 
@@ -40,6 +41,11 @@ class TransferItemWidget(QFrame):
         self._progress.setValue(0)
         layout.addWidget(self._progress)
 
+        self._stats_label = QLabel()
+        self._stats_label.setStyleSheet("font-size: 10px; color: #6c7086;")
+        self._stats_label.setVisible(False)
+        layout.addWidget(self._stats_label)
+
     def update_progress(self, downloaded: int, total: int):
         pct = int(downloaded * 100 / total) if total > 0 else 0
         self._progress.setValue(pct)
@@ -56,6 +62,17 @@ class TransferItemWidget(QFrame):
 
         self._status_label.setText(f"{dl_str} / {tot_str}  ({pct}%)")
 
+    def update_stats(self, stats: dict):
+        parts = [f"{stats['chunk_size'] // 1024} KB chunks"]
+        if stats["buffer_size"]:
+            parts.append(f"{stats['buffer_size'] // 1024} KB socket buffer")
+        if stats["throughput"]:
+            parts.append(f"{stats['throughput'] / 1024 ** 2:.1f} MB/s")
+        if stats["probing"]:
+            parts.append("probing")
+        self._stats_label.setText("  \u00b7  ".join(parts))
+        self._stats_label.setVisible(True)
+
     def mark_completed(self):
         self._progress.setValue(100)
         self._status_label.setText("Completed")
@@ -74,7 +91,7 @@ class TransferItemWidget(QFrame):
 
 
 class TransferPanel(QWidget):
-    cancel_transfer = Signal(str)  # file_id
+    cancel_transfer = Signal(str, str)  # owner_ip, file_id
 
     def __init__(self, parent=None):
         super().__init__(parent)
@@ -97,30 +114,35 @@ class TransferPanel(QWidget):
         self._area.setWidget(self._container)
         layout.addWidget(self._area)
 
-        self._items: dict[str, TransferItemWidget] = {}
+        # file ids are only unique per owner, so transfers are keyed by both
+        self._items: dict[tuple[str, str], TransferItemWidget] = {}  # (owner_ip, file_id) -> item
 
-    def add_transfer(self, file_id: str, filename: str):
-        if file_id in self._items:
+    def add_transfer(self, owner_ip: str, file_id: str, filename: str):
+        if (owner_ip, file_id) in self._items:
             return
         self._label.setVisible(True)
         self._area.setVisible(True)
-        item = TransferItemWidget(file_id, filename)
-        item.cancel_clicked.connect(lambda fid: self.cancel_transfer.emit(fid))
-        self._items[file_id] = item
+        item = TransferItemWidget(owner_ip, file_id, filename)
+        item.cancel_clicked.connect(lambda ip, fid: self.cancel_transfer.emit(ip, fid))
+        self._items[owner_ip, file_id] = item
         self._items_layout.insertWidget(self._items_layout.count() - 1, item)
 
-    def update_progress(self, file_id: str, downloaded: int, total: int):
-        if file_id in self._items:
-            self._items[file_id].update_progress(downloaded, total)
+    def update_progress(self, owner_ip: str, file_id: str, downloaded: int, total: int):
+        if (owner_ip, file_id) in self._items:
+            self._items[owner_ip, file_id].update_progress(downloaded, total)
+
+    def update_stats(self, owner_ip: str, file_id: str, stats: dict):
+        if (owner_ip, file_id) in self._items:
+            self._items[owner_ip, file_id].update_stats(stats)
 
-    def mark_completed(self, file_id: str):
-        if file_id in self._items:
-            self._items[file_id].mark_completed()
+    def mark_completed(self, owner_ip: str, file_id: str):
+        if (owner_ip, file_id) in self._items:
+            self._items[owner_ip, file_id].mark_completed()
 
-    def mark_failed(self, file_id: str, error: str):
-        if file_id in self._items:
-            self._items[file_id].mark_failed(error)
+    def mark_failed(self, owner_ip: str, file_id: str, error: str):
+        if (owner_ip, file_id) in self._items:
+            self._items[owner_ip, file_id].mark_failed(error)
 
-    def mark_cancelled(self, file_id: str):
-        if file_id in self._items:
-            self._items[file_id].mark_cancelled()
+    def mark_cancelled(self, owner_ip: str, file_id: str):
+        if (owner_ip, file_id) in self._items:
+            self._items[owner_ip, file_id].mark_cancelled()
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+from PySide6.QtWidgets import QComboBox, QDialog, QDialogButtonBox, QFormLayout, QLabel, QSpinBox
+
+from app.core.snapshot import SNAPSHOT_CLONE, SNAPSHOT_FROZEN
+from app.core.staging import FSYNC_FINAL, FSYNC_OFF, FSYNC_PERIODIC
+
+_FSYNC_LABELS = {
+    FSYNC_OFF: "Fastest (let the OS flush)",
+    FSYNC_FINAL: "Sync completed files",
+    FSYNC_PERIODIC: "Sync while downloading",
+}
+
+_SNAPSHOT_LABELS = {
+    SNAPSHOT_FROZEN: "Serve the size seen at request",
+    SNAPSHOT_CLONE: "Snapshot (copy-on-write) first",
+}
+
+
+def _size_box(value: int, maximum: int) -> QSpinBox:
+    box = QSpinBox()
+    box.setRange(0, maximum)
+    box.setSuffix(" KB")
+    box.setSpecialValueText("Auto")
+    box.setValue(value)
+    return box
+
+
+class TuningDialog(QDialog):
+    """Override transfer chunk and socket buffer sizes in KB (0 = adaptive),
+    pick the download fsync policy and how files still being written are served."""
+
+    def __init__(self, chunk_kb: int, buffer_kb: int, fsync: str, snapshot: str, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Transfer Tuning")
+
+        layout = QFormLayout(self)
+        self._chunk = _size_box(chunk_kb, 16 * 1024)
+        self._buffer = _size_box(buffer_kb, 64 * 1024)
+        layout.addRow("Chunk size:", self._chunk)
+        layout.addRow("Socket buffer:", self._buffer)
+
+        hint = QLabel("Auto probes the link during the first seconds of each transfer.")
+        hint.setStyleSheet("font-size: 11px; color: #a6adc8;")
+        layout.addRow(hint)
+
+        self._fsync = QComboBox()
+        for policy, label in _FSYNC_LABELS.items():
+            self._fsync.addItem(label, policy)
+        self._fsync.setCurrentIndex(max(0, self._fsync.findData(fsync)))
+        layout.addRow("Durability:", self._fsync)
+
+        self._snapshot = QComboBox()
+        for mode, label in _SNAPSHOT_LABELS.items():
+            self._snapshot.addItem(label, mode)
+        self._snapshot.setCurrentIndex(max(0, self._snapshot.findData(snapshot)))
+        layout.addRow("Changing files:", self._snapshot)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+        buttons.accepted.connect(self.accept)
+        buttons.rejected.connect(self.reject)
+        layout.addRow(buttons)
+
+    @property
+    def sizes(self) -> tuple[int, int]:
+        return self._chunk.value(), self._buffer.value()
+
+    @property
+    def fsync(self) -> str:
+        return self._fsync.currentData()
+
+    @property
+    def snapshot(self) -> str:
+        return self._snapshot.currentData()
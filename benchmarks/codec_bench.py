@@ -0,0 +1,76 @@
+"""
+Encode/decode benchmark: JSON vs the binary control-message codec.
+
+Builds a realistic FILE_LIST (nested folder-like names, common extensions,
+log-distributed sizes, one owner) and times both encodings.
+
+Usage:
+    python -m benchmarks.codec_bench              # 10k files
+    python -m benchmarks.codec_bench --files 50000 --repeat 20
+"""
+
+import argparse
+import json
+import random
+import time
+
+from app.network import codec
+from app.network.protocol import decode_message, encode_message, make_file_list
+
+EXTENSIONS = [".mp4", ".mkv", ".jpg", ".png", ".pdf", ".zip", ".log", ".txt", ".tar.gz", ".iso", ".docx"]
+WORDS = ["build", "release", "photo", "backup", "report", "scan", "video", "draft", "final", "data", "export"]
+
+
+def make_files(n: int, seed: int = 1) -> list[dict]:
+    rng = random.Random(seed)
+    files = []
+    for i in range(n):
+        name = "_".join(rng.choice(WORDS) for _ in range(rng.randint(1, 3)))
+        files.append({
+            "file_id": f"{rng.getrandbits(48):012x}",
+            "filename": f"{name}_{i:05d}{rng.choice(EXTENSIONS)}",
+            "size": int(10 ** rng.uniform(2, 10)),
+            "owner_ip": "192.168.0.23",
+            "owner_hostname": "build-box-01",
+        })
+    return files
+
+
+def _best(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    msg = make_file_list("build-box-01", make_files(args.files))
+    results = {}
+    for name, binary in (("json", False), ("binary", True)):
+        framed = encode_message(msg, binary)
+        payload = framed[4:]
+        assert decode_message(payload) == msg
+        results[name] = {
+            "bytes": len(payload),
+            "encode_ms": _best(lambda: encode_message(msg, binary), args.repeat) * 1000,
+            "decode_ms": _best(lambda: decode_message(payload), args.repeat) * 1000,
+        }
+
+    print(f"FILE_LIST with {args.files} files, codec v{codec.VERSION}, best of {args.repeat}")
+    print(f"{'':8} {'bytes':>12} {'encode ms':>10} {'decode ms':>10}")
+    for name, r in results.items():
+        print(f"{name:8} {r['bytes']:>12,} {r['encode_ms']:>10.2f} {r['decode_ms']:>10.2f}")
+    ratio = results["binary"]["bytes"] / results["json"]["bytes"]
+    print(f"binary size: {ratio:.0%} of JSON")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+"""
+Hashing and serving benchmark: buffered read() loops vs memory-mapped views.
+
+Compares, per file size and page-cache state:
+  hash  read   SHA-256 over 1 MiB f.read() calls (the previous implementation)
+  hash  mmap   app.core.hashing.hash_file (memoryview slices, MADV_SEQUENTIAL)
+  send  read   64 KB f.read() + sendall over loopback TCP (the previous serve loop)
+  send  mmap   64 KB memoryview slices of the mapping + sendall
+
+Sizes are in GB and multiplied by --scale, so the default 1/10/100 GB run
+needs that much free disk; use --scale 0.01 for a quick check.
+
+Usage:
+    python -m benchmarks.hash_bench --scale 0.01
+    python -m benchmarks.hash_bench --sizes 1 10 --cache cold --output hash.json
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from app.core.hashing import hash_file, mapped_view
+
+GB = 1024 ** 3
+READ_SIZE = 1024 * 1024
+SEND_CHUNK = 64 * 1024
+CACHE_MODES = ["cold", "warm"]
+_BLOCK = os.urandom(4 * 1024 * 1024)
+
+
+def _make_file(path: str, size: int):
+    if os.path.exists(path) and os.path.getsize(path) == size:
+        return
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            n = min(len(_BLOCK), remaining)
+            f.write(_BLOCK[:n])
+            remaining -= n
+
+
+def _set_cache(path: str, mode: str):
+    with open(path, "rb") as f:
+        if mode == "cold":
+            if hasattr(os, "posix_fadvise"):
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+        else:
+            while f.read(len(_BLOCK)):
+                pass
+
+
+# ── Methods ───────────────────────────────────────────────────
+
+def hash_read(path: str) -> bytes:
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(READ_SIZE):
+            sha.update(chunk)
+    return sha.digest()
+
+
+def hash_mmap(path: str) -> bytes:
+    return hash_file(path, mapped=True)
+
+
+def send_read(path: str, sock: socket.socket):
+    with open(path, "rb") as f:
+        while chunk := f.read(SEND_CHUNK):
+            sock.sendall(chunk)
+
+
+def send_mmap(path: str, sock: socket.socket):
+    size = os.path.getsize(path)
+    with open(path, "rb") as f, mapped_view(f, size) as view:
+        if view is None:
+            send_read(path, sock)
+            return
+        for pos in range(0, size, SEND_CHUNK):
+            sock.sendall(view[pos:pos + SEND_CHUNK])
+
+
+def _drain(sock: socket.socket):
+    buf = bytearray(1024 * 1024)
+    while sock.recv_into(buf):
+        pass
+
+
+def _run_send(method, path: str) -> None:
+    server = socket.create_server(("127.0.0.1", 0))
+    client = socket.create_connection(server.getsockname())
+    conn, _ = server.accept()
+    reader = threading.Thread(target=_drain, args=(client,))
+    reader.start()
+    try:
+        method(path, conn)
+    finally:
+        conn.close()
+        reader.join()
+        client.close()
+        server.close()
+
+
+def _measure(fn) -> dict:
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    fn()
+    wall = time.perf_counter() - t0
+    return {"seconds": wall, "cpu_seconds": time.process_time() - cpu0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=float, nargs="+", default=[1, 10, 100], help="file sizes in GB")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply file sizes")
+    parser.add_argument("--cache", action="append", choices=CACHE_MODES, help="repeatable; default both")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "subparty-bench"))
+    parser.add_argument("--output", help="write results JSON here (default: stdout only)")
+    args = parser.parse_args()
+    os.makedirs(args.workdir, exist_ok=True)
+
+    cases = [
+        ("hash", "read", lambda p: hash_read(p)),
+        ("hash", "mmap", lambda p: hash_mmap(p)),
+        ("send", "read", lambda p: _run_send(send_read, p)),
+        ("send", "mmap", lambda p: _run_send(send_mmap, p)),
+    ]
+    results = []
+    for size_gb in args.sizes:
+        size = max(1, int(size_gb * args.scale * GB))
+        path = os.path.join(args.workdir, f"hash-{size}.bin")
+        _make_file(path, size)
+        for cache in args.cache or CACHE_MODES:
+            for op, method, fn in cases:
+                _set_cache(path, cache)
+                result = _measure(lambda: fn(path))
+                result.update({
+                    "op": op, "method": method, "cache": cache, "bytes": size,
+                    "mb_per_s": size / result["seconds"] / 1024 ** 2 if result["seconds"] else 0.0,
+                })
+                results.append(result)
+                print(
+                    f"{size / GB:>8.2f} GB {cache:<5} {op} {method:<5} {result['mb_per_s']:>9.1f} MB/s  "
+                    f"cpu {result['cpu_seconds']:>7.2f} s",
+                    file=sys.stderr,
+                )
+
+    report = {"python": sys.version.split()[0], "platform": sys.platform, "results": results}
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Loopback transfer benchmark for FileTransferServer / FileDownloadTask.
+
+Drives the Qt-free networking core directly, so PySide6 is not needed.
+
+Every scenario runs in its own subprocess so peak RSS is per scenario, and
+each one is run with a cold and a warm page cache. Results are printed as a
+table and written as JSON for regression tracking.
+
+Scenarios (sizes at --scale 1.0):
+  large       1 x 10 GB
+  small       10,000 x 10 KB
+  concurrent  --clients downloads of one 1 GB file at the same time
+  resume      1 x 1 GB, resumed from a half-written .part file
+
+Usage:
+    python -m benchmarks.transfer_bench --scale 0.01            # quick run
+    python -m benchmarks.transfer_bench --scenario large --output bench.json
+    python -m benchmarks.transfer_bench --netns bench --host 10.200.0.2
+
+With --netns the server side runs under `ip netns exec NAME` and the client
+connects to --host; create the namespace and veth pair beforehand, e.g.
+    ip netns add bench
+    ip link add veth0 type veth peer name veth1 && ip link set veth1 netns bench
+    ip addr add 10.200.0.1/24 dev veth0 && ip link set veth0 up
+    ip -n bench addr add 10.200.0.2/24 dev veth1 && ip -n bench link set veth1 up
+"""
+
+import argparse
+import json
+import os
+import queue
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from app.core.models import SharedFile
+from app.core.staging import StagedDownload
+from app.network.file_transfer import FileDownloadTask, FileTransferServer
+
+GB = 1024 ** 3
+KB = 1024
+SCENARIOS = ["large", "small", "concurrent", "resume"]
+CACHE_MODES = ["cold", "warm"]
+_BLOCK = os.urandom(4 * 1024 * 1024)
+
+
+# ── Fixtures ──────────────────────────────────────────────────
+
+def _make_file(path: str, size: int):
+    if os.path.exists(path) and os.path.getsize(path) == size:
+        return
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            n = min(len(_BLOCK), remaining)
+            f.write(_BLOCK[:n])
+            remaining -= n
+
+
+def _fixture(workdir: str, scenario: str, scale: float, clients: int) -> tuple[list[str], list[dict]]:
+    """Create source files and return (paths, jobs) for a scenario.
+
+    Each job is {"index": i, "offset": n}; `index` points into the path list.
+    """
+    src = os.path.join(workdir, "src", scenario)
+    os.makedirs(src, exist_ok=True)
+    if scenario == "large":
+        sizes = [max(1, int(10 * GB * scale))]
+        jobs = [{"index": 0, "offset": 0}]
+    elif scenario == "small":
+        count = max(1, int(10_000 * scale))
+        sizes = [10 * KB] * count
+        jobs = [{"index": i, "offset": 0} for i in range(count)]
+    elif scenario == "concurrent":
+        sizes = [max(1, int(GB * scale))]
+        jobs = [{"index": 0, "offset": 0} for _ in range(clients)]
+    elif scenario == "resume":
+        size = max(2, int(GB * scale))
+        sizes = [size]
+        jobs = [{"index": 0, "offset": size // 2}]
+    else:
+        raise ValueError(f"unknown scenario {scenario}")
+    paths = []
+    for i, size in enumerate(sizes):
+        path = os.path.join(src, f"f{i:05d}.bin")
+        _make_file(path, size)
+        paths.append(path)
+    return paths, jobs
+
+
+def _shared_files(paths: list[str]) -> list[SharedFile]:
+    return [
+        SharedFile(
+            file_id=f"{i:012d}", filename=os.path.basename(p), size=os.path.getsize(p),
+            owner_ip="127.0.0.1", owner_hostname="bench", file_path=p,
+        )
+        for i, p in enumerate(paths)
+    ]
+
+
+def _set_cache(paths: list[str], mode: str):
+    """Evict (cold) or preload (warm) the page cache for the given files."""
+    for path in paths:
+        with open(path, "rb") as f:
+            if mode == "cold":
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+            else:
+                while f.read(len(_BLOCK)):
+                    pass
+
+
+# ── Running ───────────────────────────────────────────────────
+
+def _run_downloads(shared: list[SharedFile], jobs: list[dict], dst: str, host: str, port: int,
+                   serve_locally: bool, concurrency: int) -> dict:
+    server = None
+    if serve_locally:
+        server = FileTransferServer(lambda: shared, port=port)
+        server.start()
+        time.sleep(0.2)  # let the listener bind
+
+    pending = list(enumerate(jobs))
+    active: dict[int, FileDownloadTask] = {}
+    first_byte: dict[int, float] = {}
+    started: dict[int, float] = {}
+    errors: list[str] = []
+    done: queue.Queue = queue.Queue()  # (job number, error or None), fed from worker threads
+    total_bytes = 0
+
+    def launch(n: int, job: dict):
+        sf = shared[job["index"]]
+        job_dst = os.path.join(dst, str(n))
+        os.makedirs(job_dst, exist_ok=True)
+        if job["offset"]:
+            part_path = StagedDownload(job_dst, sf.filename, sf.file_id, sf.size).part_path
+            with open(sf.file_path, "rb") as src, open(part_path, "wb") as part:
+                part.write(src.read(job["offset"]))
+        task = FileDownloadTask(sf.file_id, sf.filename, host, job_dst, offset=job["offset"], port=port)
+        task.progress.connect(lambda fid, got, total: first_byte.setdefault(n, time.perf_counter()))
+        task.completed.connect(lambda fid, path: done.put((n, None)))
+        task.failed.connect(lambda fid, err: done.put((n, err)))
+        active[n] = task
+        started[n] = time.perf_counter()
+        task.start()
+
+    cpu0 = time.process_time()
+    t0 = time.perf_counter()
+    while pending or active:
+        while pending and len(active) < concurrency:
+            launch(*pending.pop(0))
+        n, error = done.get()
+        active.pop(n).wait()
+        if error:
+            errors.append(error)
+        else:
+            job = jobs[n]
+            total_bytes += shared[job["index"]].size - job["offset"]
+    wall = time.perf_counter() - t0
+    cpu = time.process_time() - cpu0
+    if server:
+        server.stop()
+
+    ttfb = [first_byte[n] - started[n] for n in first_byte]
+    return {
+        "bytes": total_bytes,
+        "seconds": wall,
+        "mb_per_s": total_bytes / wall / 1024 ** 2 if wall else 0.0,
+        "ttfb_ms": {
+            "min": min(ttfb) * 1000 if ttfb else None,
+            "mean": sum(ttfb) / len(ttfb) * 1000 if ttfb else None,
+            "max": max(ttfb) * 1000 if ttfb else None,
+        },
+        "cpu_percent": cpu / wall * 100 if wall else 0.0,
+        "errors": errors,
+    }
+
+
+def _peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_one(args) -> dict:
+    paths, jobs = _fixture(args.workdir, args.scenario, args.scale, args.clients)
+    shared = _shared_files(paths)
+    dst = tempfile.mkdtemp(prefix="dst-", dir=args.workdir)
+    server_proc = None
+    try:
+        _set_cache(paths, args.cache)
+        if args.netns:
+            server_proc = subprocess.Popen(
+                ["ip", "netns", "exec", args.netns, sys.executable, "-m", "benchmarks.transfer_bench",
+                 "serve", "--port", str(args.port), *paths],
+                stdin=subprocess.PIPE,
+            )
+            time.sleep(1.0)
+        concurrency = args.clients if args.scenario in ("concurrent", "small") else 1
+        result = _run_downloads(shared, jobs, dst, args.host, args.port, not args.netns, concurrency)
+    finally:
+        if server_proc:
+            server_proc.stdin.close()
+            server_proc.wait(10)
+        shutil.rmtree(dst, ignore_errors=True)
+    result.update({
+        "scenario": args.scenario,
+        "cache": args.cache,
+        "files": len(jobs),
+        "peak_rss_bytes": _peak_rss_bytes(),
+        "transport": f"netns:{args.netns}" if args.netns else "loopback",
+    })
+    return result
+
+
+def serve(args):
+    """Serve the given files until stdin is closed (used inside a netns)."""
+    shared = _shared_files(args.paths)
+    server = FileTransferServer(lambda: shared, port=args.port)
+    server.start()
+    sys.stdin.read()
+    server.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command")
+    serve_parser = sub.add_parser("serve")
+    serve_parser.add_argument("--port", type=int, required=True)
+    serve_parser.add_argument("paths", nargs="+")
+
+    parser.add_argument("--scenario", action="append", choices=SCENARIOS, help="repeatable; default all")
+    parser.add_argument("--cache", action="append", choices=CACHE_MODES, help="repeatable; default both")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiply file sizes/counts")
+    parser.add_argument("--clients", type=int, default=4, help="parallel downloads for concurrent/small")
+    parser.add_argument("--workdir", default=os.path.join(tempfile.gettempdir(), "subparty-bench"))
+    parser.add_argument("--port", type=int, default=47712)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--netns", help="run the server inside this network namespace")
+    parser.add_argument("--output", help="write results JSON here (default: stdout only)")
+    parser.add_argument("--one", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args)
+        return
+    os.makedirs(args.workdir, exist_ok=True)
+
+    if args.one:
+        args.scenario, args.cache = args.scenario[0], args.cache[0]
+        print(json.dumps(run_one(args)))
+        return
+
+    results = []
+    for scenario in args.scenario or SCENARIOS:
+        for cache in args.cache or CACHE_MODES:
+            cmd = [
+                sys.executable, "-m", "benchmarks.transfer_bench", "--one",
+                "--scenario", scenario, "--cache", cache, "--scale", str(args.scale),
+                "--clients", str(args.clients), "--workdir", args.workdir,
+                "--port", str(args.port), "--host", args.host,
+            ]
+            if args.netns:
+                cmd += ["--netns", args.netns]
+            out = subprocess.run(cmd, capture_output=True, text=True)
+            if out.returncode != 0:
+                sys.stderr.write(out.stderr)
+                raise SystemExit(f"{scenario}/{cache} failed with exit code {out.returncode}")
+            # the result is the last JSON line on stdout
+            line = [ln for ln in out.stdout.splitlines() if ln.startswith("{")][-1]
+            result = json.loads(line)
+            results.append(result)
+            ttfb = result["ttfb_ms"]["mean"]
+            print(
+                f"{scenario:<11} {cache:<5} {result['mb_per_s']:>9.1f} MB/s  "
+                f"ttfb {ttfb if ttfb is not None else float('nan'):>7.1f} ms  "
+                f"cpu {result['cpu_percent']:>5.0f}%  rss {result['peak_rss_bytes'] / 1024 ** 2:>6.0f} MB"
+                + (f"  errors: {len(result['errors'])}" if result["errors"] else ""),
+                file=sys.stderr,
+            )
+
+    report = {
+        "python": sys.version.split()[0],
+        "platform": sys.platform,
+        "scale": args.scale,
+        "clients": args.clients,
+        "results": results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text)
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,56 @@
+import logging
 import sys
 import threading
 
-from PySide6.QtWidgets import QApplication
+# subcommands handled by the Qt-free entry point in app/headless.py
+HEADLESS_COMMANDS = ("serve", "list", "get", "cat")
 
-from app.ui.main_window import MainWindow
+log = logging.getLogger("main")
 
 
-def _log(msg: str):
-    print(f"[Main] {msg}", flush=True)
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] in HEADLESS_COMMANDS:
+        from app.headless import main as headless_main
+        sys.exit(headless_main(sys.argv[1:]))
 
+    # keep this import first so milestones are timed from launch
+    from app.core import startup
+    startup.init(sys.argv)
 
-def main():
-    _log("Starting Sub Party")
+    from app.core import log as app_log
+    app_log.setup()
+
+    from PySide6.QtWidgets import QApplication
+    startup.mark("Qt imported")
+
+    log.info("Starting Sub Party")
     app = QApplication(sys.argv)
     app.setApplicationName("Sub Party")
     app.setOrganizationName("SubParty")
+    startup.mark("QApplication created")
+
+    # the network stack, dialogs and styles are imported lazily by MainWindow;
+    # servers start once the first frame has been painted
+    from app.ui.main_window import MainWindow
+    startup.mark("MainWindow imported")
 
     window = MainWindow()
+    startup.mark("MainWindow constructed")
     window.show()
+    startup.mark("window shown")
 
     # shutdown() runs inside the event loop, so threads can clean up properly
     app.aboutToQuit.connect(window.shutdown)
 
-    _log("Entering event loop")
+    log.debug("Entering event loop")
     exit_code = app.exec()
 
-    _log(f"Event loop exited with code {exit_code}")
-    _log(f"Remaining threads: {threading.active_count()}")
+    log.info("Event loop exited with code %d", exit_code)
+    log.debug("Remaining threads: %d", threading.active_count())
     for t in threading.enumerate():
-        _log(f"  Thread: {t.name} (daemon={t.daemon}, alive={t.is_alive()})")
+        log.debug("  Thread: %s (daemon=%s, alive=%s)", t.name, t.daemon, t.is_alive())
 
-    _log("Calling sys.exit()")
+    app_log.shutdown()
     sys.exit(exit_code)
 
 